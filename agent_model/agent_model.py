@@ -1,6 +1,7 @@
 r"""Describes Agent Model interface and behaviour,
 """
 
+import copy
 import random
 import datetime
 from abc import ABCMeta, abstractmethod
@@ -12,7 +13,11 @@ from mesa.time import RandomActivation
 # from simoc_server import app  # TODO: Fix logger
 from agent_model.initializer import AgentModelInitializer
 from agent_model.agents.core import GeneralAgent, PlantAgent, ConcreteAgent
+from agent_model.agents.cohort import GeneralCohort, PlantCohort, ConcreteCohort
 from agent_model.agents.data_collector import AgentDataCollector
+from agent_model.storage_table import StorageTable
+from agent_model.termination import TerminationChecker
+from agent_model.profiler import StepProfiler
 from agent_model.attribute_meta import AttributeHolder
 from agent_model.util import timedelta_to_hours, location_to_day_length_minutes
 from agent_model.exceptions import AgentModelConfigError, AgentModelInitializationError
@@ -29,28 +34,34 @@ class AgentModel(Model, AttributeHolder):
     ====================== ============== ===============
     ``seed``               int            Initialize ``random_state``
     ``global_entropy``     float          0-1: Activate and scale variation & event
-    ``single_agent``       int            1
+    ``single_agent``       int            1: One agent per type; 0: One cohort of individuals per type
     ``termination``        list           ``[<termination_case>]``
     ``priorities``         list           ``[<agent class>]``
     ``location``           str            'mars'
     ``minutes_per_step``   int            60
     ``hours_per_step``     float          1
     ``currency_dict``      dict           ``{<currency>, <currency class>}``
+    ``snapshot_ratios``    bool           False: Update storage ratios when each storage steps
     ``data_collection``    bool           False
+    ``strict_units``       bool           False: Use unit-aware Quantities for exchanges (debug)
     ``random_state``       np.RandomState
     ``time``               timdelta
     ``starting_step_num``  int
+    ``live_ratios``        bool           Storage ratios are read live from ``storage_table``
     ``storage_ratios``     dict           ``{<agent>: {<currency>: 0.5}}``
+    ``storage_table``      StorageTable   Balances and capacities of all storage agents
+    ``step_cache``         dict           Values shared by agents within a step; cleared each step
     ``is_terminated``      bool
     ``termination_reason`` str
     ``scheduler``          mesa.Scheduler
+    ``profiler``           StepProfiler   Wall time per step and phase, or None
     ====================== ============== ===============
     """
 
     @classmethod
     def from_config(cls, config, data_collection=True, currency_desc=None,
                     agent_desc=None, agent_conn=None, agent_variation=None,
-                    agent_events=None):
+                    agent_events=None, strict_units=False, profile=False):
         """Takes configuration files, return an initialized model
 
         Args:
@@ -63,6 +74,8 @@ class AgentModel(Model, AttributeHolder):
             * ``agent_conn``: :ref:`agent-conn`
             * ``agent_variation``: :ref:`agent-variation`
             * ``agent_events``: :ref:`agent-events`
+            * ``strict_units``: bool
+            * ``profile``: bool
 
         Returns:
             * ``AgentModel``: :ref:`agent-model`
@@ -74,7 +87,7 @@ class AgentModel(Model, AttributeHolder):
         categories = ['model', 'agents', 'currencies']
         if any(len(errors[c]) > 0 for c in categories):
             raise AgentModelConfigError(errors)
-        return cls(initializer, data_collection)
+        return cls(initializer, data_collection, strict_units, profile)
 
     def save(self):
         """Exports current model as an AgentModelInitializer"""
@@ -82,13 +95,108 @@ class AgentModel(Model, AttributeHolder):
         return initializer.serialize()
 
     @classmethod
-    def load(cls, saved, data_collection=False):
+    def load(cls, saved, data_collection=False, strict_units=False, profile=False):
         """Takes a save file and returns an initialized AgentModel"""
         initializer = AgentModelInitializer.deserialize(saved)
-        return cls(initializer, data_collection)
+        return cls(initializer, data_collection, strict_units, profile)
 
-    def __init__(self, initializer, data_collection=False):
-        """Creates an Agent Model object."""
+    def save_checkpoint(self, path=None):
+        """Exports current model as a binary checkpoint
+
+        Contains the same data as ``save``, but step values are stored as
+        raw arrays rather than lists, so checkpoints are smaller and much
+        faster to write and load. See ``agent_model.checkpoint``.
+
+        Args:
+            * ``path``: str, also write the checkpoint to this file
+
+        Returns:
+            * bytes
+        """
+        checkpoint = AgentModelInitializer.from_model(self).to_checkpoint()
+        if path is not None:
+            with open(path, 'wb') as f:
+                f.write(checkpoint)
+        return checkpoint
+
+    @classmethod
+    def load_checkpoint(cls, source, data_collection=False, strict_units=False,
+                        profile=False, mmap_file=False):
+        """Takes a checkpoint and returns an initialized AgentModel
+
+        Args:
+            * ``source``: bytes, or path of a file written by ``save_checkpoint``
+
+        Kwargs:
+            * ``mmap_file``: bool, map the file into memory rather than
+              reading it. Step values are then read from the file as needed.
+        """
+        initializer = AgentModelInitializer.from_checkpoint(source, mmap_file)
+        return cls(initializer, data_collection, strict_units, profile)
+
+    # Agent attributes which are only set while the model is initialized, and
+    # so can be shared by a model and its forks
+    SHARED_AGENT_ATTRS = ['attrs', 'attr_details', 'currency_dict', 'attribute_descriptors',
+                          'connections', 'step_values', 'step_variation', 'co2_scale',
+                          'daily_growth']
+
+    def fork(self, data_collection=None):
+        """Return an independent copy of the model at the current step
+
+        Faster than ``load(save())``, and forks use less memory: data which
+        is fixed after initialization (``currency_dict`` and each agent's
+        ``SHARED_AGENT_ATTRS``, e.g. ``attrs`` and ``step_values``) is shared
+        with the model rather than copied. Replace rather than modify these
+        in a fork. Everything else (balances, deprive, buffers, events,
+        random states etc.) is copied.
+
+        Kwargs:
+            * ``data_collection``: bool. If False, the fork doesn't collect
+              data. By default, it does if the model does, starting with a
+              copy of the data collected so far.
+
+        Returns:
+            * ``AgentModel``: :ref:`agent-model`
+        """
+        if self.profiler is not None:
+            raise AgentModelInitializationError(
+                "Can't fork a model which is being profiled; profile the fork instead.")
+        memo = {}
+        def _share(obj):
+            memo[id(obj)] = obj
+        for obj in [self.currency_dict, self.attribute_descriptors, self.termination,
+                    self.priorities]:
+            _share(obj)
+        for agent in self.scheduler.agents:
+            for attr in self.SHARED_AGENT_ATTRS:
+                value = agent.__dict__.get(attr)
+                if value is not None:
+                    _share(value)
+            for values in agent.step_values.values():
+                _share(values)
+            if data_collection is False and 'data_collector' in agent:
+                memo[id(agent.data_collector)] = None
+        model = copy.deepcopy(self, memo)
+        if data_collection is not None and data_collection != self.data_collection:
+            model.data_collection = data_collection
+            if data_collection:
+                for agent in model.scheduler.agents:
+                    agent.data_collector = AgentDataCollector.from_agent(agent)
+        return model
+
+    def __init__(self, initializer, data_collection=False, strict_units=False,
+                 profile=False):
+        """Creates an Agent Model object.
+
+        Args:
+            * ``initializer``: AgentModelInitializer
+            * ``data_collection``: bool
+            * ``strict_units``: bool. If True, currency exchanges and storage
+              ratios are calculated with ``quantities`` objects, to validate
+              units at runtime. Slower; intended for debugging.
+            * ``profile``: bool. If True, record the wall time of each step
+              by phase; see ``get_profile``.
+        """
         super(Model, self).__init__()
         #------------------------------
         #    INITIALIZE MODEL DATA
@@ -107,8 +215,11 @@ class AgentModel(Model, AttributeHolder):
         self.location = md.get('location')
         self.minutes_per_step = md['minutes_per_step']
         self.currency_dict = md['currency_dict']
+        self.snapshot_ratios = md.get('snapshot_ratios', False)
         # Status (generated when model is initialized, saved)
         self.data_collection = data_collection
+        self.strict_units = strict_units
+        self.live_ratios = not (self.snapshot_ratios or strict_units)
         if initializer.init_type == 'from_new':
             self.random_state = np.random.RandomState(self.seed)
             self.time = datetime.timedelta()
@@ -122,7 +233,8 @@ class AgentModel(Model, AttributeHolder):
             self.random_state.set_state(md['random_state'])
             self.time = datetime.timedelta(seconds=md['time'])
             self.starting_step_num = md['steps']
-            self.storage_ratios = md['storage_ratios']
+            # Older saves also cached the co2 response of plants here
+            self.storage_ratios = {k: v for k, v in md['storage_ratios'].items() if k != 'co2'}
             self.step_records_buffer = md['step_records_buffer']
             self.is_terminated = md['is_terminated']
             self.termination_reason = md['termination_reason']
@@ -132,13 +244,16 @@ class AgentModel(Model, AttributeHolder):
         if self.priorities:
             self.scheduler = PrioritizedRandomActivation(self)
         else:
-            self.scheduler = RandomActivation(self)
+            self.scheduler = IndexedRandomActivation(self)
         self.scheduler.steps = self.starting_step_num
         self.day_length_minutes = location_to_day_length_minutes(self.location)
         self.day_length_hours = self.day_length_minutes / 60
         self.daytime = int(self.time.total_seconds() / 60) % self.day_length_minutes
         self.timedelta_per_step = datetime.timedelta(minutes=self.minutes_per_step)
         self.hours_per_step = timedelta_to_hours(self.timedelta_per_step)
+        self.termination_checker = TerminationChecker(self, self.termination)
+        self.step_cache = {}
+        self.storage_table = StorageTable()
 
         #------------------------------
         #     INITIALIZE AGENT DATA
@@ -149,25 +264,30 @@ class AgentModel(Model, AttributeHolder):
             instance['init_type'] = initializer.init_type
             connections = instance.pop('connections', {})
             amount = instance.pop('amount', 1)
+            # Individuals are simulated as a cohort with per-member state
+            cohort = self.single_agent != 1
             if agent_class == 'plants':
-                build_from_class = PlantAgent
+                build_from_class = PlantCohort if cohort else PlantAgent
             elif agent_type == 'concrete':
-                build_from_class = ConcreteAgent
+                build_from_class = ConcreteCohort if cohort else ConcreteAgent
             else:
-                build_from_class = GeneralAgent
+                build_from_class = GeneralCohort if cohort else GeneralAgent
             params = dict(model=self, agent_type=agent_type, agent_desc=agent_desc,
                           connections=connections, **instance)
-            if self.single_agent == 1:
-                agent = build_from_class(amount=amount, **params)
-                self.scheduler.add(agent)
-            else:
-                for i in range(amount):
-                    agent = build_from_class(amount=1, **params)
-                    self.scheduler.add(agent)
+            agent = build_from_class(amount=amount, **params)
+            self.scheduler.add(agent)
+        if self.live_ratios:
+            self.storage_table.link_ratios(self.storage_ratios)
+        self.update_storage_ratios()
         for agent in self.scheduler.agents:
             agent._init_currency_exchange()
             if self.data_collection:
                 agent.data_collector = AgentDataCollector.from_agent(agent)
+        # Agents only know whether they have flows once connected
+        self.scheduler.clear_roles()
+        self.profiler = None
+        if profile:
+            self.enable_profiler()
 
     # TODO: Fix logger
     # @property
@@ -232,6 +352,8 @@ class AgentModel(Model, AttributeHolder):
         """Formats the agent storages and currencies for easier access
         to the step information later."""
         storages = []
+        balances = self.storage_table.balances
+        capacities = self.storage_table.capacities
         for storage in self.get_agents_by_role(role="storage"):
             entity = {"agent_type": storage.agent_type,
                       "agent_type_id": storage.agent_type_id,
@@ -239,15 +361,15 @@ class AgentModel(Model, AttributeHolder):
                       "storage_id": storage.id,
                       "amount": storage.amount,
                       "currencies": []}
-            for attr in storage.attrs:
-                if attr.startswith('char_capacity'):
-                    currency_name = attr.split('_', 2)[2]
-                    currency_data = self.currency_dict[currency_name]
-                    entity["currencies"].append({"currency_type": currency_data['name'],
-                                                 "currency_type_id": currency_data['id'],
-                                                 "value": round(storage[currency_name], value_round),
-                                                 "unit": storage.attr_details[attr]['unit'],
-                                                 "capacity": storage.attrs[attr]})
+            row = storage.storage_row
+            for currency_name, slot in storage.storage_slots.items():
+                currency_data = self.currency_dict[currency_name]
+                attr = 'char_capacity_' + currency_name
+                entity["currencies"].append({"currency_type": currency_data['name'],
+                                             "currency_type_id": currency_data['id'],
+                                             "value": round(balances.item(row, slot), value_round),
+                                             "unit": storage.attr_details[attr]['unit'],
+                                             "capacity": capacities.item(row, slot)})
             storages.append(entity)
         return storages
 
@@ -266,38 +388,72 @@ class AgentModel(Model, AttributeHolder):
     def add_agent(self, agent):
         """TODO"""
         self.scheduler.add(agent)
+        if self.profiler is not None:
+            self.profiler.attach_agent(agent)
+
+    def enable_profiler(self):
+        """Start recording the wall time of each step by phase
+
+        Returns:
+            * ``StepProfiler``
+        """
+        if self.profiler is None:
+            self.profiler = StepProfiler()
+            self.profiler.attach(self)
+        return self.profiler
+
+    def get_profile(self):
+        """Return per-phase timing statistics, or None if not profiling
+
+        Returns:
+            * ``dict``: see ``StepProfiler.summary``
+        """
+        if self.profiler is None:
+            return None
+        return self.profiler.summary()
+
+    def update_storage_ratios(self):
+        """Recalculate the storage ratios of all storage agents
+
+        Live storage ratios are calculated when they are read, so only the
+        running totals they depend on are recalculated.
+        """
+        if self.live_ratios:
+            self.storage_table.update_totals()
+        elif self.strict_units:
+            for agent in self.get_agents_by_role(role='storage'):
+                agent._calculate_storage_ratios()
+        else:
+            self.storage_table.update_ratios(self.storage_ratios)
 
     def step(self):
         """Execute a single step."""
+        self.step_cache.clear()
         self.time += self.timedelta_per_step
         self.daytime = int(self.time.total_seconds() / 60) % self.day_length_minutes
-        # Check termination conditions; stop if true
-        for cond in self.termination:
-            if cond['condition'] == "time":
-                value = cond['value']
-                unit = cond['unit']
-                model_time = self.time.total_seconds()
-                if unit == 'min':
-                    model_time /= 60
-                elif unit == 'hour':
-                    model_time /= 3600
-                elif unit == 'day':
-                    model_time /= 3600 * self.day_length_hours
-                elif unit == 'year':
-                    model_time /= 3600 * self.day_length_hours * 365
-                else:
-                    model_time /= 3600 * self.day_length_hours
-                if model_time > value:
-                    self.is_terminated = True
-                    self.termination_reason = 'time'
-                    return
+        if self._check_termination():
+            return
         # Step agents
+        if self.live_ratios:
+            self.update_storage_ratios()
         self.scheduler.step()
         if self.data_collection:
-            for agent in self.scheduler.agents:
-                agent.data_collector.step()
+            self._collect_data()
         # app.logger.info("{0} step_num {1}".format(self, self.step_num))  # TODO: Fix logger
 
+    def _check_termination(self):
+        """Return True, and set termination_reason, if a condition is met"""
+        reason = self.termination_checker.check(self, self.scheduler.steps + 1)
+        if reason is None:
+            return False
+        self.is_terminated = True
+        self.termination_reason = reason
+        return True
+
+    def _collect_data(self):
+        for agent in self.scheduler.agents:
+            agent.data_collector.step()
+
     def step_to(self, n_steps=None, termination=None, max_steps=365*24*2):
         """Execute a fixed number of steps, or until termination
 
@@ -338,8 +494,8 @@ class AgentModel(Model, AttributeHolder):
             return data
 
     def remove(self, agent):
-        """TODO"""
-        # self.scheduler.remove(agent)
+        """Remove an agent from the scheduler and the agent indexes"""
+        self.scheduler.remove(agent)
 
     def get_agents_by_type(self, agent_type=None):
         """Returns a list of agents matching search term, or all agent
@@ -352,50 +508,96 @@ class AgentModel(Model, AttributeHolder):
         """
         if agent_type is None:
             return self.scheduler.agents
-        else:
-            return [agent for agent in self.scheduler.agents if agent.agent_type == agent_type]
+        return list(self.scheduler.type_index.get(agent_type, ()))
 
     def get_agents_by_class(self, agent_class=None):
-        """TODO
-
-        TODO
+        """Returns a list of agents of an agent class, or all agents
 
         Args:
-            agent_class: TODO
+            * ``agent_class``: e.g. 'plants'
 
         Returns:
-          TODO
+            * ``[Agent...]``
         """
         if agent_class is None:
             return self.scheduler.agents
-        else:
-            return [agent for agent in self.scheduler.agents
-                    if agent.agent_class == agent_class]
+        return list(self.scheduler.class_index.get(agent_class, ()))
 
     def agent_by_id(self, id):
-        """TODO
-
-        TODO
+        """Returns the (first) agent with a storage id, or None
 
         Args:
-            id: TODO
+            * ``id``: int
 
         Returns:
-          TODO
+            * ``Agent`` or None
         """
-        for agent in self.get_agents_by_type():
-            if agent.id == id:
-                return agent
-        return None
+        return self.scheduler.id_index.get(id)
 
     def get_agents_by_role(self, role=None):
-        if role == 'storage':
-            return [agent for agent in self.scheduler.agents if agent.has_storage]
-        elif role == 'flows':
-            return [agent for agent in self.scheduler.agents if agent.has_flows]
+        """Returns a list of agents with storage ('storage') or flows ('flows')"""
+        if role in ('storage', 'flows'):
+            return list(self.scheduler.agents_with_role(role))
+
+
+class IndexedRandomActivation(RandomActivation):
+    """A MESA random activation scheduler which indexes its agents
+
+    Agents are indexed as they are added and removed, so that the model can
+    look them up without scanning all agents. Destroyed agents stay in the
+    scheduler (and the indexes) so that their data is still collected.
+    Roles depend on the connections of agents, so they are found when first
+    needed and again after agents are added or removed, or ``clear_roles``.
+
+    ====================== ============== ===============
+          Attribute        Type               Description
+    ====================== ============== ===============
+    ``type_index``         dict           ``{<agent_type>: [<agent>]}``
+    ``class_index``        dict           ``{<agent_class>: [<agent>]}``
+    ``id_index``           dict           ``{<storage id>: <agent>}``, the first with each id
+    ====================== ============== ===============
+    """
 
+    def __init__(self, model):
+        super().__init__(model)
+        self.type_index = {}
+        self.class_index = {}
+        self.id_index = {}
+        self._agents_by_role = {}
+
+    def add(self, agent):
+        super().add(agent)
+        self.type_index.setdefault(agent.agent_type, []).append(agent)
+        self.class_index.setdefault(agent.agent_class, []).append(agent)
+        self.id_index.setdefault(agent.id, agent)
+        self.clear_roles()
 
-class PrioritizedRandomActivation(RandomActivation):
+    def remove(self, agent):
+        super().remove(agent)
+        self.type_index[agent.agent_type].remove(agent)
+        self.class_index[agent.agent_class].remove(agent)
+        if self.id_index.get(agent.id) is agent:
+            del self.id_index[agent.id]
+            for other in self._agents.values():
+                if other.id == agent.id:
+                    self.id_index[agent.id] = other
+                    break
+        self.clear_roles()
+
+    def agents_with_role(self, role):
+        """Return the agents which have storage ('storage') or flows ('flows')"""
+        agents = self._agents_by_role.get(role)
+        if agents is None:
+            attr = 'has_storage' if role == 'storage' else 'has_flows'
+            agents = [agent for agent in self._agents.values() if getattr(agent, attr)]
+            self._agents_by_role[role] = agents
+        return agents
+
+    def clear_roles(self):
+        self._agents_by_role = {}
+
+
+class PrioritizedRandomActivation(IndexedRandomActivation):
     """A custom step scheduler for MESA prioritized by agent class."""
 
     def __init__(self, model):
@@ -411,21 +613,25 @@ class PrioritizedRandomActivation(RandomActivation):
         """
         self.agents_by_class = {}
         self.initialized = False
-        super(RandomActivation, self).__init__(model)
+        super().__init__(model)
 
     def step(self):
         if not self.initialized:
             self._load_agents_by_class()
         for agent_class in self.model.priorities:
             if agent_class in self.agents_by_class:
-                agents = self.agents_by_class[agent_class]
-                self.model.random_state.shuffle(agents)
-                for agent in agents:
-                    if agent.active:
-                        agent.step()
+                self._step_class(agent_class)
         self.steps += 1
         self.time += 1
 
+    def _step_class(self, agent_class):
+        """Step the active agents of one class, in random order"""
+        agents = self.agents_by_class[agent_class]
+        self.model.random_state.shuffle(agents)
+        for agent in agents:
+            if agent.active:
+                agent.step()
+
     def _load_agents_by_class(self):
         for agent in self.agents:
             agent_class = agent.agent_class
@@ -434,6 +640,12 @@ class PrioritizedRandomActivation(RandomActivation):
             self.agents_by_class[agent_class].append(agent)
         self.initialized = True
 
+    def add(self, agent):
+        super().add(agent)
+        if self.initialized:
+            self.agents_by_class.setdefault(agent.agent_class, []).append(agent)
+
     def remove(self, agent):
         super().remove(agent)
-        self.agents_by_class[agent.agent_class].remove(agent)
+        if self.initialized:
+            self.agents_by_class[agent.agent_class].remove(agent)
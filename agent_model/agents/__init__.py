@@ -1,2 +1,4 @@
 from agent_model.agents.core import BaseAgent, GeneralAgent, StorageAgent, \
     PlantAgent, ConcreteAgent
+from agent_model.agents.cohort import CohortMixin, GeneralCohort, PlantCohort, \
+    ConcreteCohort
@@ -0,0 +1,277 @@
+r"""Describes Cohort Agent Types, used when ``single_agent`` is 0.
+
+A cohort is a single agent which represents ``amount`` individuals of the same
+agent type. Storage, age, lifecycle and criteria buffers are shared by all
+members, because members are created together and draw from the same storages.
+Per-individual state (variation, events, deprive and whether each member is
+alive) is kept in NumPy arrays, and exchanges are calculated for all members
+in batched operations.
+
+Random draws are made in a fixed order, which differs from creating one agent
+per individual:
+
+- Initial variables are drawn for all members in member order, when the cohort
+  is created. This matches the order of individual agents.
+- Step variables are drawn for all living members, in member order, at the
+  point where an individual agent would draw its own.
+- Individual-scope events roll for all living members without an active
+  instance, in member order, then draw magnitude and duration for each new
+  instance in turn.
+- When an exchange with a deprive value can't be satisfied, a permutation of
+  living members is drawn to decide which are satisfied first.
+
+Without variation, a cohort gives the same results as a single agent of the
+same amount only while every exchange is met. When an exchange falls short,
+a single agent spends deprive pooled over all its units, while each member
+of a cohort has its own: satisfied members are reset to the full deprive
+value, and deprived members die one by one as theirs runs out.
+"""
+
+import numpy as np
+
+from agent_model.agents import variation_func
+from agent_model.agents.core import GeneralAgent, PlantAgent, ConcreteAgent
+
+
+class CohortMixin():
+    """Manage per-member state for a GeneralAgent subclass
+
+    ============================== ============== ===============
+              Attribute            Type               Description
+    ============================== ============== ===============
+    ``member_alive``               np.ndarray     Whether each member is alive; ``amount`` is the number alive
+    ``member_attr_factors``        dict           ``{<attr>: np.ndarray}``, initial variation of each member
+    ``member_step_variable``       np.ndarray     Current step variable of each member
+    ``member_event_multipliers``   dict           ``{<event_type>: np.ndarray}``, for individual-scope events
+    ``member_deprive``             dict           ``{<attr>: np.ndarray}``, deprive remaining for each member
+    ============================== ============== ===============
+
+    ``initial_variable`` is a list with one value per member, and
+    ``step_variable`` is always 1; the members' variables are applied by
+    ``_scale_target`` and ``_deprive`` instead. ``deprive`` holds the total
+    over living members.
+    """
+
+    def __init__(self, *args, members=None, **kwargs):
+        """Create member arrays; from_model cohorts are restored from members
+
+        Args:
+          members: dict of lists, as saved by AgentModelInitializer
+        """
+        # Individuals are whole units of agent, e.g. 1637.0000000000002 m^2
+        kwargs['amount'] = int(round(kwargs.get('amount', 1)))
+        n_members = len(members['alive']) if members else kwargs['amount']
+        self.member_alive = np.ones(n_members, dtype=bool)
+        self.member_attr_factors = {}
+        self.member_step_variable = np.ones(n_members)
+        self.member_event_multipliers = {}
+        self.member_deprive = {}
+        super().__init__(*args, **kwargs)
+        if members:
+            self.member_alive = np.array(members['alive'], dtype=bool)
+            self.member_step_variable = np.array(members['step_variable'])
+            for field in ['attr_factors', 'event_multipliers', 'deprive']:
+                getattr(self, 'member_' + field).update(
+                    {k: np.array(v) for k, v in members[field].items()})
+
+    def _init_variation(self, variation):
+        """Draw an initial variable for each member
+
+        Unlike individual agents, attrs are left unchanged; the variation of
+        each member is kept in ``member_attr_factors`` as a fraction of attrs.
+        """
+        ge = self.model.global_entropy
+        n_members = len(self.member_alive)
+        iv = variation.get('initial')
+        sv = variation.get('step')
+        self.initial_variable = 1
+        if iv:
+            upper = iv.get('upper', 0)
+            lower = iv.get('lower', 0)
+            distribution = iv.get('distribution')
+            stdev_range = iv.get('stdev_range', None)
+            characteristics = iv.get('characteristics', [])
+            if isinstance(upper, dict) or isinstance(lower, dict):
+                # When currency values are specified individually
+                variables = variation_func.get_variable(
+                    self.model.random_state, ge, ge, distribution, stdev_range, n_members)
+            else:
+                # When a scalar is used
+                variables = variation_func.get_variable(
+                    self.model.random_state, upper * ge, lower * ge, distribution,
+                    stdev_range, n_members)
+            if variables is not None:
+                self.initial_variable = variables.tolist()
+                x_norm = np.abs(variables - 1)
+                for attr, attr_value in self.attrs.items():
+                    prefix, field = attr.split('_', 1)
+                    if not (prefix in {'in', 'out'} or field in characteristics):
+                        continue
+                    if not attr_value:
+                        continue
+                    if not isinstance(upper, dict) and not isinstance(lower, dict):
+                        self.member_attr_factors[attr] = variables.copy()
+                        continue
+                    if field not in upper or field not in lower:
+                        raise ValueError(f"Missing variation value for {self.agent_type} {field}.")
+                    varied = np.where(variables < 1,
+                                      np.interp(x_norm, [0, 1], [attr_value, lower[field]]),
+                                      np.interp(x_norm, [0, 1], [attr_value, upper[field]]))
+                    self.member_attr_factors[attr] = varied / attr_value
+        if sv:
+            upper = ge * sv.get('upper', 0)
+            lower = ge * sv.get('lower', 0)
+            distribution = sv.get('distribution')
+            self.step_variation = dict(upper=upper, lower=lower, distribution=distribution)
+            self.step_variable = 1
+
+    @property
+    def attrs_varied(self):
+        """Members' variation is kept in member_attr_factors, not attrs"""
+        return False
+
+    def _init_currency_exchange(self):
+        super()._init_currency_exchange()
+        for attr in self.deprive:
+            if attr not in self.member_deprive:
+                deprive_value = self.attr_details[attr]['deprive_value']
+                self.member_deprive[attr] = np.full(len(self.member_alive), float(deprive_value))
+
+    def generate_step_variable(self):
+        """Draw a step variable for each living member"""
+        alive = self.member_alive
+        variables = variation_func.get_variable(
+            self.model.random_state, **self.step_variation,
+            size=np.count_nonzero(alive))
+        if variables is not None:
+            self.member_step_variable[alive] = variables
+        return 1
+
+    def _member_weights(self, attr):
+        """Return the variation of each living member for an exchange"""
+        weights = self.member_step_variable
+        for multipliers in self.member_event_multipliers.values():
+            weights = weights * multipliers
+        factors = self.member_attr_factors.get(attr)
+        if factors is not None:
+            weights = weights * factors
+        return weights[self.member_alive]
+
+    def _scale_target(self, flow, step_mag):
+        if (self.step_variation is None and not self.member_attr_factors
+                and not self.member_event_multipliers):
+            return step_mag * self.amount
+        return step_mag * self._member_weights(flow['attr']).sum().item()
+
+    def _deprive(self, flow, available_value, step_mag):
+        """Satisfy members in random order; deprive the rest, or kill them
+
+        Returns:
+          float, the value which can be exchanged
+        """
+        attr = flow['attr']
+        alive = np.flatnonzero(self.member_alive)
+        values = step_mag * self._member_weights(attr)
+        order = self.model.random_state.permutation(len(alive))
+        cumulative = np.cumsum(values[order])
+        n_satisfied = int(np.searchsorted(cumulative, available_value, side='right'))
+        actual_value = cumulative[n_satisfied - 1].item() if n_satisfied > 0 else 0.0
+        deprive = self.member_deprive[attr]
+        deprive[alive[order[:n_satisfied]]] = flow['deprive_value']
+        deprived = alive[order[n_satisfied:]]
+        delta_per_step = flow['delta_per_step']
+        survive = deprive[deprived] >= delta_per_step
+        deprive[deprived[survive]] -= delta_per_step
+        dying = deprived[~survive]
+        self.kill(len(dying), f'All {self.agent_type} died from lack of'
+                  f' {flow["currency"]}. Killing the agent', members=dying)
+        return actual_value
+
+    def _restore_deprive(self, flow):
+        attr = flow['attr']
+        self.member_deprive[attr][self.member_alive] = flow['deprive_value']
+        self.deprive[attr] = flow['deprive_value'] * self.amount
+
+    def _process_event(self, attr, attr_value):
+        """Process group events as usual, and individual events per member"""
+        attr_details = self.attr_details[attr]
+        if attr_details['scope'] == 'group':
+            return super()._process_event(attr, attr_value)
+        event_type = attr.split('_', 1)[1]
+        # UPDATE INSTANCES FOR DURATION & AMOUNT
+        instances = []
+        for instance in self.events.get(event_type, []):
+            if 'duration' in instance:
+                instance['duration'] -= attr_details['duration_delta_per_step']
+                if instance['duration'] <= 0:
+                    continue
+            if self.member_alive[instance['member']]:
+                instances.append(instance)
+        # RANDOMLY GENERATE NEW INSTANCES
+        affected = {instance['member'] for instance in instances}
+        candidates = [m for m in np.flatnonzero(self.member_alive).tolist()
+                      if m not in affected]
+        rolls = self.model.random_state.rand(len(candidates))
+        for member, roll in zip(candidates, rolls.tolist()):
+            if roll > attr_details['probability_per_step']:
+                continue
+            if attr_value == 'termination':
+                self.kill(1, f"Agent died due to {event_type}", members=[member])
+            elif attr_value == 'multiplier':
+                instance = self._new_event_instance(attr_details)
+                instance['member'] = member
+                instances.append(instance)
+        # UPDATE EVENT RECORDS
+        if len(instances) == 0 and event_type in self.events:
+            del self.events[event_type]
+            del self.member_event_multipliers[event_type]
+        elif len(instances) > 0:
+            self.events[event_type] = instances
+            multipliers = np.ones(len(self.member_alive))
+            for instance in instances:
+                multipliers[instance['member']] = instance['magnitude']
+            self.member_event_multipliers[event_type] = multipliers
+
+    def step(self):
+        super().step()
+        # Members are revived when amount is reset, e.g. plants which reproduce
+        n_dead = self.amount - np.count_nonzero(self.member_alive)
+        if n_dead > 0:
+            revived = np.flatnonzero(~self.member_alive)[:n_dead]
+            self.member_alive[revived] = True
+            self.member_step_variable[revived] = 1
+            for attr, deprive in self.member_deprive.items():
+                deprive[revived] = self.attr_details[attr]['deprive_value']
+                self.deprive[attr] = sum(deprive[self.member_alive].tolist())
+
+    def kill(self, number, reason, members=None):
+        """Kill members of the cohort
+
+        Args:
+          number: int
+          reason: str, cause of death
+          members: list of member indices; by default the last living members
+        """
+        if members is None:
+            alive = np.flatnonzero(self.member_alive)
+            members = alive[len(alive) - number:]
+        self.member_alive[members] = False
+        for attr, deprive in self.member_deprive.items():
+            self.deprive[attr] = sum(deprive[self.member_alive].tolist())
+        super().kill(number, reason)
+
+    def destroy(self, reason):
+        self.member_alive[:] = False
+        super().destroy(reason)
+
+
+class GeneralCohort(CohortMixin, GeneralAgent):
+    """A cohort of GeneralAgents"""
+
+
+class PlantCohort(CohortMixin, PlantAgent):
+    """A cohort of PlantAgents"""
+
+
+class ConcreteCohort(CohortMixin, ConcreteAgent):
+    """A cohort of ConcreteAgents"""
@@ -14,6 +14,7 @@ from mesa import Agent
 from agent_model.attribute_meta import AttributeHolder
 from agent_model.agents import growth_func, variation_func
 from agent_model.agents import custom_funcs
+from agent_model.agents.growth_cache import growth_cache
 from agent_model.exceptions import AgentInitializationError
 
 class BaseAgent(Agent, AttributeHolder, metaclass=ABCMeta):
@@ -103,6 +104,11 @@ class BaseAgent(Agent, AttributeHolder, metaclass=ABCMeta):
             self.step_variation = dict(upper=upper, lower=lower, distribution=distribution)
             self.step_variable = 1
 
+    @property
+    def attrs_varied(self):
+        """Whether initial variation changed the values in attrs"""
+        return self.initial_variable != 1
+
     def generate_step_variable(self):
         return variation_func.get_variable(self.model.random_state, **self.step_variation)
 
@@ -141,9 +147,13 @@ class StorageAgent(BaseAgent):
           ...[currency] int     starting balance, from config
           ...[attributes & attribute_details inherited from BaseAgent]
         """
+        self.storage_row = None
+        self.storage_slots = {}
         super().__init__(*args, **kwargs)
         self.id = kwargs.get("id", None)
         self.has_storage = False
+        storage_unit = None
+        storage_currencies = []
         class_capacities = {}
         class_unit = {}
         for attr, attr_value in self.attrs.items():
@@ -152,29 +162,75 @@ class StorageAgent(BaseAgent):
                     self.has_storage = True
                 self._attr(attr, attr_value)
                 currency = attr.split('_', 2)[2]
-                self._attr(currency, kwargs.get(currency, 0))
                 # Add meta-attributes for currency classes, so that inputs/outputs
                 # can use the same mechanisms to reference them.
                 self.add_currency_to_dict(currency)
                 currency_class = self.currency_dict[currency]['class']
+                # Balances are kept in the model's storage table, along with
+                # a factor to convert each to the unit of the first currency.
+                unit = self.attr_details[attr]['unit']
+                if storage_unit is None:
+                    storage_unit = unit
+                storage_currencies.append(dict(
+                    currency=currency,
+                    currency_class=currency_class,
+                    balance=kwargs.get(currency, 0),
+                    capacity=attr_value,
+                    unit_factor=float(pq.Quantity(1.0, unit).rescale(storage_unit).magnitude),
+                ))
                 if currency_class not in class_capacities:
                     class_capacities[currency_class] = 0
                     class_unit[currency_class] = self.attr_details[attr]['unit']
                 class_capacities[currency_class] += attr_value
+        if self.has_storage:
+            storage_table = self.model.storage_table
+            self.storage_row = storage_table.add_storage(self.agent_type, storage_currencies)
+            self.storage_slots = storage_table.slots[self.storage_row]
         for currency_class, capacity in class_capacities.items():
             class_attr = 'char_capacity_' + currency_class
             if class_attr not in self:
                 self._attr(class_attr, capacity)
                 self.attr_details[class_attr] = dict(unit=class_unit[currency_class])
-        self._calculate_storage_ratios()
+
+    def __getitem__(self, key):
+        slot = self.storage_slots.get(key)
+        if slot is None:
+            return self.__dict__[key]
+        return self.model.storage_table.balances.item(self.storage_row, slot)
+
+    def __setitem__(self, key, value):
+        slot = self.storage_slots.get(key)
+        if slot is None:
+            self.__dict__[key] = value
+        else:
+            self.model.storage_table.set_balance(self.storage_row, slot, value)
+
+    def __contains__(self, key):
+        return key in self.storage_slots or key in self.__dict__
+
+    def __getattr__(self, name):
+        # Only called if normal lookup fails, i.e. for storage balances.
+        # Balances can be read as attributes, but must be set as items.
+        slots = self.__dict__.get('storage_slots')
+        if slots is not None and name in slots:
+            return self.model.storage_table.balances.item(self.storage_row, slots[name])
+        raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
 
     def step(self):
-        """Calculate storage ratios"""
-        # TODO: This should be moved to self.increment() and streamlined
-        if self.has_storage:
-            self._calculate_storage_ratios()
+        """Calculate storage ratios, unless they are kept live by the model"""
+        if self.has_storage and not self.model.live_ratios:
+            if self.model.strict_units:
+                self._calculate_storage_ratios()
+            else:
+                self.model.storage_table.update_row_ratios(self.model.storage_ratios,
+                                                           self.storage_row)
 
     def _calculate_storage_ratios(self):
+        """Calculate storage ratios using unit-aware Quantities
+
+        Only used in strict_units mode; otherwise storage ratios are updated
+        from the model's StorageTable.
+        """
         storage_id = self.agent_type
         if storage_id not in self.model.storage_ratios:
             self.model.storage_ratios[storage_id] = {}
@@ -205,8 +261,10 @@ class StorageAgent(BaseAgent):
             currency = view
             return {currency: self[currency]}
         elif currency_data['type'] == 'currency_class':
-            currencies = currency_data['currencies']
-            return {c: self[c] for c in currencies if c in self}
+            names, slots = self.model.storage_table.view_index(
+                self.storage_row, view, currency_data['currencies'])
+            values = self.model.storage_table.balances[self.storage_row, slots]
+            return dict(zip(names, values.tolist()))
         else:
             raise KeyError(f"Currency {currency_data['name']} type not recognized by view.")
 
@@ -224,33 +282,41 @@ class StorageAgent(BaseAgent):
         incremented.
 
         """
+        storage_table = self.model.storage_table
+        balances = storage_table.balances
+        row = self.storage_row
         if increment_amount > 0:
             currency = view
             if self.currency_dict[currency]['type'] != 'currency':
                 raise ValueError(f"Positive increment can only be used with currencies.")
-            capacity = self['char_capacity_' + currency] * self.amount
-            currency_amount = min(self[currency] + increment_amount, capacity)
-            currency_increment_actual = self[currency] - currency_amount
-            self[currency] = currency_amount
-            return {currency: currency_increment_actual}
+            slot = self.storage_slots[currency]
+            capacity = storage_table.capacities.item(row, slot) * self.amount
+            balance = balances.item(row, slot)
+            currency_amount = min(balance + increment_amount, capacity)
+            storage_table.set_balance(row, slot, currency_amount)
+            return {currency: balance - currency_amount}
         elif increment_amount < 0:
-            currencies = self.view(view)
-            total_view_amount = sum(currencies.values())
-            target_view_amount = min(total_view_amount + increment_amount, 0)
+            currency_data = self.currency_dict[view]
+            if currency_data['type'] == 'currency':
+                slot = self.storage_slots[view]
+                balance = balances.item(row, slot)
+                if balance <= 0:
+                    return {view: 0}
+                currency_amount = max(balance + increment_amount, 0)
+                storage_table.set_balance(row, slot, currency_amount)
+                return {view: balance - currency_amount}
+            names, slots = storage_table.view_index(row, view, currency_data['currencies'])
+            values = balances[row, slots]
+            total_view_amount = sum(values.tolist())
             # TODO: This is triggered sometimes by a rounding error. Need a better solution.
-            # if target_view_amount < 0:
+            # if total_view_amount + increment_amount < 0:
                 # raise ValueError(f"{self.agent_type} has insufficient {view} balance to increment by {increment_amount}")
             if total_view_amount <= 0:
-                return {c: 0 for c in currencies}
-            ratios = {c: self[c]/total_view_amount for c in currencies.keys()}
-            flow = {}
-            for currency in currencies:
-                currency_increment_target = increment_amount * ratios[currency]
-                currency_amount = max(self[currency] + currency_increment_target, 0)
-                currency_increment_actual = self[currency] - currency_amount
-                self[currency] = currency_amount
-                flow[currency] = currency_increment_actual
-            return flow
+                return {c: 0 for c in names}
+            targets = increment_amount * (values / total_view_amount)
+            amounts = np.maximum(values + targets, 0)
+            storage_table.set_balances(row, slots, amounts)
+            return dict(zip(names, (values - amounts).tolist()))
         else:
             return {}
 
@@ -274,7 +340,9 @@ class GeneralAgent(StorageAgent):
     ``currency_dict``      dict           A subset of the currency_dict in :ref:`agent-model` with only currencies used by this agent
     ``id``                 int            Index for storage type (not used)
     ``has_storage``        bool           Whether agent has storage characteristics
-    ``...[currency]``      float          Current storage balance of a currency
+    ``...[currency]``      float          Current storage balance of a currency, kept in ``model.storage_table``
+    ``storage_row``        int            Row of this agent in ``model.storage_table``
+    ``storage_slots``      dict           ``{<currency>: <slot>}`` in ``model.storage_table``
     ``has_flows``          bool           Whether agent has currency exchanges
     ``connections``        dict           A list of all connected agents
     ``selected_storage``   dict           Lists of connected agents sorted by direction, currency
@@ -283,6 +351,8 @@ class GeneralAgent(StorageAgent):
     ``step_values``        dict           Step values for each currency with lifetime/daily growth applied
     ``events``             dict           A list of event instances by type
     ``event_multipliers``  dict           A list of multipliers from events, applied to every currency exchange
+    ``action_plan``        list           Pre-resolved thresholds, custom functions and events, in ``attrs`` order
+    ``flow_plan``          list           Pre-resolved exchange records, in ``selected_storage`` order
     ====================== ============== ===============
     """
 
@@ -385,6 +455,110 @@ class GeneralAgent(StorageAgent):
             if attr not in self.step_values:
                 self.step_values[attr] = self._calculate_step_values(attr)
 
+        self._compile_step_plan()
+
+    def _compile_step_plan(self):
+        """Resolve everything step() needs which is fixed after initialization
+
+        The attribute names, details and connections of an agent don't change
+        once currency exchanges are initialized, so string parsing and lookups
+        are done once here and step() only walks the resulting lists.
+
+        ``action_plan`` holds threshold checks, custom functions and events in
+        the order they appear in ``attrs``. ``flow_plan`` holds one record per
+        input/output, in the order of ``selected_storage``.
+        """
+        self.action_plan = []
+        for attr, attr_value in self.attrs.items():
+            if attr.startswith('char_threshold_'):
+                (threshold_type, currency) = attr.split('_')[-2:]
+                opp = {'upper': operator.gt, 'lower': operator.lt}[threshold_type]
+                for prefix in ['in', 'out']:
+                    if currency in self.selected_storage[prefix]:
+                        for storage_agent in self.selected_storage[prefix][currency]:
+                            self.action_plan.append(dict(
+                                type='threshold',
+                                currency=currency,
+                                storage_id=storage_agent.agent_type,
+                                ratio_key=currency + '_ratio',
+                                opp=opp,
+                                limit=attr_value,
+                            ))
+            if attr == 'char_custom_function':
+                custom_function = getattr(custom_funcs, attr_value, None)
+                if custom_function is None:
+                    raise AgentInitializationError(
+                        f'Unknown custom function: {attr_value}.')
+                self.action_plan.append(dict(type='custom_function',
+                                             function=custom_function))
+            if attr.startswith('event'):
+                self.action_plan.append(dict(type='event', attr=attr,
+                                             value=attr_value))
+
+        self.flow_plan = []
+        for prefix in ['in', 'out']:
+            for currency, selected_storages in self.selected_storage[prefix].items():
+                attr = f"{prefix}_{currency}"
+                if self.attrs[attr] == 0:
+                    # e.g. Atmosphere Equalizer: uses custom_func, has dummy flow to initialize connections
+                    continue
+                attr_details = self.attr_details[attr]
+                weights = []
+                for weight in attr_details.get('weighted') or []:
+                    if (weight in self.currency_dict and
+                        # If weighted by some currency, must first divide by
+                        # amount, because it's multiplied by amount again later
+                        self.currency_dict[currency]['type'] == 'currency'):
+                        scale = 'per_amount'
+                    elif weight == 'growth_rate':
+                        # If weighted by growth rate, multiply by 2 because for
+                        # an un-skewed sigmoid curve, max height is 2x mean
+                        scale = 'double'
+                    else:
+                        scale = None
+                    weights.append((weight, scale))
+                self.flow_plan.append(dict(
+                    attr=attr,
+                    prefix=prefix,
+                    currency=currency,
+                    storages=selected_storages,
+                    flow_unit=attr_details['flow_unit'],
+                    criteria=self._compile_criteria(attr),
+                    requires=attr_details.get('requires') or [],
+                    weights=weights,
+                    is_required=attr_details.get('is_required'),
+                    deprive_value=attr_details.get('deprive_value') or 0,
+                    delta_per_step=attr_details.get('delta_per_step', 0),
+                ))
+
+    def _compile_criteria(self, attr):
+        """Return the pre-resolved criteria for an exchange, or None"""
+        attr_details = self.attr_details[attr]
+        cr_name = attr_details['criteria_name']
+        if not cr_name:
+            return None
+        criteria = dict(
+            name=cr_name,
+            opp={'>': operator.gt, '<': operator.lt, '=': operator.eq}[attr_details['criteria_limit']],
+            value=attr_details['criteria_value'] or 0.0,
+            buffer=attr_details['criteria_buffer'] or 0.0,
+        )
+        direction = cr_name.split('_')[-1]
+        if cr_name in self:
+            # e.g. 'growth_rate'
+            criteria['source'] = 'attr'
+        elif direction in ['in', 'out']:
+            #  e.g. 'co2_ratio_in': Value for specific connection
+            elements = cr_name.split('_')
+            currency = elements[0]
+            criteria['source'] = 'storage_ratio'
+            criteria['storage_id'] = self.selected_storage[direction][currency][0].agent_type
+            criteria['ratio_key'] = '_'.join(elements[:2])
+        else:
+            # e.g. 'co2_ratio': Sum of all storages with currency
+            criteria['source'] = 'all_storage_ratios'
+        return criteria
+
     def _calculate_step_values(self, attr):
         """Calculate lifetime step values based on growth functions and add to self.step_values
 
@@ -433,6 +607,18 @@ class GeneralAgent(StorageAgent):
         agent_value = float(self.attrs[attr])
         agent_value *= float(multiplier)
 
+        # Step values only depend on these fields, so they're shared between
+        # agents and games, unless random noise or initial variation is added.
+        cache_key = None
+        if not (lifetime_growth_noise or daily_growth_noise or self.attrs_varied):
+            cache_key = growth_cache.make_key(
+                'step_values', agent_value=agent_value, n_steps=n_steps,
+                day_length_hours=day_length_hours,
+                growth={k: v for k, v in ad.items() if '_growth_' in k})
+            cached = growth_cache.get(cache_key)
+            if cached is not None:
+                return cached
+
         if lifetime_growth_type:
             start_value = lifetime_growth_min_value or 0.0
             max_value = lifetime_growth_max_value or 0.0
@@ -470,39 +656,34 @@ class GeneralAgent(StorageAgent):
             max_threshold *= day_length_hours
             invert = bool(daily_growth_invert)
             noise = bool(daily_growth_noise)
-            for i in range(0, n_steps, day_length):
-                day_values = step_values[i:i+day_length]
-                agent_value = np.mean(day_values)
-                daily_min = np.min(day_values)
-                daily_max = np.max(day_values)
-                if daily_growth_min_value:
-                    start_value = agent_value * daily_growth_min_value
-                elif daily_min < daily_max:
-                    start_value = daily_min or 0
-                else:
-                    start_value = 0
-                if (i + day_length) > n_steps:
-                    day_length = n_steps - i
-                kwargs = {'agent_value': agent_value,
-                          'num_values': day_length,
-                          'growth_type': daily_growth_type,
-                          'min_value': start_value,
-                          'min_threshold': int(min_threshold),
-                          'max_threshold': int(max_threshold),
-                          'center': center,
-                          'noise': noise,
-                          'invert': invert}
-                if daily_growth_scale:
-                    kwargs['scale'] = daily_growth_scale
-                elif lifetime_growth_type:
-                    kwargs['scale'] = 0.5
-                    kwargs['max_value'] = agent_value * 1.1
-                if daily_growth_steepness:
-                    kwargs['steepness'] = daily_growth_steepness
-                if start_value == agent_value:
-                    step_values[i:i+day_length] = np.ones(day_length) * agent_value
-                else:
-                    step_values[i:i+day_length] = growth_func.get_growth_values(**kwargs)
+            kwargs = {'growth_type': daily_growth_type,
+                      'daily_min_value': daily_growth_min_value,
+                      'min_threshold': int(min_threshold),
+                      'max_threshold': int(max_threshold),
+                      'center': center,
+                      'noise': noise,
+                      'invert': invert}
+            if daily_growth_scale:
+                kwargs['scale'] = daily_growth_scale
+            elif lifetime_growth_type:
+                kwargs['scale'] = 0.5
+                kwargs['max_value_factor'] = 1.1
+            if daily_growth_steepness:
+                kwargs['steepness'] = daily_growth_steepness
+            # Apply the daily curve to all full days at once, then to the
+            # last partial day if there is one.
+            n_days, remainder = divmod(n_steps, day_length)
+            n_full = n_days * day_length
+            if n_days > 0:
+                days = step_values[:n_full].reshape(n_days, day_length)
+                step_values[:n_full] = growth_func.get_daily_growth_values(
+                    days, **kwargs).reshape(n_full)
+            if remainder > 0:
+                last_day = step_values[n_full:].reshape(1, remainder)
+                step_values[n_full:] = growth_func.get_daily_growth_values(
+                    last_day, **kwargs)[0]
+        if cache_key is not None:
+            step_values = growth_cache.set(cache_key, step_values)
         return step_values
 
     def _get_storage_ratio(self, cr_name):
@@ -524,42 +705,38 @@ class GeneralAgent(StorageAgent):
                     total += storage_ratios[storage_id][cr_name]
         return total
 
-    def _get_step_value(self, attr, step_num):
-        """TODO
-
-        TODO
+    def _get_step_value(self, flow, step_num):
+        """Return the target value of an exchange for a single unit of agent
 
         Args:
-            attr: TODO
+          flow: dict, an entry of ``flow_plan``
+          step_num: int, index into the exchange's lifetime step values
 
         Returns:
-          TODO
+          float, 0 if the exchange's criteria are not met
         """
-        prefix, currency = attr.split('_', 1)
-        agent_unit = self.attr_details[attr]['flow_unit']
-        cr_name = self.attr_details[attr]['criteria_name']
-        if cr_name:
-            cr_limit = self.attr_details[attr]['criteria_limit']
-            cr_value = self.attr_details[attr]['criteria_value'] or 0.0
-            cr_buffer = self.attr_details[attr]['criteria_buffer'] or 0.0
-            if cr_name in self:
-                # e.g. 'growth_rate'
-                source = self[cr_name]
+        attr = flow['attr']
+        criteria = flow['criteria']
+        if criteria:
+            cr_buffer = criteria['buffer']
+            source_type = criteria['source']
+            if source_type == 'attr':
+                source = self[criteria['name']]
+            elif source_type == 'storage_ratio':
+                source = self.model.storage_ratios[criteria['storage_id']][criteria['ratio_key']]
             else:
-                source = self._get_storage_ratio(cr_name)
-            opp = {'>': operator.gt, '<': operator.lt, '=': operator.eq}[cr_limit]
-            if opp(source, cr_value):
+                source = self._get_storage_ratio(criteria['name'])
+            if criteria['opp'](source, criteria['value']):
                 if cr_buffer > 0 and self.buffer.get(attr, 0) > 0:
                     self.buffer[attr] -= 1
-                    return pq.Quantity(0.0, agent_unit)
+                    return 0.0
             else:
                 if cr_buffer > 0:
                     self.buffer[attr] = cr_buffer
-                return pq.Quantity(0.0, agent_unit)
-        cached_steps = self.step_values[attr].shape[0]
-        step_num = step_num % int(cached_steps)
-        agent_value = self.step_values[attr][step_num]
-        return pq.Quantity(agent_value, agent_unit)
+                return 0.0
+        step_values = self.step_values[attr]
+        step_num = step_num % int(step_values.shape[0])
+        return step_values[step_num]
 
     def _process_event(self, attr, attr_value):
         event_type = attr.split('_', 1)[1]
@@ -586,30 +763,7 @@ class GeneralAgent(StorageAgent):
             if attr_value == 'termination':
                 self.kill(self.amount, f"Agent died due to {event_type}")
             elif attr_value == 'multiplier':
-                magnitude = attr_details['magnitude_value']
-                magnitude_variation_distribution = attr_details.get('magnitude_variation_distribution')
-                if magnitude_variation_distribution:
-                    magnitude_variable = variation_func.get_variable(
-                        self.model.random_state,
-                        attr_details['magnitude_variation_upper'],
-                        attr_details['magnitude_variation_lower'],
-                        magnitude_variation_distribution
-                    )
-                    magnitude = magnitude * magnitude_variable
-                instance = dict(magnitude=magnitude)
-                duration = attr_details.get('duration_value')
-                if duration:
-                    duration_variation_distribution = attr_details.get('duration_variation_distribution')
-                    if duration_variation_distribution:
-                        duration_variable = variation_func.get_variable(
-                            self.model.random_state,
-                            attr_details['duration_variation_upper'],
-                            attr_details['duration_variation_lower'],
-                            duration_variation_distribution
-                        )
-                        duration = duration * duration_variable
-                    instance['duration'] = duration
-                instances.append(instance)
+                instances.append(self._new_event_instance(attr_details))
         # UPDATE EVENT RECORDS
         if len(instances) == 0 and event_type in self.events:
             del self.events[event_type]
@@ -621,6 +775,32 @@ class GeneralAgent(StorageAgent):
             event_multiplier = (modified + unmodified) / max_instances
             self.event_multipliers[event_type] = event_multiplier
 
+    def _new_event_instance(self, attr_details):
+        """Return a new multiplier event instance with random magnitude and duration"""
+        magnitude = attr_details['magnitude_value']
+        magnitude_variation_distribution = attr_details.get('magnitude_variation_distribution')
+        if magnitude_variation_distribution:
+            magnitude_variable = variation_func.get_variable(
+                self.model.random_state,
+                attr_details['magnitude_variation_upper'],
+                attr_details['magnitude_variation_lower'],
+                magnitude_variation_distribution
+            )
+            magnitude = magnitude * magnitude_variable
+        instance = dict(magnitude=magnitude)
+        duration = attr_details.get('duration_value')
+        if duration:
+            duration_variation_distribution = attr_details.get('duration_variation_distribution')
+            if duration_variation_distribution:
+                duration_variable = variation_func.get_variable(
+                    self.model.random_state,
+                    attr_details['duration_variation_upper'],
+                    attr_details['duration_variation_lower'],
+                    duration_variation_distribution
+                )
+                duration = duration * duration_variable
+            instance['duration'] = duration
+        return instance
 
     def step(self, value_eps=1e-12, value_round=6):
         """The main step function for SIMOC agents. Calculate step values and process exchanges.
@@ -635,31 +815,22 @@ class GeneralAgent(StorageAgent):
         self.step_exchange_buffer = {'in': {}, 'out': {}}
 
         self.age += self.model.hours_per_step
-        for attr, attr_value in self.attrs.items():
+        for action in self.action_plan:
+            action_type = action['type']
             # 1. CHECK THRESHOLDS
-            if attr.startswith('char_threshold_'):
-                (threshold_type, currency) = attr.split('_')[-2:]
-                for prefix in ['in', 'out']:
-                    if currency in self.selected_storage[prefix]:
-                        for storage_agent in self.selected_storage[prefix][currency]:
-                            agent_id = storage_agent.agent_type
-                            storage_ratio = self.model.storage_ratios[agent_id][currency + '_ratio']
-                            opp = {'upper': operator.gt, 'lower': operator.lt}[threshold_type]
-                            if opp(storage_ratio, attr_value):
-                                self.kill(self.amount,
-                                          f'Threshold {currency} met for '
-                                          f'{self.agent_type}. Killing the agent')
-                                return
+            if action_type == 'threshold':
+                storage_ratio = self.model.storage_ratios[action['storage_id']][action['ratio_key']]
+                if action['opp'](storage_ratio, action['limit']):
+                    self.kill(self.amount,
+                              f'Threshold {action["currency"]} met for '
+                              f'{self.agent_type}. Killing the agent')
+                    return
             # 2. EXECUTE CUSTOM FUNCTIONS
-            if attr == 'char_custom_function':
-                custom_function = getattr(custom_funcs, attr_value)
-                if custom_function:
-                    custom_function(self)
-                else:
-                    raise Exception(f'Unknown custom function: {custom_function}.')
+            elif action_type == 'custom_function':
+                action['function'](self)
             # 3. PROCESS EVENTS
-            if attr.startswith('event') and self.process_events:
-                self._process_event(attr, attr_value)
+            elif action_type == 'event' and self.process_events:
+                self._process_event(action['attr'], action['value'])
 
         # 4. GENERATE RANDOM VARIATION
         if self.step_variation is not None:
@@ -668,111 +839,124 @@ class GeneralAgent(StorageAgent):
         # ITERATE THROUGH EACH INPUT AND OUTPUT
         influx = {}     # For 'requires' field
         self.missing_desired = False  # Stalls growth if 'required = desired' field is missing
-        for prefix in ['in', 'out']:
-            for currency, selected_storages in self.selected_storage[prefix].items():
-                attr = f"{prefix}_{currency}"
-                attr_details = self.attr_details[attr]
+        step_num = int(self.age)
+        event_multiplier = np.prod(list(self.event_multipliers.values()))
+        strict_units = self.model.strict_units
+        for flow in self.flow_plan:
+            prefix = flow['prefix']
+            currency = flow['currency']
+            attr = flow['attr']
+
+            # 5. CHECK ESCAPE PARAMETERS
+            requires = flow['requires']
+            if any(_currency not in influx for _currency in requires):
+                # e.g. Human: if not consume potable water, don't produce urine
+                continue
 
-                # 5. CHECK ESCAPE PARAMETERS
-                if self.attrs[attr] == 0:
-                    # e.g. Atmosphere Equalizer: uses custom_func, has dummy flow to initialize connections
-                    continue
-                requires = attr_details.get('requires') or []
-                if any(_currency not in influx for _currency in requires):
-                    # e.g. Human: if not consume potable water, don't produce urine
-                    continue
+            # 6. CALCULATE TARGET VALUE
+            # Units are validated in _init_currency_exchange, so values are
+            # plain floats unless strict_units is set for debugging.
+            step_value = self._get_step_value(flow, step_num)
+            if strict_units:
+                step_value = pq.Quantity(step_value, flow['flow_unit'])
+            for _currency in requires:
+                step_value *= influx.get(_currency)  # scale outputs to inputs
+            for weight, scale in flow['weights']:
+                weight_value = getattr(self, weight)
+                if scale == 'per_amount':
+                    weight_value /= self.amount
+                elif scale == 'double':
+                    weight_value *= 2
+                step_value *= weight_value
+
+            step_value = step_value * self.step_variable
+            step_value = step_value * event_multiplier
+            if strict_units:
+                step_mag = step_value.magnitude.tolist()
+            else:
+                step_mag = float(step_value)
+            target_value = self._scale_target(flow, step_mag)
+            actual_value = target_value                 # to be adjusted below
+
+            # 7. CALCULATE AVAILABLE VALUE
+            available_value = 0   # Total available in connected storages
+            available_conns = []  # Value for each storage
+            for storage in flow['storages']:
+                storage_value = sum(storage.view(currency).values())
+                available_value += storage_value
+                available_conns.append(dict(agent=storage, value=storage_value))
+
+            # 8. UPDATE AGENT BASED ON DEFICIT/SUFFICIENCY
+            has_deficit = prefix == 'in' and available_value < target_value
+            # 8.1 REQUIRES
+            is_required = flow['is_required']
+            if has_deficit and is_required:
+                if is_required == 'mandatory':
+                    # e.g. Dehumidifier: If there's no atmosphere.h2o, don't do anything.
+                    return
+                elif is_required == 'desired':
+                    # e.g. Plants: If one or more desired inputs is missing, growth stalls.
+                    self.missing_desired = True
+            # 8.2 DEPRIVE
+            deprive_value = flow['deprive_value']
+            if has_deficit and deprive_value > 0:
+                actual_value = self._deprive(flow, available_value, step_mag)
+                if self.amount == 0:
+                    return
+            elif deprive_value > 0:
+                self._restore_deprive(flow)
+            elif has_deficit:
+                actual_value = available_value
 
-                # 6. CALCULATE TARGET VALUE
-                step_num = int(self.age)
-                step_value = self._get_step_value(attr, step_num)     # type pq.Quantity
-                for _currency in requires:
-                    step_value *= influx.get(_currency)  # scale outputs to inputs
-                weighted = attr_details.get('weighted') or []
-                for weight in weighted:
-                    weight_value = getattr(self, weight)
-                    if (weight in self.currency_dict and
-                        # If weighted by some currency, must first divide by
-                        # amount, because it's multiplied by amount again later
-                        self.currency_dict[currency]['type'] == 'currency'):
-                        weight_value /= self.amount
-                    elif weight == 'growth_rate':
-                        # If weighted by growth rate, multiply by 2 because for
-                        # an un-skewed sigmoid curve, max height is 2x mean
-                        weight_value *= 2
-                    step_value *= weight_value
-
-                step_value = step_value * self.step_variable
-                step_value = step_value * np.prod(list(self.event_multipliers.values()))
-                step_mag = step_value.magnitude.tolist()    # type float
-                target_value = step_mag * self.amount
-                actual_value = target_value                 # to be adjusted below
-
-                # 7. CALCULATE AVAILABLE VALUE
-                available_value = 0   # Total available in connected storages
-                available_conns = []  # Value/capacity for each storage
-                for storage in selected_storages:
-                    storage_value = sum(storage.view(currency).values())
-                    storage_cap = storage['char_capacity_' + currency]
-                    storage_amount = storage.__dict__.get('amount', 1)
-                    available_value += storage_value
-                    available_conns.append(dict(
-                        agent=storage,
-                        value=storage_value,
-                        capacity=storage_cap * storage_amount
-                    ))
-
-                # 8. UPDATE AGENT BASED ON DEFICIT/SUFFICIENCY
-                has_deficit = prefix == 'in' and available_value < target_value
-                # 8.1 REQUIRES
-                is_required = attr_details.get('is_required')
-                if has_deficit and is_required:
-                    if is_required == 'mandatory':
-                        # e.g. Dehumidifier: If there's no atmosphere.h2o, don't do anything.
-                        return
-                    elif is_required == 'desired':
-                        # e.g. Plants: If one or more desired inputs is missing, growth stalls.
-                        self.missing_desired = True
-                # 8.2 DEPRIVE
-                deprive_value = attr_details.get('deprive_value') or 0
-                if has_deficit and deprive_value > 0:
-                    n_satisfied = math.floor(available_value / step_mag)
-                    actual_value = n_satisfied * step_mag
-                    delta_per_step = attr_details.get('delta_per_step', 0)
-                    max_survive = math.floor(max(self.deprive[attr], 0) / delta_per_step)
-                    n_deprived = self.amount - n_satisfied
-                    n_survive = min(n_deprived, max_survive)
-                    self.deprive[attr] -= delta_per_step * n_survive
-                    n_die = n_deprived - n_survive
-                    self.kill(n_die, f'All {self.agent_type} died from lack of'
-                              f' {currency}. Killing the agent')
-                    if self.amount == 0:
-                        return
-                elif deprive_value > 0:
-                    self.deprive[attr] = min(deprive_value * self.amount,
-                                             self.deprive[attr] + deprive_value)
-                elif has_deficit:
-                    actual_value = available_value
-
-                # 9. PROCESS EXCHANGE
-                if actual_value < value_eps:  # ignore values less than 1e-12
-                    continue
-                if prefix == 'in':  # log input ratios to scale outputs
-                    influx[currency] = actual_value / target_value
-                remaining_value = actual_value
-                for conn in available_conns:
-                    storage = conn['agent']
-                    if prefix == 'in':
-                        conn_delta = min(remaining_value, conn['value'])
-                        flow = storage.increment(currency, -conn_delta)
-                    elif prefix == 'out':
-                        conn_delta = remaining_value / len(available_conns)
-                        flow = storage.increment(currency, conn_delta)
-                    remaining_value -= conn_delta
-                    buf = self.step_exchange_buffer[prefix]
-                    for _currency, _amount in flow.items():
-                        if _currency not in buf:
-                            buf[_currency] = {}
-                        buf[_currency][storage.agent_type] = abs(_amount)
+            # 9. PROCESS EXCHANGE
+            if actual_value < value_eps:  # ignore values less than 1e-12
+                continue
+            if prefix == 'in':  # log input ratios to scale outputs
+                influx[currency] = actual_value / target_value
+            remaining_value = actual_value
+            for conn in available_conns:
+                storage = conn['agent']
+                if prefix == 'in':
+                    conn_delta = min(remaining_value, conn['value'])
+                    flow_actual = storage.increment(currency, -conn_delta)
+                elif prefix == 'out':
+                    conn_delta = remaining_value / len(available_conns)
+                    flow_actual = storage.increment(currency, conn_delta)
+                remaining_value -= conn_delta
+                buf = self.step_exchange_buffer[prefix]
+                for _currency, _amount in flow_actual.items():
+                    if _currency not in buf:
+                        buf[_currency] = {}
+                    buf[_currency][storage.agent_type] = abs(_amount)
+
+    def _scale_target(self, flow, step_mag):
+        """Return the target value of an exchange for all units of agent"""
+        return step_mag * self.amount
+
+    def _deprive(self, flow, available_value, step_mag):
+        """Kill the units of agent which can't be satisfied or survive deprivation
+
+        Returns:
+          float, the value which can be exchanged
+        """
+        attr = flow['attr']
+        n_satisfied = math.floor(available_value / step_mag)
+        actual_value = n_satisfied * step_mag
+        delta_per_step = flow['delta_per_step']
+        max_survive = math.floor(max(self.deprive[attr], 0) / delta_per_step)
+        n_deprived = self.amount - n_satisfied
+        n_survive = min(n_deprived, max_survive)
+        self.deprive[attr] -= delta_per_step * n_survive
+        n_die = n_deprived - n_survive
+        self.kill(n_die, f'All {self.agent_type} died from lack of'
+                  f' {flow["currency"]}. Killing the agent')
+        return actual_value
+
+    def _restore_deprive(self, flow):
+        """Restore deprive value after an exchange is satisfied"""
+        attr = flow['attr']
+        self.deprive[attr] = min(flow['deprive_value'] * self.amount,
+                                 self.deprive[attr] + flow['deprive_value'])
 
     def kill(self, number, reason):
         """Destroy the agent and remove it from the model
@@ -798,6 +982,7 @@ class PlantAgent(GeneralAgent):
     ``agent_step_num``     int            Current step in growth cycle, as limited by growth_critera
     ``growth_rate``        int            Accumulated % of ideal lifetime biomass
     ``grown``              bool           Whether growth is complete
+    ``light_agent``        GeneralAgent   Source of par, resolved when connected
     ====================== ============== ===============
     """
 
@@ -840,6 +1025,8 @@ class PlantAgent(GeneralAgent):
 
     def _init_currency_exchange(self):
         super()._init_currency_exchange()
+        light_type = self.connections['in']['par'][0]
+        self.light_agent = self.model.get_agents_by_type(light_type)[0]
         self.co2_scale = {}
         for attr in self.attrs:
             prefix, _ = attr.split('_', 1)
@@ -847,13 +1034,12 @@ class PlantAgent(GeneralAgent):
                 self.co2_scale[attr] = 1
 
 
-    def _get_step_value(self, attr, step_num):
+    def _get_step_value(self, flow, step_num):
         # On last step in lifecycle, only return the `weighted` value, i.e. the
         # food output, and ignore any criteria.
-        cr_name = self.attr_details[attr]['criteria_name']
-        if self.grown and cr_name != 'grown':
-            agent_unit = self.attr_details[attr]['flow_unit']
-            return pq.Quantity(0.0, agent_unit)
+        criteria = flow['criteria']
+        if self.grown and (criteria is None or criteria['name'] != 'grown'):
+            return 0.0
 
         # Step values for plants are based on `agent_step_num`` instead of `age`
         # to account for stalled growth from deprive. TODO: As noted above,
@@ -861,54 +1047,51 @@ class PlantAgent(GeneralAgent):
         # updated here, but the current reporting system expects `growth` in
         # the main step record, so it's included in GeneralAgent.step().
         step_num = int(self.agent_step_num)
-        step_value = super()._get_step_value(attr, step_num)
+        step_value = super()._get_step_value(flow, step_num)
 
         return step_value
 
 
     def _calculate_co2_response(self):
-        """Calculate a multiplier for each currency exchange based on ambient co2"""
-
-        # To avoid intra-step fluctuations in co2 response, response variables
-        # are cached each step. They are stored in `model.storage_ratios`, which
-        # are used to cache the same for structures, out of convenience.
-        co2 = self.model.storage_ratios.get('co2', None)  # Get from cache
-        if co2 is None:                                   # or initialize
-            co2 = dict(time=0, co2_uptake_ratio=1, transpiration_efficiency_factor=1)
-            self.model.storage_ratios['co2'] = co2
-
-        # If the cached values are for this time, use them
-        # TODO: Need to save different values for c3/c4 crops. Currently
-        # the carbon_fixation type of the first plant called by model.step()
-        # is used for all plants that step.
-        if co2['time'] == str(self.model.time):
-            co2_uptake_ratio = co2['co2_uptake_ratio']
-            transpiration_efficiency_factor = co2['transpiration_efficiency_factor']
-        else:
-            co2_concentration = self._get_storage_ratio('co2_ratio_in') * 1e6
-            co2_ideal = 700 # ppm
-            co2_actual = max(350, min(co2_concentration, co2_ideal))
-
-            # CO2 Response Factor: Decrease growth if actual < ideal
-            if self.attrs['char_carbon_fixation'] == 'c3':
-                # Standard equation found in research; gives *increase* in growth for eCO2
-                t_mean = 25 # Mean temperature for timestep.
-                tt = (163 - t_mean) / (5 - 0.1 * t_mean) # co2 compensation point
-                numerator = (co2_actual - tt) * (350 + 2 * tt)
-                denominator = (co2_actual + 2 * tt) * (350 - tt)
-                co2_uptake_ratio = numerator/denominator
-                # Invert the above to give *decrease* in growth for less than ideal CO2
-                crf_ideal = 1.2426059597016264  # At 700ppm, the above equation gives this value
-                co2_uptake_ratio = co2_uptake_ratio / crf_ideal
-            elif self.attrs['char_carbon_fixation'] == 'c4':
-                co2_uptake_ratio = 1  # c4 crops (corn, sorghum) don't benefit
-
-            # Transpiration Efficiency Factor: Increase water usage if actual < ideal
-            co2_range = [350, 700]
-            te_range = [1/1.37, 1]  # Inverse of previously used
-            transpiration_efficiency_factor = np.interp(co2_actual, co2_range, te_range)
-
-        return co2_uptake_ratio, transpiration_efficiency_factor
+        """Calculate a multiplier for each currency exchange based on ambient co2
+
+        To avoid intra-step fluctuations in co2 response, the response is
+        calculated once per step for each atmosphere and carbon fixation type,
+        by the first plant which needs it, and cached in ``model.step_cache``.
+        """
+        atmosphere = self.selected_storage['in']['co2'][0].agent_type
+        carbon_fixation = self.attrs['char_carbon_fixation']
+        key = ('co2_response', atmosphere, carbon_fixation)
+        response = self.model.step_cache.get(key)
+        if response is not None:
+            return response
+
+        co2_concentration = self._get_storage_ratio('co2_ratio_in') * 1e6
+        co2_ideal = 700 # ppm
+        co2_actual = max(350, min(co2_concentration, co2_ideal))
+
+        # CO2 Response Factor: Decrease growth if actual < ideal
+        if carbon_fixation == 'c3':
+            # Standard equation found in research; gives *increase* in growth for eCO2
+            t_mean = 25 # Mean temperature for timestep.
+            tt = (163 - t_mean) / (5 - 0.1 * t_mean) # co2 compensation point
+            numerator = (co2_actual - tt) * (350 + 2 * tt)
+            denominator = (co2_actual + 2 * tt) * (350 - tt)
+            co2_uptake_ratio = numerator/denominator
+            # Invert the above to give *decrease* in growth for less than ideal CO2
+            crf_ideal = 1.2426059597016264  # At 700ppm, the above equation gives this value
+            co2_uptake_ratio = co2_uptake_ratio / crf_ideal
+        elif carbon_fixation == 'c4':
+            co2_uptake_ratio = 1  # c4 crops (corn, sorghum) don't benefit
+
+        # Transpiration Efficiency Factor: Increase water usage if actual < ideal
+        co2_range = [350, 700]
+        te_range = [1/1.37, 1]  # Inverse of previously used
+        transpiration_efficiency_factor = np.interp(co2_actual, co2_range, te_range)
+
+        response = (co2_uptake_ratio, transpiration_efficiency_factor)
+        self.model.step_cache[key] = response
+        return response
 
     def step(self):
         """TODO"""
@@ -940,9 +1123,8 @@ class PlantAgent(GeneralAgent):
         # - Lamp.par is multiplied by the lamp amount (to scale kwh consumption)
         # - Sun.par is not, because there's nothing to scale and plants can't
         #   compete over it. Sunlight also can't be incremented.
-        light_type = self.connections['in']['par'][0]
-        light_agent = self.model.get_agents_by_type(light_type)[0]
-        is_electric = ('lamp' in light_type)
+        light_agent = self.light_agent
+        is_electric = ('lamp' in light_agent.agent_type)
         par_ideal = self.attrs['char_par_baseline'] * self.daily_growth_factor
         if is_electric:
             par_ideal *= self.amount
@@ -959,8 +1141,8 @@ class PlantAgent(GeneralAgent):
         self.agent_step_num += self.model.hours_per_step
 
     def kill(self, number, reason):
-        dead_biomass = (number / self.amount) * self.biomass
-        self.biomass -= dead_biomass
+        dead_biomass = (number / self.amount) * self['biomass']
+        self['biomass'] -= dead_biomass
         self.selected_storage['out']['inedible_biomass'][0].increment(
             'inedible_biomass', dead_biomass)
         super().kill(number, reason)
@@ -991,14 +1173,14 @@ class ConcreteAgent(GeneralAgent):
         super().__init__(*args, **kwargs)  # Load exchange data
 
         # Set internal caoh2 to the maximum amount of carbonation at the highest ppm level
-        self.caoh2 = self.calc_max_carbonation(3000) * self.attrs['in_caoh2'] * self.amount
-        self.caco3 = 0      # Byproduct, accumulates internally
-        self.moisture = 0   # Byproduct, accumulates internally
+        self['caoh2'] = self.calc_max_carbonation(3000) * self.attrs['in_caoh2'] * self.amount
+        self['caco3'] = 0      # Byproduct, accumulates internally
+        self['moisture'] = 0   # Byproduct, accumulates internally
         # If carbonation has already occured (Mission 2), update storages accordingly
         if self.carbonation > 0:
-            self.caoh2 -= self.attrs['in_caoh2'] * self.carbonation * self.amount
-            self.caco3 += self.attrs['out_caco3'] * self.carbonation * self.amount
-            self.moisture += self.attrs['out_moisture'] * self.carbonation * self.amount
+            self['caoh2'] -= self.attrs['in_caoh2'] * self.carbonation * self.amount
+            self['caco3'] += self.attrs['out_caco3'] * self.carbonation * self.amount
+            self['moisture'] += self.attrs['out_moisture'] * self.carbonation * self.amount
 
     def calc_max_carbonation(self, ppm):
         """Return max kmoles CO2 uptake by structural concrete"""
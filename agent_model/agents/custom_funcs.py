@@ -103,4 +103,4 @@ def b2_sun(agent):
         time = datetime.datetime(1991, time.month, time.day, time.hour, time.minute, time.second)
     i_month = time.month + 12 * (time.year - 1991)
     i_hour = time.hour
-    agent.par = hourly_par_fraction[i_hour] * monthly_par[i_month]
+    agent['par'] = hourly_par_fraction[i_hour] * monthly_par[i_month]
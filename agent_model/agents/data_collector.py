@@ -1,4 +1,31 @@
+import numpy as np
+
+
 class AgentDataCollector():
+    """Record the state of an agent at each step, in preallocated columns
+
+    Each numeric series (e.g. ``flows['in']['atmo_o2']['greenhouse']``) is
+    assigned a column of ``table`` when the collector is created, and each
+    step writes a single row. ``get_data`` rebuilds the nested dicts of series
+    from views of the table, and only converts them to lists if
+    ``as_arrays`` is False.
+
+    ====================== ============== ===============
+          Attribute        Type               Description
+    ====================== ============== ===============
+    ``snapshot_attrs``     list           Fields returned by ``get_data``
+    ``series``             dict           ``{<field>: <column index, or nested dict of them>}``
+    ``kinds``              list           Output type of each column: float, int, bool or multiplier
+    ``table``              np.ndarray     Recorded values, (step, column); grown as needed
+    ``n_steps``            int            Number of steps recorded since the cache was cleared
+    ``events``             dict           ``{<event_type>: [<instances>]}``, not numeric so kept as lists
+    ====================== ============== ===============
+    """
+
+    # Order in which series are assigned columns and written by step()
+    SERIES_FIELDS = ['age', 'amount', 'storage', 'storage_ratios', 'growth', 'flows',
+                     'buffer', 'deprive', 'step_variable', 'event_multipliers']
+    INITIAL_CAPACITY = 128
 
     @classmethod
     def from_agent(cls, agent):
@@ -8,9 +35,9 @@ class AgentDataCollector():
         # Static Fields
         self.agent = agent
         self.name = agent.agent_type
-        self.age = []
-        self.amount = []
         self.snapshot_attrs = ['name', 'age', 'amount']
+        series = dict(age=None, amount=None)
+        kinds = {('amount', 'amount'): 'int' if isinstance(agent.amount, int) else 'float'}
         # Plant-Specific Fields
         for attr in ['lifetime', 'full_amount', 'reproduce']:
             if hasattr(self.agent, attr):
@@ -19,13 +46,14 @@ class AgentDataCollector():
         # Plants
         if agent.agent_class == 'plants':
             self.snapshot_attrs.append('growth')
-            self.growth = dict(par_factor=[], cu_factor=[], te_factor=[],
-                density_factor=[], crop_management_factor=[], growth_rate=[],
-                grown=[], agent_step_num=[])
+            series['growth'] = dict.fromkeys([
+                'par_factor', 'cu_factor', 'te_factor', 'density_factor',
+                'crop_management_factor', 'growth_rate', 'grown', 'agent_step_num'])
+            kinds[('growth', 'grown')] = 'bool'
         # Concrete
         if agent.agent_type == 'concrete':
             self.snapshot_attrs.append('growth')
-            self.growth = dict(carbonation_rate=[], carbonation=[])
+            series['growth'] = dict.fromkeys(['carbonation_rate', 'carbonation'])
         # Dynamic Fields
         for attr, attr_value in self.agent.attrs.items():
             if attr_value == 0:
@@ -33,17 +61,13 @@ class AgentDataCollector():
             # Storage
             if attr.startswith('char_capacity'):
                 if 'storage' not in self.snapshot_attrs:
-                    self.snapshot_attrs.append('storage')
-                    self.storage = {}
-                currency = attr.split('_', 2)[2]
-                self.storage[currency] = []
-                if 'storage_ratios' not in self.snapshot_attrs:
-                    self.snapshot_attrs.append('storage_ratios')
-                    self.storage_ratios = {}
-                self.storage_ratios[currency] = []
-                if 'capacity' not in self.snapshot_attrs:
-                    self.snapshot_attrs.append('capacity')
+                    self.snapshot_attrs += ['storage', 'storage_ratios', 'capacity']
+                    series['storage'] = {}
+                    series['storage_ratios'] = {}
                     self.capacity = {}
+                currency = attr.split('_', 2)[2]
+                series['storage'][currency] = None
+                series['storage_ratios'][currency] = None
                 self.capacity[currency] = dict(value=attr_value,
                                                unit=self.agent.attr_details[attr]['unit'])
                 currency_class = self.agent.currency_dict[currency]['class']
@@ -55,97 +79,150 @@ class AgentDataCollector():
             if attr.startswith(('in', 'out')):
                 if 'flows' not in self.snapshot_attrs:
                     self.snapshot_attrs.append('flows')
-                    self.flows = {'in': {}, 'out': {}}
+                    series['flows'] = {'in': {}, 'out': {}}
+                flows = series['flows']
                 prefix, currency = attr.split('_', 1)
                 currency_desc = self.agent.model.currency_dict.get(currency)
                 # Regular currencies
                 if currency_desc['type'] == 'currency':
-                    self.flows[prefix][currency] = {}
+                    flows[prefix][currency] = {}
                     for storage in self.agent.selected_storage[prefix][currency]:
-                        self.flows[prefix][currency][storage.agent_type] = []
+                        flows[prefix][currency][storage.agent_type] = None
                 # Currency classes
                 elif currency_desc['type'] == 'currency_class':
                     for class_currency in currency_desc['currencies']:
-                        self.flows[prefix][class_currency] = {}
+                        flows[prefix][class_currency] = {}
                     for storage in self.agent.selected_storage[prefix][currency]:
                         for class_currency in currency_desc['currencies']:
-                            self.flows[prefix][class_currency][storage.agent_type] = []
+                            flows[prefix][class_currency][storage.agent_type] = None
                 # Buffer
                 cr_buffer = self.agent.attr_details[attr]['criteria_buffer']
                 if cr_buffer:
                     if 'buffer' not in self.snapshot_attrs:
                         self.snapshot_attrs.append('buffer')
-                        self.buffer = {}
-                    self.buffer[attr] = []
+                        series['buffer'] = {}
+                    series['buffer'][attr] = None
                 # Deprive
                 deprive_value = self.agent.attr_details[attr]['deprive_value']
                 if deprive_value:
                     if 'deprive' not in self.snapshot_attrs:
                         self.snapshot_attrs.append('deprive')
-                        self.deprive = {}
-                    self.deprive[attr] = []
+                        series['deprive'] = {}
+                    series['deprive'][attr] = None
             # Events
             if attr.startswith('event'):
                 if 'events' not in self.snapshot_attrs:
                     self.snapshot_attrs += ['events', 'event_multipliers']
                     self.events = {}
-                    self.event_multipliers = {}
+                    series['event_multipliers'] = {}
                 event_type = attr.split('_', 1)[1]
                 self.events[event_type] = []
-                self.event_multipliers[event_type] = []
+                series['event_multipliers'][event_type] = None
+                kinds[('event_multipliers', event_type)] = 'multiplier'
         # Variation
         if 'initial_variable' in self.agent:
             self.snapshot_attrs.append('initial_variable')
             self.initial_variable = self.agent.initial_variable
         if 'step_variable' in self.agent:
             self.snapshot_attrs.append('step_variable')
-            self.step_variable = []
+            series['step_variable'] = None
+
+        # Assign columns in the order step() writes them
+        self.series = {}
+        self.kinds = []
+        def _assign(field, value, key):
+            if isinstance(value, dict):
+                return {k: _assign(field, v, k) for k, v in value.items()}
+            self.kinds.append(kinds.get((field, key), 'float'))
+            return len(self.kinds) - 1
+        for field in self.SERIES_FIELDS:
+            if field in series:
+                self.series[field] = _assign(field, series[field], field)
+        self.table = np.zeros((self.INITIAL_CAPACITY, len(self.kinds)))
+        self.n_steps = 0
+
+        # Keys read by step(), in column order
+        slots = self.agent.storage_slots
+        self._storage_slots = [slots[c] for c in series.get('storage', {})]
+        self._ratio_keys = [f'{c}_ratio' for c in series.get('storage_ratios', {})]
+        self._growth_fields = list(series.get('growth', {}))
+        self._flow_keys = [(prefix, currency, list(storages))
+                           for prefix, currencies in series.get('flows', {}).items()
+                           for currency, storages in currencies.items()]
+        self._buffer_keys = list(series.get('buffer', {}))
+        self._deprive_keys = list(series.get('deprive', {}))
+        self._step_variable = 'step_variable' in series
+        self._cohort = 'member_alive' in self.agent
 
     def step(self):
-        self.age.append(self.agent.age)
-        self.amount.append(self.agent.amount)
-        if 'storage' in self.snapshot_attrs:
-            for currency, record in self.storage.items():
-                record.append(self.agent[currency])
-            for currency, record in self.storage_ratios.items():
-                record.append(self.agent.model.storage_ratios[self.name][currency + '_ratio'])
-        if 'growth' in self.snapshot_attrs:
-            for field, record in self.growth.items():
-                record.append(getattr(self.agent, field))
-        if 'co2_scale' in self.snapshot_attrs:
-            for field, record in self.co2_scale.items():
-                record.append(self.agent.co2_scale[field])
-        if 'flows' in self.snapshot_attrs:
-            for prefix, currencies in self.flows.items():
-                for currency, storages in currencies.items():
-                    step_data = self.agent.step_exchange_buffer[prefix].get(currency)
-                    for agent, record in storages.items():
-                        value = 0 if not step_data else step_data.get(agent, 0)
-                        record.append(value)
-        if 'buffer' in self.snapshot_attrs:
-            for cr_id, record in self.buffer.items():
-                record.append(self.agent.buffer.get(cr_id, 0))
-        if 'deprive' in self.snapshot_attrs:
-            for currency, record in self.deprive.items():
-                record.append(self.agent.deprive.get(currency, 0))
-        if 'step_variable' in self.snapshot_attrs:
-            self.step_variable.append(self.agent.step_variable)
+        agent = self.agent
+        values = [agent.age, agent.amount]
+        if self._storage_slots:
+            balances = agent.model.storage_table.balances
+            row = agent.storage_row
+            values += [balances.item(row, slot) for slot in self._storage_slots]
+            ratios = agent.model.storage_ratios[self.name]
+            values += [ratios[key] for key in self._ratio_keys]
+        for field in self._growth_fields:
+            values.append(getattr(agent, field))
+        for prefix, currency, storages in self._flow_keys:
+            step_data = agent.step_exchange_buffer[prefix].get(currency)
+            if not step_data:
+                values += [0] * len(storages)
+            else:
+                values += [step_data.get(storage, 0) for storage in storages]
+        for cr_id in self._buffer_keys:
+            values.append(agent.buffer.get(cr_id, 0))
+        for attr in self._deprive_keys:
+            values.append(agent.deprive.get(attr, 0))
+        if self._step_variable:
+            if self._cohort:
+                # Cohorts: Mean step variable of living members
+                alive = agent.member_alive
+                values.append(agent.member_step_variable[alive].mean().item()
+                              if alive.any() else 1)
+            else:
+                values.append(agent.step_variable)
         if 'events' in self.snapshot_attrs:
             for event, record in self.events.items():
-                if event in self.agent.events:
-                    record.append(self.agent.events[event])
-                    self.event_multipliers[event].append(self.agent.event_multipliers[event])
+                if event in agent.events:
+                    record.append(agent.events[event])
+                    if event in agent.event_multipliers:
+                        multiplier = agent.event_multipliers[event]
+                    else:
+                        # Cohorts: Individual events, mean multiplier of living members
+                        multipliers = agent.member_event_multipliers[event]
+                        alive = agent.member_alive
+                        multiplier = multipliers[alive].mean().item() if alive.any() else 1
+                    values.append(multiplier)
                 else:
                     record.append([])
-                    self.event_multipliers[event].append('-')
+                    values.append(np.nan)  # Returned as '-'
+        n = self.n_steps
+        if n == self.table.shape[0]:
+            grown = np.zeros((2 * n, self.table.shape[1]))
+            grown[:n] = self.table
+            self.table = grown
+        self.table[n] = values
+        self.n_steps = n + 1
 
+    def get_data(self, step_range=None, fields=None, debug=False, clear_cache=False,
+                 as_arrays=False):
+        """Return all data (default) or specified range/fields.
 
-    def get_data(self, step_range=None, fields=None, debug=False, clear_cache=False):
-        """Return all data (default) or specified range/fields."""
-        if debug or fields == None:
+        Args:
+          step_range: tuple, (start, end) of steps since the cache was cleared
+          fields: list, fields to return; by default all
+          debug: bool, return all fields
+          clear_cache: bool, remove all recorded steps after returning them
+          as_arrays: bool, return each series as a float64 NumPy array, which
+                     is a view of ``table`` unless clear_cache is True. By
+                     default series are converted to lists.
+        """
+        if debug or fields is None:
             fields = self.snapshot_attrs
         else:
-            fields = [f for f in fields if self.snapshot_attrs.includes(f)]
+            fields = [f for f in fields if f in self.snapshot_attrs]
 
         def _copy_range(value, start, end):
             """Recursively segment lists"""
@@ -156,20 +233,39 @@ class AgentDataCollector():
             elif isinstance(value, dict):
                 return {k: _copy_range(v, start, end) for k, v in value.items()}
         if step_range is None:
-            start, end = 0, len(self.age)
+            start, end = 0, self.n_steps
         else:
             start, end = step_range
-        data = {f: _copy_range(getattr(self, f), start, end) for f in fields}
+        rows = self.table[:self.n_steps][start:end]
+
+        def _series(index):
+            """Recursively replace column indices with their values"""
+            if isinstance(index, dict):
+                return {k: _series(v) for k, v in index.items()}
+            column = rows[:, index]
+            if as_arrays:
+                return column.copy() if clear_cache else column
+            kind = self.kinds[index]
+            if kind == 'int':
+                # e.g. amount, which starts as a count of units but can
+                # become fractional; don't truncate it if it does
+                if np.array_equal(column, np.trunc(column)):
+                    return column.astype(int).tolist()
+                return column.tolist()
+            elif kind == 'bool':
+                return column.astype(bool).tolist()
+            elif kind == 'multiplier':
+                return ['-' if v != v else v for v in column.tolist()]
+            return column.tolist()
+        data = {}
+        for f in fields:
+            if f in self.series:
+                data[f] = _series(self.series[f])
+            else:
+                data[f] = _copy_range(getattr(self, f), start, end)
 
         if clear_cache:
-            def _clear(section):
-                """Recursively clear lists while retaining and dict structures and strs"""
-                if isinstance(section, list):
-                    return []
-                elif isinstance(section, dict):
-                    return {k: _clear(v) for k, v in section.items()}
-                else:
-                    return section
-            for field in self.snapshot_attrs:
-                setattr(self, field, _clear(getattr(self, field)))
+            self.n_steps = 0
+            if 'events' in self.snapshot_attrs:
+                self.events = {event: [] for event in self.events}
         return data
@@ -0,0 +1,107 @@
+r"""Describes the shared cache of precomputed growth curves.
+
+Step values and lifetime growth max values depend only on an agent's
+attribute details, lifetime, location and step length, so they are the same
+for every game which uses the same agent descriptions. They are cached here
+for the life of the process, keyed by a hash of everything they depend on.
+Only the ``MAX_ENTRIES`` most recently used entries are kept in memory.
+
+If the ``GROWTH_CACHE_DIR`` environment variable is set, entries are also
+saved there as ``.npy`` files and loaded memory-mapped, so that they can be
+shared between processes (e.g. workers) and kept between runs.
+"""
+
+import os
+import json
+import hashlib
+import pathlib
+from collections import OrderedDict
+
+import numpy as np
+
+# Change to invalidate entries saved by an earlier version of the growth functions
+CACHE_VERSION = 2
+# Entries kept in memory per process; the least recently used are dropped first
+MAX_ENTRIES = 1024
+
+
+class GrowthCache():
+    """Content-addressed cache of read-only NumPy arrays
+
+    ====================== ============== ===============
+          Attribute        Type               Description
+    ====================== ============== ===============
+    ``directory``          pathlib.Path   Where entries are saved, or None
+    ``entries``            OrderedDict    ``{<key>: np.ndarray}``, least recently used first
+    ``max_entries``        int            Maximum number of entries kept in memory
+    ``hits``               int            Number of values returned from the cache
+    ``misses``             int            Number of values which had to be calculated
+    ====================== ============== ===============
+    """
+
+    def __init__(self, directory=None, max_entries=MAX_ENTRIES):
+        self.directory = None
+        self.entries = OrderedDict()
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.set_directory(directory)
+
+    def set_directory(self, directory):
+        """Save entries to directory, or only keep them in memory if None"""
+        self.directory = pathlib.Path(directory) if directory else None
+        if self.directory is not None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def make_key(kind, **fields):
+        """Return a hash of a kind of value and everything it depends on"""
+        content = json.dumps(dict(version=CACHE_VERSION, kind=kind, **fields),
+                             sort_keys=True, default=str)
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    def get(self, key):
+        """Return a cached array, or None"""
+        value = self.entries.get(key)
+        if value is not None:
+            self.entries.move_to_end(key)
+        elif self.directory is not None:
+            path = self.directory / f'{key}.npy'
+            if path.exists():
+                value = np.load(path, mmap_mode='r')
+                self._add(key, value)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value):
+        """Add an array to the cache and return it, read-only"""
+        value = np.array(value, dtype=float)
+        value.setflags(write=False)
+        self._add(key, value)
+        if self.directory is not None:
+            # Write to a temporary file first so other processes never load
+            # a partial entry.
+            path = self.directory / f'{key}.npy'
+            tmp_path = self.directory / f'{key}.{os.getpid()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                np.save(f, value)
+            os.replace(tmp_path, path)
+        return value
+
+    def _add(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        """Remove all entries loaded in this process, and reset counters"""
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+
+growth_cache = GrowthCache(os.environ.get('GROWTH_CACHE_DIR'))
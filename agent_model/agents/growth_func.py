@@ -1,16 +1,47 @@
 r"""Describes Core Agent Types.
 """
 import numpy as np
-from scipy.stats import norm
-from sklearn.preprocessing import MinMaxScaler
 import functools
-from scipy.optimize import minimize
-from scipy.optimize import Bounds
+
+# scipy.optimize is only needed to solve for lifetime growth max values, so it
+# is imported by the optimize_* functions rather than here; importing scipy
+# takes longer than everything else in agent_model.
 
 np.seterr(over='ignore')
 
 
-# Caching norm.pdf() directly is not possible since
+def min_max_scale(y, min_value, max_value):
+    """Linearly rescale y so that it spans min_value to max_value
+
+    Uses the same arithmetic as sklearn's MinMaxScaler, so results are
+    identical. If y is 2-D, each row is scaled separately, and min_value and
+    max_value may be arrays with one value per row.
+    """
+    min_value = _column(min_value)
+    max_value = _column(max_value)
+    if np.any(min_value >= max_value):
+        raise ValueError("Minimum of desired feature range must be smaller than maximum.")
+    y_min = y.min(axis=-1, keepdims=True)
+    y_range = y.max(axis=-1, keepdims=True) - y_min
+    # Near-constant values aren't scaled
+    y_range[y_range < 10 * np.finfo(y_range.dtype).eps] = 1.0
+    scale = (max_value - min_value) / y_range
+    return y * scale + (min_value - y_min * scale)
+
+
+def _column(value):
+    """Return an array of values as a column, to apply one value per row"""
+    if np.ndim(value) == 1:
+        return np.asarray(value, dtype=float)[:, None]
+    return value
+
+
+def _add_noise(y, noise_factor):
+    """Add normally-distributed noise to each row of y, in place"""
+    y += np.random.normal(0, y.std(axis=-1, keepdims=True) / noise_factor, y.shape)
+
+
+# Caching the normal pdf directly is not possible since
 # x0 is a non-hashable numpy.ndarray.  x0 depends
 # on num_values, so we can create this helper function
 # and cache num_values, scale, and center instead.
@@ -25,7 +56,9 @@ def norm_pdf(num_values, scale, center, *, _cache={}):
     else:
         center = center or num_values // 2
         x0 = np.linspace(0, 1, num_values)
-        y = norm.pdf(x0, x0[center], scale)
+        # Same arithmetic as scipy.stats.norm.pdf
+        z = (x0 - x0[center]) / scale
+        y = np.exp(-z**2 / 2.0) / np.sqrt(2 * np.pi) / scale
         _cache[(num_values, scale, center)] = y
     return y
 
@@ -57,15 +90,14 @@ def get_bell_curve(num_values, min_value, max_value, scale=0.1, center=None, inv
     assert max_value is not None
     assert scale is not None
     y = norm_pdf(num_values, scale, center)
-    y = MinMaxScaler((min_value, max_value)).fit_transform(y.reshape(-1, 1)).reshape(num_values)
+    y = min_max_scale(y, min_value, max_value)
     if invert:
         y = -1 * y
-        y = y + max_value + min_value
+        y = y + _column(max_value) + _column(min_value)
     if noise:
-        noise = np.random.normal(0, y.std() / noise_factor, num_values)
-        y += noise
+        _add_noise(y, noise_factor)
     if clip:
-        y = np.clip(y, min_value, max_value)
+        y = np.clip(y, _column(min_value), _column(max_value))
     return y
 
 
@@ -96,25 +128,28 @@ def get_clipped_bell_curve(num_values, min_value, max_value, scale=0.1, factor=2
     assert max_value is not None
     assert scale is not None
     y = norm_pdf(num_values, scale, center)
-    y = MinMaxScaler((min_value, max_value * factor)).fit_transform(y.reshape(-1, 1)).reshape(num_values)
+    min_value = _column(min_value)
+    max_value = _column(max_value)
+    y = min_max_scale(y, min_value, max_value * factor)
     y = np.clip(y, min_value, max_value)
     if invert:
         y = -1 * y
         y = y + max_value + min_value
     if noise:
-        noise = np.random.normal(0, y.std() / noise_factor, num_values)
-        y += noise
+        _add_noise(y, noise_factor)
     return y
 
 
 def optimize_bell_curve_mean(mean_value, num_values, center, min_value, invert,
                              noise, noise_factor=10, **kwargs):
     del kwargs
+    from scipy.optimize import minimize
     _get_bell_curve = functools.partial(get_bell_curve, num_values=num_values, center=center,
                                         min_value=min_value, invert=invert, noise=noise,
                                         noise_factor=noise_factor)
 
-    def _loss(max_value):
+    def _loss(args):
+        max_value, = args
         y = _get_bell_curve(max_value=max_value)
         rmse = np.sqrt(
             (np.abs(mean_value - np.mean(y)) +
@@ -126,6 +161,30 @@ def optimize_bell_curve_mean(mean_value, num_values, center, min_value, invert,
     return {'max_value': res.x[0]}
 
 
+def solve_bell_curve_mean(mean_value, num_values, center, min_value, invert,
+                          noise=False, **kwargs):
+    """Return the max_value of a bell curve with a given mean
+
+    Deterministic replacement for optimize_bell_curve_mean, which minimizes
+    the same loss. The curve is min_value plus (max_value - min_value) times
+    a fixed shape, so the loss is piecewise-linear in max_value and its
+    minimum can be found exactly. Noise has a mean of zero and is ignored.
+
+    Returns:
+      dict, with 'max_value'
+    """
+    del noise, kwargs
+    shape = get_bell_curve(num_values, 0.0, 1.0, center=center, invert=invert)
+    lower = max(1e-8, mean_value)
+    if shape[0] + shape[-1] < shape.mean():
+        max_value = min_value + (mean_value - min_value) / shape.mean()
+    else:
+        # Raising max_value moves the ends further from min_value than it
+        # brings the mean closer to mean_value.
+        max_value = lower
+    return {'max_value': float(np.clip(max_value, lower, 1e8))}
+
+
 # this function manually caches some calculations,
 # similarly to the norm_pdf function above
 def calc_y(num_values, width, center, steepness, *, _cache={}):
@@ -165,18 +224,18 @@ def get_sigmoid_curve(num_values, min_value, max_value, steepness=1.0, center=No
     assert max_value is not None
     assert steepness is not None
     y = calc_y(num_values, width, center, steepness)
-    y = MinMaxScaler((min_value, max_value)).fit_transform(y.reshape(-1, 1)).reshape(num_values)
+    y = min_max_scale(y, min_value, max_value)
     if noise:
-        noise = np.random.normal(0, y.std() / noise_factor, num_values)
-        y += noise
+        _add_noise(y, noise_factor)
     if clip:
-        y = np.clip(y, min_value, max_value)
+        y = np.clip(y, _column(min_value), _column(max_value))
     return y
 
 
 def optimize_sigmoid_curve_mean(mean_value, num_values, center, min_value,
                                 noise, noise_factor=10.0, **kwargs):
     del kwargs
+    from scipy.optimize import minimize, Bounds
     _get_sigmoid_curve = functools.partial(get_sigmoid_curve, num_values=num_values, center=center,
                                            min_value=min_value, noise=noise,
                                            noise_factor=noise_factor)
@@ -192,6 +251,25 @@ def optimize_sigmoid_curve_mean(mean_value, num_values, center, min_value,
     return {'steepness': res.x[0], 'max_value': res.x[1]}
 
 
+def solve_sigmoid_curve_mean(mean_value, num_values, center, min_value,
+                             noise=False, **kwargs):
+    """Return the max_value of a sigmoid curve with a given mean
+
+    Deterministic replacement for optimize_sigmoid_curve_mean. Steepness is
+    kept at the optimizer's starting point (its upper bound), where it stays
+    for all plants in agent_desc, and max_value is solved exactly for that
+    curve. Noise has a mean of zero and is ignored.
+
+    Returns:
+      dict, with 'steepness' and 'max_value'
+    """
+    del noise, kwargs
+    steepness = num_values / 2
+    shape = get_sigmoid_curve(num_values, 0.0, 1.0, steepness=steepness, center=center)
+    max_value = min_value + (mean_value - min_value) / shape.mean()
+    return {'steepness': steepness, 'max_value': float(np.clip(max_value, 1e-10, 1e10))}
+
+
 def get_log_curve(num_values, max_value, min_value, zero_value=1e-2, noise=False,
                   noise_factor=10.0, clip=False, **kwargs):
     """TODO
@@ -215,13 +293,12 @@ def get_log_curve(num_values, max_value, min_value, zero_value=1e-2, noise=False
     assert num_values
     assert min_value is not None
     assert max_value is not None
-    zero_value = zero_value if zero_value < max_value else max_value * zero_value
-    y = np.geomspace(zero_value, max_value - min_value, num_values) + min_value
+    zero_value = np.where(zero_value < max_value, zero_value, max_value * zero_value)
+    y = np.geomspace(zero_value, max_value - min_value, num_values, axis=-1) + _column(min_value)
     if noise:
-        noise = np.random.normal(0, y.std() / noise_factor, num_values)
-        y += noise
+        _add_noise(y, noise_factor)
     if clip:
-        y = np.clip(y, min_value, max_value)
+        y = np.clip(y, _column(min_value), _column(max_value))
     return y
 
 
@@ -247,12 +324,11 @@ def get_linear_curve(num_values, max_value, min_value, noise=False, noise_factor
     assert num_values
     assert min_value is not None
     assert max_value is not None
-    y = np.linspace(min_value, max_value, num_values)
+    y = np.linspace(min_value, max_value, num_values, axis=-1)
     if noise:
-        noise = np.random.normal(0, y.std() / noise_factor, num_values)
-        y += noise
+        _add_noise(y, noise_factor)
     if clip:
-        y = np.clip(y, min_value, max_value)
+        y = np.clip(y, _column(min_value), _column(max_value))
     return y
 
 
@@ -282,14 +358,14 @@ def get_switch_curve(num_values, min_value, max_value, min_threshold, max_thresh
     assert max_value is not None
     assert min_threshold is not None
     assert max_threshold is not None
-    y = np.zeros(num_values) + min_value
-    y[min_threshold:max_threshold] = max_value
+    y = np.zeros(num_values) + _column(min_value)
+    y[..., min_threshold:max_threshold] = _column(max_value)
     if noise:
-        noise = np.random.normal(0, y.std() / noise_factor,
-                                 min(max_threshold, y.shape[0]) - min_threshold)
-        y[min_threshold:max_threshold] += noise
+        switched = y[..., min_threshold:max_threshold]
+        switched += np.random.normal(0, y.std(axis=-1, keepdims=True) / noise_factor,
+                                     switched.shape)
     if clip:
-        y = np.clip(y, min_value, max_value)
+        y = np.clip(y, _column(min_value), _column(max_value))
     return y
 
 
@@ -308,7 +384,11 @@ def get_growth_values(agent_value, growth_type, **kwargs):
     """
     assert growth_type
     assert agent_value is not None
-    if kwargs.get('max_value', 0.0) <= 0:
+    max_value = kwargs.get('max_value', 0.0)
+    if np.ndim(agent_value) or np.ndim(max_value):
+        # Batch of curves, e.g. from get_daily_growth_values
+        kwargs['max_value'] = np.where(np.asarray(max_value) > 0, max_value, agent_value)
+    elif max_value <= 0:
         kwargs['max_value'] = agent_value
     if growth_type in ['linear', 'lin']:
         return get_linear_curve(**kwargs)
@@ -324,3 +404,42 @@ def get_growth_values(agent_value, growth_type, **kwargs):
         return get_switch_curve(**kwargs)
     else:
         raise ValueError("Unknown growth function type '{}'.".format(growth_type))
+
+
+def get_daily_growth_values(day_values, growth_type, daily_min_value=None,
+                            max_value_factor=None, **kwargs):
+    """Replace each day of step values with a daily growth curve
+
+    All days are calculated together: each row of day_values becomes a curve
+    with the same mean, starting at ``daily_min_value`` times the mean if
+    given, or else at the row's minimum value (0 for a constant row). Rows
+    which would start at their mean are left constant.
+
+    Args:
+      day_values: np.ndarray, (days, hours) matrix of step values
+      growth_type: str, see get_growth_values
+      daily_min_value: float, start of each curve as a fraction of its mean
+      max_value_factor: float, peak of each curve as a multiple of its mean;
+                        by default the growth function's
+      kwargs: Dict, passed to the growth function, e.g. center or scale
+
+    Returns:
+      np.ndarray, the same shape as day_values
+    """
+    num_values = day_values.shape[1]
+    agent_values = day_values.mean(axis=1)
+    if daily_min_value:
+        start_values = agent_values * daily_min_value
+    else:
+        daily_min = day_values.min(axis=1)
+        daily_max = day_values.max(axis=1)
+        start_values = np.where(daily_min < daily_max, daily_min, 0.0)
+    result = np.repeat(agent_values[:, None], num_values, axis=1)
+    curved = start_values != agent_values
+    if curved.any():
+        if max_value_factor:
+            kwargs['max_value'] = agent_values[curved] * max_value_factor
+        result[curved] = get_growth_values(agent_values[curved], growth_type,
+                                           num_values=num_values,
+                                           min_value=start_values[curved], **kwargs)
+    return result
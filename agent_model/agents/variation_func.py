@@ -1,4 +1,11 @@
-def get_variable(gen, upper, lower, distribution, stdev_range=None):
+def get_variable(gen, upper, lower, distribution, stdev_range=None, size=None):
+    """Return a random variable centered about 1
+
+    Args:
+      gen: np.random.RandomState
+      size: int, if given return an array of that many variables, drawn in the
+            same order as repeated single calls
+    """
     if distribution == 'normal':
         # TODO: Use skewed normal distribution instead
         max = 1 + upper
@@ -8,11 +15,11 @@ def get_variable(gen, upper, lower, distribution, stdev_range=None):
             stdev = (max - mean)/stdev_range
         else:
             stdev = (max - mean) / 6    # Upper/lower encompases 99.7% of cases
-        return gen.normal(mean, stdev)
+        return gen.normal(mean, stdev, size)
     elif distribution == 'exponential':
         if upper > 0:
-            delta = gen.exponential(upper / 3)
+            delta = gen.exponential(upper / 3, size)
             return 1 + delta
         elif lower > 0:
-            delta = gen.exponential(lower / 3)
+            delta = gen.exponential(lower / 3, size)
             return 1 - delta
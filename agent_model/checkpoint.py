@@ -0,0 +1,128 @@
+r"""Binary checkpoint format for saved models.
+
+``AgentModel.save`` returns a dict in which NumPy arrays (step values and
+the Mersenne Twister state) are converted to lists, which makes saves of
+plant-heavy configs large and slow to write and parse. A checkpoint keeps
+the same data, but stores each array as a raw little-endian buffer, and
+everything else as JSON:
+
+====================== ===============
+        Bytes             Description
+====================== ===============
+4                      ``MAGIC``
+1                      Format version
+3                      Reserved
+8                      Content length, little-endian uint64
+8                      Arrays length, little-endian uint64
+content length         Content, utf-8 JSON
+arrays length          Arrays, utf-8 JSON, padded to a multiple of ``ALIGN``
+remainder              Data of the arrays, each padded to a multiple of ``ALIGN``
+====================== ===============
+
+The content is the saved data with arrays replaced by ``{'__array__':
+<index>}`` and datetimes by ``{'__datetime__': <iso format>}``. Arrays is
+``[{'dtype': '<f8', 'shape': [...], 'offset': int}]``, where offsets are
+in bytes from the start of the data. Because arrays are aligned within the
+file, a checkpoint can be loaded memory-mapped; arrays are then read-only
+views of the file, and step values are only read from disk as they are
+used.
+"""
+
+import json
+import mmap
+import struct
+import datetime
+
+import numpy as np
+
+MAGIC = b'SIMC'
+FORMAT_VERSION = 1
+ALIGN = 8
+_PREFIX = struct.Struct('<4sB3xQQ')
+
+
+def _padding(n):
+    return -n % ALIGN
+
+
+def dump_checkpoint(data):
+    """Return data as a checkpoint
+
+    Args:
+      data: dict, e.g. model_data, agent_data and init_type of an
+            ``AgentModelInitializer``. May contain NumPy arrays and
+            datetimes, as well as JSON types; as in JSON, tuples are
+            stored as lists.
+
+    Returns:
+      bytes
+    """
+    specs = []
+    chunks = []
+    offset = 0
+
+    def _pack(value):
+        nonlocal offset
+        if isinstance(value, np.ndarray):
+            chunk = np.ascontiguousarray(value, value.dtype.newbyteorder('<')).tobytes()
+            specs.append(dict(dtype=value.dtype.newbyteorder('<').str,
+                              shape=list(value.shape), offset=offset))
+            chunks.append(chunk + bytes(_padding(len(chunk))))
+            offset += len(chunks[-1])
+            return {'__array__': len(specs) - 1}
+        if isinstance(value, datetime.datetime):
+            return {'__datetime__': value.isoformat()}
+        if isinstance(value, np.generic):
+            return value.item()
+        raise TypeError(f'Object of type {type(value).__name__} can\'t be checkpointed')
+
+    content = json.dumps(data, default=_pack).encode('utf-8')
+    arrays = json.dumps(specs).encode('utf-8')
+    arrays += b' ' * _padding(_PREFIX.size + len(content) + len(arrays))
+    return (_PREFIX.pack(MAGIC, FORMAT_VERSION, len(content), len(arrays))
+            + content + arrays + b''.join(chunks))
+
+
+def load_checkpoint(source, mmap_file=False):
+    """Return the data of a checkpoint
+
+    Args:
+      source: bytes, or the path of a checkpoint file
+      mmap_file: bool, if source is a path, map the file into memory rather
+                 than reading it
+
+    Returns:
+      dict, as passed to dump_checkpoint. Arrays are read-only views of the
+      checkpoint.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        buffer = source
+    elif mmap_file:
+        with open(source, 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    else:
+        with open(source, 'rb') as f:
+            buffer = f.read()
+    magic, version, content_length, arrays_length = _PREFIX.unpack_from(buffer)
+    if magic != MAGIC:
+        raise ValueError('Not a model checkpoint')
+    if version > FORMAT_VERSION:
+        raise ValueError(f'Unsupported checkpoint version: {version}')
+    content_start = _PREFIX.size
+    arrays_start = content_start + content_length
+    start = arrays_start + arrays_length
+    specs = json.loads(bytes(buffer[arrays_start:start]))
+
+    def _unpack(obj):
+        if len(obj) == 1:
+            if '__array__' in obj:
+                spec = specs[obj['__array__']]
+                dtype = np.dtype(spec['dtype'])
+                count = int(np.prod(spec['shape'], dtype=np.int64))
+                array = np.frombuffer(buffer, dtype, count, start + spec['offset'])
+                return array.reshape(spec['shape'])
+            if '__datetime__' in obj:
+                return datetime.datetime.fromisoformat(obj['__datetime__'])
+        return obj
+
+    return json.loads(bytes(buffer[content_start:arrays_start]), object_hook=_unpack)
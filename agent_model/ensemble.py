@@ -0,0 +1,357 @@
+r"""Run many seeds of one config and aggregate them, step by step.
+
+Each member of an ensemble is one run of the config with a different
+``seed``, so ``global_entropy``, ``agent_variation`` and ``agent_events``
+make the runs differ. Members run in a ``ProcessPoolExecutor`` without data
+collection, and only return a few metrics per step; the ``Ensemble`` adds
+each member to running totals as it arrives, and percentiles are estimated
+with the P² algorithm, so the models and their full histories are never
+held in the parent process, and its memory doesn't grow with the number of
+members.
+
+Usage:
+  python -m agent_model.ensemble data_files/config_1hg_sam.json --seeds 0-99 \
+      --steps 720 --entropy 1 --workers 4 --output ensemble.json
+"""
+
+import copy
+import json
+import argparse
+import warnings
+from itertools import repeat
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from agent_model.agent_model import AgentModel
+
+
+def metric_names(model):
+    """Return the names of the metrics sampled each step, and their indices
+
+    Metrics are the balance of each storage currency, ``storage.<agent>.<currency>``,
+    and the amount of each agent, ``amount.<agent_type>``.
+
+    Returns:
+      tuple, (names, indices of storage metrics in the flattened balances)
+    """
+    table = model.storage_table
+    n_slots = table.balances.shape[1]
+    names = []
+    indices = []
+    for row, storage_id in enumerate(table.storage_ids):
+        for currency, slot in table.slots[row].items():
+            names.append(f'storage.{storage_id}.{currency}')
+            indices.append(row * n_slots + slot)
+    names += [f'amount.{agent.agent_type}' for agent in model.scheduler.agents]
+    return names, np.array(indices, dtype=int)
+
+
+def run_member(config, seed, n_steps, global_entropy=None):
+    """Run one member of an ensemble and return its metrics
+
+    Args:
+      config: dict, a SIMOC config
+      seed: int, seed of the member
+      n_steps: int, most steps to run
+      global_entropy: float, overrides the config's if not None
+
+    Returns:
+      dict, with ``seed``, ``names``, ``values`` (n_steps, metric) with NaN
+      after the model terminated, ``n_steps`` (steps run),
+      ``termination_reason`` and ``cause_of_death`` ``{<agent_type>: str}``
+    """
+    config = copy.deepcopy(config)
+    config['seed'] = seed
+    if global_entropy is not None:
+        config['global_entropy'] = global_entropy
+    # Growth noise, if any, is drawn from the global generator; seed it for
+    # this member and restore the caller's state afterwards.
+    global_state = np.random.get_state()
+    np.random.seed(seed)
+    try:
+        return _run_member(config, seed, n_steps)
+    finally:
+        np.random.set_state(global_state)
+
+
+def _run_member(config, seed, n_steps):
+    model = AgentModel.from_config(config, data_collection=False)
+    names, indices = metric_names(model)
+    agents = model.scheduler.agents
+    values = np.full((n_steps, len(names)), np.nan)
+    n_storage = len(indices)
+    steps_run = 0
+    for step in range(n_steps):
+        model.step()
+        if model.is_terminated:
+            break
+        row = values[step]
+        row[:n_storage] = model.storage_table.balances.take(indices)
+        row[n_storage:] = [agent.amount for agent in agents]
+        steps_run += 1
+    return dict(seed=seed, names=names, values=values, n_steps=steps_run,
+                termination_reason=model.termination_reason,
+                cause_of_death={agent.agent_type: agent.cause_of_death for agent in agents
+                                if getattr(agent, 'cause_of_death', None)})
+
+
+class StreamingPercentiles():
+    """Estimate percentiles of each cell of an array from a stream of arrays
+
+    Uses the P² algorithm (Jain & Chlamtac, 1985): for each percentile and
+    cell, five markers track the minimum, the percentile, the maximum and
+    two points between, and are adjusted as each value arrives. Memory
+    depends on the shape of the arrays, not on how many are added. Until a
+    cell has five values, its percentiles are exact. NaN values are skipped.
+
+    ====================== ============== ===============
+          Attribute        Type               Description
+    ====================== ============== ===============
+    ``percentiles``        np.ndarray     Percentiles to estimate, 0-100
+    ``count``              np.ndarray     Number of values added to each cell
+    ``heights``            np.ndarray     Marker heights, (percentile, *shape, 5)
+    ``positions``          np.ndarray     Marker positions, from 1, (percentile, *shape, 5)
+    ====================== ============== ===============
+    """
+
+    def __init__(self, shape, percentiles):
+        self.percentiles = np.array(percentiles, dtype=float)
+        n = len(self.percentiles)
+        self.count = np.zeros(shape, dtype=int)
+        self.heights = np.full((n, *shape, 5), np.nan)
+        self.positions = np.broadcast_to(np.arange(1., 6.), (n, *shape, 5)).copy()
+        p = self.percentiles[:, None] / 100
+        self._increments = np.hstack([0 * p, p / 2, p, (1 + p) / 2, 1 + 0 * p])
+
+    def add(self, values):
+        """Add an array of the shape given to __init__"""
+        valid = ~np.isnan(values)
+        # The first five values of a cell are kept as the markers, in order
+        filling = valid & (self.count < 5)
+        if filling.any():
+            heights = self.heights[:, filling]
+            heights[:, np.arange(heights.shape[1]), self.count[filling]] = values[filling]
+            heights.sort(axis=-1)
+            self.heights[:, filling] = heights
+        updating = valid & (self.count >= 5)
+        self.count[valid] += 1
+        if updating.any():
+            self._update(updating, values[updating])
+
+    def _update(self, cells, x):
+        q = self.heights[:, cells]
+        n = self.positions[:, cells]
+        count = self.count[cells]
+        q[..., 0] = np.minimum(q[..., 0], x)
+        q[..., 4] = np.maximum(q[..., 4], x)
+        k = (x[:, None] >= q[..., 1:4]).sum(axis=-1)
+        n += np.arange(5) > k[..., None]
+        # Desired positions of the markers after count values
+        desired = 1 + (count[:, None] - 1) * self._increments[:, None, :]
+        for i in range(1, 4):
+            d = desired[..., i] - n[..., i]
+            move = (((d >= 1) & (n[..., i + 1] - n[..., i] > 1))
+                    | ((d <= -1) & (n[..., i - 1] - n[..., i] < -1)))
+            s = np.sign(d)
+            q0, q1, q2 = q[..., i - 1], q[..., i], q[..., i + 1]
+            n0, n1, n2 = n[..., i - 1], n[..., i], n[..., i + 1]
+            with np.errstate(invalid='ignore', divide='ignore'):
+                parabolic = q1 + s / (n2 - n0) * ((n1 - n0 + s) * (q2 - q1) / (n2 - n1)
+                                                  + (n2 - n1 - s) * (q1 - q0) / (n1 - n0))
+                linear = q1 + s * np.where(s > 0, (q2 - q1) / (n2 - n1), (q0 - q1) / (n0 - n1))
+            height = np.where((q0 < parabolic) & (parabolic < q2), parabolic, linear)
+            q[..., i] = np.where(move, height, q1)
+            n[..., i] += np.where(move, s, 0)
+        self.heights[:, cells] = q
+        self.positions[:, cells] = n
+
+    def estimate(self):
+        """Return the estimated percentiles, (percentile, *shape)
+
+        Cells without values are NaN.
+        """
+        estimates = self.heights[..., 2].copy()
+        estimates[self.percentiles == 0] = self.heights[self.percentiles == 0, ..., 0]
+        estimates[self.percentiles == 100] = self.heights[self.percentiles == 100, ..., 4]
+        exact = (self.count > 0) & (self.count < 5)
+        if exact.any():
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', RuntimeWarning)
+                for j, p in enumerate(self.percentiles):
+                    estimates[j][exact] = np.nanpercentile(
+                        self.heights[j][exact], p, axis=-1)
+        estimates[:, self.count == 0] = np.nan
+        return estimates
+
+
+class Ensemble():
+    """Per-step aggregates of the members of an ensemble
+
+    Members can be added in any order, but are added in seed order by
+    ``run_ensemble`` so that the sums (and so the means) don't depend on
+    which process finished first. Percentiles are estimated as members are
+    added, with ``StreamingPercentiles``, and are exact for up to five
+    members.
+
+    ====================== ============== ===============
+          Attribute        Type               Description
+    ====================== ============== ===============
+    ``names``              list           Names of the metrics
+    ``n_steps``            int            Steps per member
+    ``percentiles``        tuple          Percentiles to report, e.g. (5, 50, 95)
+    ``n_members``          int            Number of members added
+    ``totals``             np.ndarray     Sum of each metric over running members, (step, metric)
+    ``running``            np.ndarray     Number of members not yet terminated, (step,)
+    ``alive``              np.ndarray     Number of members in which each agent is alive, (step, agent)
+    ``termination``        dict           ``{<reason>: <number of members>}``
+    ``deaths``             dict           ``{<agent_type>: {<cause of death>: <number of members>}}``
+    ``quantiles``          object         ``StreamingPercentiles`` of each metric, or None
+    ====================== ============== ===============
+    """
+
+    def __init__(self, names, n_steps, percentiles=(5, 50, 95)):
+        self.names = names
+        self.n_steps = n_steps
+        self.percentiles = tuple(percentiles)
+        self.n_members = 0
+        self.totals = np.zeros((n_steps, len(names)))
+        self.running = np.zeros(n_steps, dtype=int)
+        self._amounts = [i for i, name in enumerate(names) if name.startswith('amount.')]
+        self.alive = np.zeros((n_steps, len(self._amounts)), dtype=int)
+        self.termination = defaultdict(int)
+        self.deaths = defaultdict(lambda: defaultdict(int))
+        self.quantiles = None
+        if self.percentiles:
+            self.quantiles = StreamingPercentiles((n_steps, len(names)), self.percentiles)
+
+    def add(self, member):
+        """Add the result of run_member"""
+        if member['names'] != self.names:
+            raise ValueError(f"Member {member['seed']} has different metrics")
+        values = member['values']
+        n = member['n_steps']
+        self.totals[:n] += values[:n]
+        self.running[:n] += 1
+        self.alive[:n] += values[:n, self._amounts] > 0
+        self.termination[member['termination_reason']] += 1
+        for agent_type, cause in member['cause_of_death'].items():
+            self.deaths[agent_type][cause] += 1
+        if self.quantiles is not None:
+            self.quantiles.add(values)
+        self.n_members += 1
+
+    def mean(self):
+        """Return the mean of each metric over running members, (step, metric)"""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self.totals / self.running[:, None]
+
+    def summary(self):
+        """Return aggregates as a JSON-serializable dict
+
+        Returns:
+          dict, ``{'n_members', 'n_steps', 'running': [<per step>],
+          'metrics': {<name>: {'mean': [<per step>], 'p5': [...], ...}},
+          'alive': {<agent_type>: [<per step>]}, 'termination', 'deaths'}``.
+          Steps which no member reached are None.
+        """
+        def _series(column):
+            return [None if v != v else v for v in column.tolist()]
+        stats = {'mean': self.mean()}
+        if self.quantiles is not None:
+            for p, values in zip(self.percentiles, self.quantiles.estimate()):
+                stats[f'p{p}'] = values
+        metrics = {name: {stat: _series(values[:, i]) for stat, values in stats.items()}
+                   for i, name in enumerate(self.names)}
+        alive = {self.names[i].split('.', 1)[1]: self.alive[:, j].tolist()
+                 for j, i in enumerate(self._amounts)}
+        return dict(n_members=self.n_members, n_steps=self.n_steps,
+                    running=self.running.tolist(), metrics=metrics, alive=alive,
+                    termination=dict(self.termination),
+                    deaths={k: dict(v) for k, v in self.deaths.items()})
+
+
+def run_ensemble(config, seeds, n_steps, global_entropy=None, percentiles=(5, 50, 95),
+                 max_workers=None):
+    """Run a member for each seed and return their Ensemble
+
+    Args:
+      config: dict, a SIMOC config
+      seeds: iterable of int
+      n_steps: int, most steps to run each member
+      global_entropy: float, overrides the config's if not None
+      percentiles: tuple, percentiles to report
+      max_workers: int, number of processes; 0 to run serially in this process
+    """
+    seeds = list(seeds)
+    args = (repeat(config), seeds, repeat(n_steps), repeat(global_entropy))
+    ensemble = None
+    def _add(member):
+        nonlocal ensemble
+        if ensemble is None:
+            ensemble = Ensemble(member['names'], n_steps, percentiles)
+        ensemble.add(member)
+    if max_workers == 0:
+        for member in map(run_member, *args):
+            _add(member)
+    else:
+        with ProcessPoolExecutor(max_workers) as pool:
+            for member in pool.map(run_member, *args):
+                _add(member)
+    return ensemble
+
+
+def check_determinism(config, seed, n_steps, global_entropy=None):
+    """Return True if a seed gives the same result in this process and another"""
+    serial = run_member(config, seed, n_steps, global_entropy)
+    with ProcessPoolExecutor(1) as pool:
+        parallel = pool.submit(run_member, config, seed, n_steps, global_entropy).result()
+    return (np.array_equal(serial['values'], parallel['values'], equal_nan=True)
+            and all(serial[k] == parallel[k] for k in serial if k != 'values'))
+
+
+def _parse_seeds(value):
+    """Parse e.g. '0-99' or '1,5,7' into a list of seeds"""
+    seeds = []
+    for part in value.split(','):
+        if '-' in part:
+            start, end = part.split('-')
+            seeds += range(int(start), int(end) + 1)
+        else:
+            seeds.append(int(part))
+    return seeds
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('config', help='path to a SIMOC config (.json)')
+    parser.add_argument('--seeds', type=_parse_seeds, default=list(range(10)),
+                        help="e.g. '0-99' or '1,5,7' (default: 0-9)")
+    parser.add_argument('--steps', type=int, required=True, help='most steps per member')
+    parser.add_argument('--entropy', type=float, help='override global_entropy')
+    parser.add_argument('--percentiles', type=lambda v: tuple(float(p) for p in v.split(',')),
+                        default=(5, 50, 95), help='default: 5,50,95')
+    parser.add_argument('--workers', type=int, help='processes; 0 to run serially')
+    parser.add_argument('--output', help='write the summary as JSON (default: stdout)')
+    parser.add_argument('--check', action='store_true',
+                        help='first check that the first seed runs the same in another process')
+    args = parser.parse_args(argv)
+
+    with open(args.config) as f:
+        config = json.load(f)
+    if args.check and not check_determinism(config, args.seeds[0], args.steps, args.entropy):
+        parser.exit(1, f'Seed {args.seeds[0]} is not deterministic across processes\n')
+    percentiles = tuple(int(p) if p == int(p) else p for p in args.percentiles)
+    ensemble = run_ensemble(config, args.seeds, args.steps, args.entropy, percentiles,
+                            args.workers)
+    summary = json.dumps(ensemble.summary())
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(summary)
+    else:
+        print(summary)
+
+
+if __name__ == '__main__':
+    main()
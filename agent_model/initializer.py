@@ -5,6 +5,7 @@ import pathlib
 from datetime import datetime
 
 from agent_model.exceptions import AgentModelInitializationError
+from agent_model.checkpoint import dump_checkpoint, load_checkpoint
 from agent_model.parse_data_files import parse_currency_desc, parse_agent_desc, \
                                          parse_agent_events, parse_agent_conn, merge_json
 
@@ -35,6 +36,9 @@ class AgentModelInitializer():
                   AgentModelInitialzier
       serialize: Converts this to a json-serializable dict
       deserialize: Converts from dict back into AgentModelInitializer
+      to_checkpoint: Converts this to a binary checkpoint
+      from_checkpoint: Converts from a binary checkpoint back into
+                       AgentModelInitializer
 
     Raises:
       AgentModelInitializationError
@@ -56,6 +60,7 @@ class AgentModelInitializer():
             location=_DEFAULT_LOCATION,
             minutes_per_step=60,
             start_time=start_time,
+            snapshot_ratios=False,
         )
 
     @classmethod
@@ -203,11 +208,12 @@ class AgentModelInitializer():
             location=model.location,
             minutes_per_step=model.minutes_per_step,
             currency_dict=model.currency_dict,
+            snapshot_ratios=model.snapshot_ratios,
             # Status (generated)
             random_state=model.random_state.get_state(),
             time=model.time.seconds,  # int of seconds
             steps=model.scheduler.steps,
-            storage_ratios=model.storage_ratios,
+            storage_ratios={k: dict(v) for k, v in model.storage_ratios.items()},
             step_records_buffer=model.step_records_buffer,
             is_terminated=model.is_terminated,
             termination_reason=model.termination_reason,
@@ -256,14 +262,21 @@ class AgentModelInitializer():
                 grown=agent.grown,
             )
             instance = {**instance, **plant_fields}
+        # Cohorts
+        if 'member_alive' in agent:
+            instance['members'] = dict(
+                alive=agent.member_alive.tolist(),
+                attr_factors={k: v.tolist() for k, v in agent.member_attr_factors.items()},
+                step_variable=agent.member_step_variable.tolist(),
+                event_multipliers={k: v.tolist() for k, v in agent.member_event_multipliers.items()},
+                deprive={k: v.tolist() for k, v in agent.member_deprive.items()},
+            )
         # Step values
         for currency, step_values in agent.step_values.items():
             instance['step_values'][currency] = step_values
         # Storage balances
-        for item in agent.__dict__.keys():
-            if item in agent.currency_dict:
-                if agent.currency_dict[item]['type'] == 'currency':
-                    instance[item] = agent[item]
+        for currency in agent.storage_slots:
+            instance[currency] = agent[currency]
 
         return dict(agent_desc=agent_desc, instance=instance)
 
@@ -302,3 +315,17 @@ class AgentModelInitializer():
 
         return init
 
+    def to_checkpoint(self):
+        """Return a binary checkpoint; arrays are stored as raw buffers"""
+        return dump_checkpoint(dict(model_data=self.model_data,
+                                    agent_data=self.agent_data,
+                                    init_type=self.init_type))
+
+    @classmethod
+    def from_checkpoint(cls, source, mmap_file=False):
+        """Takes a checkpoint (bytes or path) and returns an initializer"""
+        data = load_checkpoint(source, mmap_file)
+        init = cls(data['model_data'], data['agent_data'], data['init_type'])
+        if 'random_state' in init.model_data:
+            init.model_data['random_state'] = tuple(init.model_data['random_state'])
+        return init
@@ -1,10 +1,16 @@
+import os
 import json
 import random
 from collections import defaultdict
 
 from agent_model.agents import growth_func
+from agent_model.agents.growth_cache import growth_cache
 from agent_model.util import location_to_day_length_minutes
 
+# Compare solved lifetime growth max values against the scipy optimizer
+VERIFY_GROWTH_SOLVER = bool(os.environ.get('VERIFY_GROWTH_SOLVER'))
+VERIFY_RTOL = 1e-3
+
 def parse_currency_desc(currency_desc):
     """Converts raw currency_desc into a dictionary of currencies and classes.
 
@@ -237,8 +243,28 @@ def parse_agent_conn(active_agents, agent_conn):
 
     return active_connections, conn_errors
 
-def calculate_lifetime_growth_max_value(attr_value, attr_details, lifetime, location):
-    """Calculate the highest point on a bell or sigmoid curve"""
+def calculate_lifetime_growth_max_value(attr_value, attr_details, lifetime, location,
+                                        verify=None):
+    """Calculate the highest point on a bell or sigmoid curve
+
+    The value is solved exactly by growth_func.solve_*_curve_mean and cached
+    in growth_cache.
+
+    Args:
+      verify: bool, also run the scipy optimizer which the solver replaced and
+              raise a ValueError if the results differ by more than
+              VERIFY_RTOL. Defaults to the VERIFY_GROWTH_SOLVER environment
+              variable.
+    """
+    if verify is None:
+        verify = VERIFY_GROWTH_SOLVER
+    cache_key = growth_cache.make_key(
+        'lifetime_growth_max_value', attr_value=float(attr_value),
+        lifetime=lifetime, location=location,
+        growth={k: v for k, v in attr_details.items() if k.startswith('lifetime_growth_')})
+    cached = None if verify else growth_cache.get(cache_key)
+    if cached is not None:
+        return float(cached)
     day_length_minutes = location_to_day_length_minutes(location)
     day_length_hours = day_length_minutes / 60
     num_values = int(lifetime * day_length_hours + 1)
@@ -250,12 +276,23 @@ def calculate_lifetime_growth_max_value(attr_value, attr_details, lifetime, loca
     growth_type = attr_details['lifetime_growth_type']
     if growth_type in ['norm', 'normal']:
         kwargs['invert'] = attr_details['lifetime_growth_invert']
-        res = growth_func.optimize_bell_curve_mean(**kwargs)
+        solve = growth_func.solve_bell_curve_mean
+        optimize = growth_func.optimize_bell_curve_mean
     elif growth_type in ['sig', 'sigmoid']:
-        res = growth_func.optimize_sigmoid_curve_mean(**kwargs)
+        solve = growth_func.solve_sigmoid_curve_mean
+        optimize = growth_func.optimize_sigmoid_curve_mean
+    res = solve(**kwargs)
+    if verify:
+        expected = float(optimize(**kwargs)['max_value'])
+        if abs(res['max_value'] - expected) > VERIFY_RTOL * abs(expected):
+            raise ValueError(f"Solved lifetime growth max value {res['max_value']} differs "
+                             f"from optimized value {expected} for {growth_type} curve "
+                             f"with {kwargs}")
     # Rounding is not technically necessary, but it was rounded under the old
     # system and I do it here for continuity of test results.
-    return round(float(res['max_value']), 8)
+    max_value = round(float(res['max_value']), 8)
+    growth_cache.set(cache_key, max_value)
+    return max_value
 
 def parse_agent_events(agent_events):
     agents_data = {}
@@ -0,0 +1,154 @@
+r"""Describes the optional per-step profiler of an AgentModel.
+"""
+
+import time
+import functools
+from collections import defaultdict
+
+import numpy as np
+
+
+class StepProfiler():
+    """Record wall time per model step, broken down by phase
+
+    The profiler is attached to a model by replacing the methods it times
+    with timed wrappers on each instance, so a model without a profiler runs
+    exactly the same code as before. Phases are:
+
+    ============================ ===============
+              Phase                 Description
+    ============================ ===============
+    ``step``                     All of ``AgentModel.step``
+    ``termination``              Checking termination conditions
+    ``storage_ratios``           Updating storage ratios or running totals
+    ``class:<agent_class>``      Stepping all agents of a priority class
+    ``agent:<agent_type>``       ``step()`` of one agent type
+    ``custom:<function>``        A custom function, e.g. ``atmosphere_equalizer``
+    ``data_collection``          Stepping all data collectors
+    ============================ ===============
+
+    Phases are nested: e.g. ``agent:<agent_type>`` is included in its
+    ``class:<agent_class>``, and everything is included in ``step``.
+
+    ====================== ============== ===============
+          Attribute        Type               Description
+    ====================== ============== ===============
+    ``records``            list           ``[{<phase>: seconds}]``, one per completed step
+    ====================== ============== ===============
+    """
+
+    def __init__(self):
+        self.records = []
+        self._current = defaultdict(float)
+
+    def attach(self, model):
+        """Wrap the model's step phases and agents with timers"""
+        current = self._current
+        records = self.records
+        step = model.step
+        perf_counter = time.perf_counter
+
+        @functools.wraps(step)
+        def timed_step(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return step(*args, **kwargs)
+            finally:
+                current['step'] += perf_counter() - start
+                records.append(dict(current))
+                current.clear()
+        model.step = timed_step
+        model._check_termination = self.wrap('termination', model._check_termination)
+        model._collect_data = self.wrap('data_collection', model._collect_data)
+        model.update_storage_ratios = self.wrap('storage_ratios', model.update_storage_ratios)
+        table = model.storage_table
+        table.update_row_ratios = self.wrap('storage_ratios', table.update_row_ratios)
+        if hasattr(model.scheduler, '_step_class'):
+            model.scheduler._step_class = self.wrap_by_arg('class:', model.scheduler._step_class)
+        for agent in model.scheduler.agents:
+            self.attach_agent(agent)
+
+    def attach_agent(self, agent):
+        """Wrap an agent's step and custom functions with timers"""
+        agent.step = self.wrap(f'agent:{agent.agent_type}', agent.step)
+        if hasattr(agent, '_calculate_storage_ratios'):
+            agent._calculate_storage_ratios = self.wrap(
+                'storage_ratios', agent._calculate_storage_ratios)
+        for action in getattr(agent, 'action_plan', []):
+            if action['type'] == 'custom_function':
+                function = action['function']
+                action['function'] = self.wrap(f'custom:{function.__name__}', function)
+
+    def wrap(self, phase, func):
+        """Return func, adding its run time to phase"""
+        current = self._current
+        perf_counter = time.perf_counter
+
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                current[phase] += perf_counter() - start
+        return timed
+
+    def wrap_by_arg(self, prefix, func):
+        """Return func, adding its run time to prefix + its first argument"""
+        current = self._current
+        perf_counter = time.perf_counter
+
+        @functools.wraps(func)
+        def timed(arg, *args, **kwargs):
+            start = perf_counter()
+            try:
+                return func(arg, *args, **kwargs)
+            finally:
+                current[prefix + arg] += perf_counter() - start
+        return timed
+
+    def summary(self, percentiles=(50, 90, 99)):
+        """Return per-phase statistics over all recorded steps
+
+        Steps in which a phase didn't run count as 0 for that phase.
+
+        Returns:
+          dict, ``{'n_steps': int, 'total': seconds, 'phases': {<phase>:
+          {'total', 'share', 'mean', 'p50', 'p90', 'p99', 'max'}}}``, with
+          phases ordered by total, descending. ``share`` is the fraction of
+          the time spent in ``step``.
+        """
+        n_steps = len(self.records)
+        phases = {}
+        for record in self.records:
+            for phase in record:
+                phases[phase] = None
+        total = sum(record.get('step', 0) for record in self.records)
+        stats = {}
+        for phase in phases:
+            times = np.array([record.get(phase, 0.0) for record in self.records])
+            phase_stats = dict(total=times.sum().item(),
+                               share=times.sum().item() / total if total else 0.0,
+                               mean=times.mean().item())
+            for p, value in zip(percentiles, np.percentile(times, percentiles).tolist()):
+                phase_stats[f'p{p}'] = value
+            phase_stats['max'] = times.max().item()
+            stats[phase] = phase_stats
+        stats = dict(sorted(stats.items(), key=lambda item: -item[1]['total']))
+        return dict(n_steps=n_steps, total=total, phases=stats)
+
+    def format_summary(self):
+        """Return the summary as a table, in milliseconds, e.g. for logging"""
+        summary = self.summary()
+        lines = [f"{summary['n_steps']} steps in {summary['total']:.3f} s",
+                 f"{'phase':44} {'total':>10} {'share':>6} {'mean':>8} {'p50':>8}"
+                 f" {'p90':>8} {'p99':>8} {'max':>8}"]
+        for phase, s in summary['phases'].items():
+            lines.append(f"{phase:44} {s['total'] * 1e3:10.1f} {s['share']:6.1%}"
+                         + ''.join(f" {s[k] * 1e3:8.3f}" for k in ['mean', 'p50', 'p90', 'p99', 'max']))
+        return '\n'.join(lines)
+
+    def reset(self):
+        """Remove all records"""
+        self.records.clear()
+        self._current.clear()
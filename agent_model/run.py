@@ -0,0 +1,149 @@
+r"""Run configs headlessly, without the web server, Celery or Redis.
+
+Each run is one config with one seed, stepped until it terminates (or
+``--steps``), and timed without initialization or output. Runs are spread
+over a ``ProcessPoolExecutor``, so this gives the throughput of the engine
+alone, as a baseline for regressions: steps per second, agent-steps per
+second (steps times the number of agents), and the peak RSS of the process
+which ran it (processes are reused, so it is the peak of all the runs it
+has done so far).
+
+Usage:
+  python -m agent_model.run data_files/config_1hg_sam.json
+  python -m agent_model.run data_files/config_*.json --seeds 0-3 --workers 4 \
+      --output-dir runs/ --report throughput.json
+"""
+
+import os
+import copy
+import json
+import time
+import argparse
+import resource
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from agent_model.agent_model import AgentModel
+from agent_model.ensemble import _parse_seeds
+
+MAX_STEPS = 365 * 24 * 2
+
+
+def peak_rss(who=resource.RUSAGE_SELF):
+    """Return the peak resident set size of this process (or its children), in MB"""
+    maxrss = resource.getrusage(who).ru_maxrss
+    # Bytes on macOS, KB elsewhere
+    return maxrss / 1e6 if os.uname().sysname == 'Darwin' else maxrss / 1e3
+
+
+def output_path(output_dir, config_path, seed):
+    name = os.path.splitext(os.path.basename(config_path))[0]
+    return os.path.join(output_dir, f'{name}_seed{seed}.json')
+
+
+def run_config(config_path, seed=None, max_steps=MAX_STEPS, output_dir=None):
+    """Run one config until it terminates, and return its throughput
+
+    Args:
+      config_path: str, path to a SIMOC config (.json)
+      seed: int, overrides the config's if not None
+      max_steps: int, most steps to run
+      output_dir: str, write the model's data to a file in this directory.
+                  Data is only collected if given.
+
+    Returns:
+      dict, with ``config``, ``seed``, ``steps``, ``agents``, ``seconds``
+      (stepping only), ``steps_per_sec``, ``agent_steps_per_sec``,
+      ``init_seconds``, ``termination_reason``, ``peak_rss_mb`` and
+      ``output`` (path or None)
+    """
+    with open(config_path) as f:
+        config = json.load(f)
+    if seed is not None:
+        config['seed'] = seed
+        # Growth noise, if any, is drawn from the global generator
+        np.random.seed(seed)
+    start = time.perf_counter()
+    model = AgentModel.from_config(copy.deepcopy(config),
+                                   data_collection=output_dir is not None)
+    init_seconds = time.perf_counter() - start
+    agent_steps = 0
+    start = time.perf_counter()
+    while model.step_num < max_steps and not model.is_terminated:
+        model.step()
+        agent_steps += len(model.scheduler.agents)
+    seconds = time.perf_counter() - start
+    output = None
+    if output_dir is not None:
+        output = output_path(output_dir, config_path, model.seed)
+        with open(output, 'w') as f:
+            json.dump(model.get_data(), f)
+    return dict(config=config_path, seed=model.seed, steps=model.step_num,
+                agents=len(model.scheduler.agents), seconds=seconds,
+                steps_per_sec=model.step_num / seconds if seconds else None,
+                agent_steps_per_sec=agent_steps / seconds if seconds else None,
+                init_seconds=init_seconds, termination_reason=model.termination_reason,
+                peak_rss_mb=peak_rss(), output=output)
+
+
+def run_many(runs, max_steps=MAX_STEPS, output_dir=None, max_workers=None):
+    """Yield the result of run_config for each (config_path, seed), in order
+
+    Args:
+      max_workers: int, number of processes; 0 to run serially in this process
+    """
+    config_paths, seeds = zip(*runs) if runs else ((), ())
+    n = len(config_paths)
+    args = (config_paths, seeds, [max_steps] * n, [output_dir] * n)
+    if max_workers == 0:
+        yield from map(run_config, *args)
+    else:
+        with ProcessPoolExecutor(max_workers) as pool:
+            yield from pool.map(run_config, *args)
+
+
+def format_result(result):
+    name = os.path.basename(result['config'])
+    return (f"{name:28} {result['seed']:>10} {result['steps']:7} {result['agents']:6}"
+            f" {result['seconds']:8.2f} {result['steps_per_sec'] or 0:9.0f}"
+            f" {result['agent_steps_per_sec'] or 0:11.0f} {result['peak_rss_mb']:8.0f}"
+            f"  {result['termination_reason']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('configs', nargs='+', help='paths to SIMOC configs (.json)')
+    parser.add_argument('--seeds', type=_parse_seeds,
+                        help="e.g. '0-99' or '1,5,7' (default: each config's seed)")
+    parser.add_argument('--steps', type=int, default=MAX_STEPS,
+                        help=f'most steps per run (default: {MAX_STEPS})')
+    parser.add_argument('--workers', type=int, help='processes; 0 to run serially')
+    parser.add_argument('--output-dir', help="write each run's data to <config>_seed<seed>.json here")
+    parser.add_argument('--report', help='write the results and totals as JSON')
+    args = parser.parse_args(argv)
+
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+    runs = [(path, seed) for path in args.configs for seed in (args.seeds or [None])]
+    print(f"{'config':28} {'seed':>10} {'steps':>7} {'agents':>6} {'seconds':>8}"
+          f" {'steps/s':>9} {'agt-steps/s':>11} {'RSS MB':>8}  termination")
+    results = []
+    start = time.perf_counter()
+    for result in run_many(runs, args.steps, args.output_dir, args.workers):
+        print(format_result(result), flush=True)
+        results.append(result)
+    wall_seconds = time.perf_counter() - start
+    steps = sum(r['steps'] for r in results)
+    totals = dict(runs=len(results), steps=steps, wall_seconds=wall_seconds,
+                  steps_per_sec=steps / wall_seconds,
+                  peak_rss_mb=max(peak_rss(), peak_rss(resource.RUSAGE_CHILDREN)))
+    print(f"{len(results)} runs, {steps} steps in {wall_seconds:.2f} s:"
+          f" {totals['steps_per_sec']:.0f} steps/s, peak RSS {totals['peak_rss_mb']:.0f} MB")
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(dict(results=results, totals=totals), f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,222 @@
+r"""Describes the model-level table of storage balances.
+"""
+
+from collections.abc import Mapping
+
+import numpy as np
+
+
+class StorageTable():
+    """Currency balances and capacities for all storage agents in a model
+
+    Each storage agent is a row. A storage's currencies occupy the first slots
+    of its row, in the order of its ``char_capacity_*`` attributes, so values
+    are always summed in the same order as the agent lists them. Unused slots
+    are zero.
+
+    Balances should be changed with ``set_balance`` or ``set_balances``, which
+    keep a running total of each row, so that ``StorageRatios`` can be read at
+    any time without summing the row.
+
+    ====================== ============== ===============
+          Attribute        Type               Description
+    ====================== ============== ===============
+    ``storage_ids``        list           Agent type for each row
+    ``currencies``         list           Currency names in slot order, for each row
+    ``slots``              list           ``{<currency>: <slot>}`` for each row
+    ``balances``           np.ndarray     Current balance, (row, slot)
+    ``capacities``         np.ndarray     Capacity per unit of agent, (row, slot)
+    ``unit_factors``       np.ndarray     Factor to convert to the unit of the row's first slot
+    ``class_masks``        dict           ``{<currency_class>: np.ndarray(bool)}``, (row, slot)
+    ``totals``             np.ndarray     Running total of each row, in the unit of its first slot
+    ====================== ============== ===============
+    """
+
+    def __init__(self):
+        self.storage_ids = []
+        self.currencies = []
+        self.slots = []
+        self.balances = np.zeros((0, 0))
+        self.capacities = np.zeros((0, 0))
+        self.unit_factors = np.zeros((0, 0))
+        self.class_masks = {}
+        self.totals = np.zeros(0)
+        self._ratio_keys = []
+        self._view_index = []
+
+    def add_storage(self, storage_id, currencies):
+        """Add a row for a storage agent and return its index
+
+        Args:
+          storage_id: str, agent_type of the storage
+          currencies: list of dicts with ``currency``, ``currency_class``,
+                      ``balance``, ``capacity`` and ``unit_factor``
+        """
+        row = len(self.storage_ids)
+        n_slots = max(self.balances.shape[1], len(currencies))
+        self.balances = self._grow(self.balances, n_slots)
+        self.capacities = self._grow(self.capacities, n_slots)
+        self.unit_factors = self._grow(self.unit_factors, n_slots)
+        self.totals = np.append(self.totals, 0.0)
+        for currency_class, mask in self.class_masks.items():
+            self.class_masks[currency_class] = self._grow(mask, n_slots)
+
+        self.storage_ids.append(storage_id)
+        self.currencies.append([c['currency'] for c in currencies])
+        self.slots.append({c['currency']: i for i, c in enumerate(currencies)})
+        self._ratio_keys.append([c['currency'] + '_ratio' for c in currencies])
+        self._view_index.append({})
+        for slot, c in enumerate(currencies):
+            self.balances[row, slot] = c['balance']
+            self.capacities[row, slot] = c['capacity']
+            self.unit_factors[row, slot] = c['unit_factor']
+            currency_class = c['currency_class']
+            if currency_class not in self.class_masks:
+                self.class_masks[currency_class] = np.zeros(self.balances.shape, dtype=bool)
+            self.class_masks[currency_class][row, slot] = True
+        self.totals[row] = self._row_total(row)
+        return row
+
+    @staticmethod
+    def _grow(array, n_slots):
+        """Return a copy of array with one more row and at least n_slots columns"""
+        grown = np.zeros((array.shape[0] + 1, n_slots), dtype=array.dtype)
+        grown[:array.shape[0], :array.shape[1]] = array
+        return grown
+
+    def view_index(self, row, currency_class, class_currencies):
+        """Return names and slots of a row's currencies in a currency class
+
+        Args:
+          row: int
+          currency_class: str
+          class_currencies: list, all currencies of the class, in the order
+                            they should be returned
+        """
+        index = self._view_index[row].get(currency_class)
+        if index is None:
+            mask = self.class_masks.get(currency_class)
+            slots = self.slots[row]
+            names = [c for c in class_currencies
+                     if c in slots and mask is not None and mask[row, slots[c]]]
+            index = (names, np.array([slots[c] for c in names], dtype=int))
+            self._view_index[row][currency_class] = index
+        return index
+
+    def set_balance(self, row, slot, value):
+        """Set a single balance and update the running total of its row"""
+        old = self.balances.item(row, slot)
+        self.balances[row, slot] = value
+        self.totals[row] += (value - old) * self.unit_factors.item(row, slot)
+
+    def set_balances(self, row, slots, values):
+        """Set several balances of one row and update its running total
+
+        Args:
+          row: int
+          slots: np.ndarray of ints
+          values: np.ndarray, new balances in the same order as slots
+        """
+        deltas = (values - self.balances[row, slots]) * self.unit_factors[row, slots]
+        self.balances[row, slots] = values
+        self.totals[row] += sum(deltas.tolist())
+
+    def _row_total(self, row):
+        n = len(self._ratio_keys[row])
+        total = 0
+        for value in (self.balances[row, :n] * self.unit_factors[row, :n]).tolist():
+            total += value
+        return total
+
+    def update_totals(self):
+        """Recalculate the running totals of all rows from their balances
+
+        Running totals can drift from the sum of the balances by rounding
+        errors, so they are recalculated once per model step.
+        """
+        if len(self.storage_ids) == 0:
+            return
+        values = self.balances * self.unit_factors
+        self.totals[:] = np.cumsum(values, axis=1)[:, -1]
+
+    def link_ratios(self, storage_ratios):
+        """Add a live StorageRatios for each row to storage_ratios
+
+        Args:
+          storage_ratios: dict, ``AgentModel.storage_ratios``
+        """
+        for row, storage_id in enumerate(self.storage_ids):
+            storage_ratios[storage_id] = StorageRatios(self, row)
+
+    def update_ratios(self, storage_ratios):
+        """Recalculate the storage ratios of all rows in one pass
+
+        Balances are summed cumulatively along each row so the total matches
+        adding each currency in turn, as in update_row_ratios.
+
+        Args:
+          storage_ratios: dict, ``AgentModel.storage_ratios``
+        """
+        if len(self.storage_ids) == 0:
+            return
+        values = self.balances * self.unit_factors
+        totals = np.cumsum(values, axis=1)[:, -1:]
+        ratios = np.zeros(values.shape)
+        np.divide(values, totals, out=ratios, where=values > 0)
+        for row, row_ratios in enumerate(ratios.tolist()):
+            self._write_ratios(storage_ratios, row, row_ratios)
+
+    def update_row_ratios(self, storage_ratios, row):
+        """Recalculate the storage ratios of a single row
+
+        A single row is short, so this is done with floats rather than arrays.
+        """
+        n = len(self._ratio_keys[row])
+        values = (self.balances[row, :n] * self.unit_factors[row, :n]).tolist()
+        total = 0
+        for value in values:
+            total += value
+        row_ratios = [value / total if value > 0 else 0.0 for value in values]
+        self._write_ratios(storage_ratios, row, row_ratios)
+
+    def _write_ratios(self, storage_ratios, row, row_ratios):
+        storage_id = self.storage_ids[row]
+        if storage_id not in storage_ratios:
+            storage_ratios[storage_id] = {}
+        storage_ratios[storage_id].update(zip(self._ratio_keys[row], row_ratios))
+
+
+class StorageRatios(Mapping):
+    """Current storage ratios of one row of a StorageTable
+
+    Behaves like the ``{<currency>_ratio: float}`` dict written by
+    ``StorageTable.update_ratios``, but each ratio is calculated from the
+    current balance and running total when it is read.
+    """
+
+    def __init__(self, table, row):
+        self.table = table
+        self.row = row
+        self.slots = {key: slot for slot, key in enumerate(table._ratio_keys[row])}
+
+    def __getitem__(self, key):
+        slot = self.slots[key]
+        table = self.table
+        value = table.balances.item(self.row, slot) * table.unit_factors.item(self.row, slot)
+        if value > 0:
+            total = table.totals.item(self.row)
+            if total < value:
+                # The running total drifted below a balance, e.g. to 0 as the
+                # storage emptied; use the exact sum instead
+                total = table._row_total(self.row)
+            return value / total
+        return 0.0
+
+    def __contains__(self, key):
+        return key in self.slots
+
+    def __iter__(self):
+        return iter(self.slots)
+
+    def __len__(self):
+        return len(self.slots)
@@ -0,0 +1,107 @@
+r"""Termination conditions of a model, compiled once when it is initialized.
+
+``AgentModel.termination`` is the list of conditions from the config, e.g.
+``{'condition': 'time', 'value': 10, 'unit': 'day'}``. Rather than being
+interpreted every step, each is compiled into a ``TerminationCondition``
+when the model is initialized, so checking them is cheap: a time condition
+only depends on the step length, so it becomes the number of the first
+step at which it is met, and checking it is an integer compare.
+
+Other kinds of condition can subclass ``TerminationCondition`` and be
+added to ``CONDITIONS``. ``check`` is called before each step, so it should
+read state the model already keeps up to date (e.g. ``storage_table``)
+rather than scanning agents. Unrecognized conditions are ignored.
+"""
+
+import math
+from abc import ABCMeta, abstractmethod
+
+
+class TerminationCondition(metaclass=ABCMeta):
+    """One compiled termination condition
+
+    ====================== ============== ===============
+          Attribute        Type               Description
+    ====================== ============== ===============
+    ``reason``             str            Set as the model's ``termination_reason``
+    ``condition``          dict           The condition from the config
+    ====================== ============== ===============
+    """
+
+    reason = None
+
+    def __init__(self, model, condition):
+        self.condition = condition
+
+    @abstractmethod
+    def check(self, model, step_num):
+        """Return True if the model should terminate before step step_num"""
+
+
+class TimeTermination(TerminationCondition):
+    """Terminate once the model time is more than ``value`` ``unit``
+
+    ====================== ============== ===============
+          Attribute        Type               Description
+    ====================== ============== ===============
+    ``step_num``           int            First step at which the condition is met
+    ====================== ============== ===============
+    """
+
+    reason = 'time'
+
+    def __init__(self, model, condition):
+        super().__init__(model, condition)
+        day_seconds = 3600 * model.day_length_hours
+        unit_seconds = {'min': 60, 'hour': 3600, 'day': day_seconds,
+                        'year': day_seconds * 365}.get(condition['unit'], day_seconds)
+        self.step_num = self.first_step(model, condition['value'], unit_seconds)
+
+    @staticmethod
+    def first_step(model, value, unit_seconds):
+        """Return the number of the first step at which time in unit > value
+
+        Time is compared exactly as it would be each step, so the model
+        terminates at the same step as if it were.
+        """
+        start_time = model.time
+        step_length = model.timedelta_per_step
+        def _is_met(n_steps):
+            return (start_time + n_steps * step_length).total_seconds() / unit_seconds > value
+        n_steps = max(1, math.floor((value * unit_seconds - start_time.total_seconds())
+                                    / step_length.total_seconds()))
+        while n_steps > 1 and _is_met(n_steps - 1):
+            n_steps -= 1
+        while not _is_met(n_steps):
+            n_steps += 1
+        return model.scheduler.steps + n_steps
+
+    def check(self, model, step_num):
+        return step_num >= self.step_num
+
+
+CONDITIONS = {
+    'time': TimeTermination,
+}
+
+
+class TerminationChecker():
+    """The compiled termination conditions of a model
+
+    ====================== ============== ===============
+          Attribute        Type               Description
+    ====================== ============== ===============
+    ``conditions``         list           ``[<TerminationCondition>]``, in config order
+    ====================== ============== ===============
+    """
+
+    def __init__(self, model, termination):
+        self.conditions = [CONDITIONS[cond['condition']](model, cond)
+                           for cond in termination if cond.get('condition') in CONDITIONS]
+
+    def check(self, model, step_num):
+        """Return the reason of the first condition met before step step_num, or None"""
+        for condition in self.conditions:
+            if condition.check(model, step_num):
+                return condition.reason
+        return None
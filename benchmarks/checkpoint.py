@@ -0,0 +1,107 @@
+"""Measure saving and loading models as JSON and as binary checkpoints.
+
+Each config in data_files/ is run for `--steps` steps and saved, as JSON
+(``AgentModel.save``, then ``json.dumps``, as stored in Redis) and as a
+checkpoint (``AgentModel.save_checkpoint``). Each is loaded back, and a
+checkpoint file is also loaded memory-mapped. Reported times are the
+fastest of `--repeat` runs; 'decode' is the time to parse the saved data
+without initializing a model.
+
+Usage:
+  python benchmarks/checkpoint.py [--steps 100] [--repeat 5]
+"""
+
+import argparse
+import copy
+import datetime
+import glob
+import json
+import os
+import tempfile
+import time
+
+from agent_model import AgentModel, AgentModelInitializer
+
+
+def best_time(func, repeat):
+    """Return the fastest of repeat calls to func, in ms"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times) * 1e3
+
+
+def json_dumps(model):
+    return json.dumps(model.save(), default=lambda v: v.isoformat())
+
+
+def json_decode(saved):
+    data = json.loads(saved)
+    start_time = data['model_data']['start_time']
+    data['model_data']['start_time'] = datetime.datetime.fromisoformat(start_time)
+    return AgentModelInitializer.deserialize(data)
+
+
+def json_load(saved):
+    return AgentModel.load(json.loads(saved, object_hook=_parse_start_time))
+
+
+def _parse_start_time(obj):
+    if 'start_time' in obj and isinstance(obj['start_time'], str):
+        obj['start_time'] = datetime.datetime.fromisoformat(obj['start_time'])
+    return obj
+
+
+def measure(path, n_steps, repeat, tmpdir):
+    """Return {<measure>: <value>} for one config"""
+    with open(path) as f:
+        config = json.load(f)
+    model = AgentModel.from_config(copy.deepcopy(config), data_collection=False)
+    model.step_to(n_steps=n_steps)
+    saved = json_dumps(model)
+    checkpoint = model.save_checkpoint()
+    file = os.path.join(tmpdir, 'model.simc')
+    with open(file, 'wb') as f:
+        f.write(checkpoint)
+    return {
+        'json KB': len(saved.encode('utf-8')) / 1e3,
+        'ckpt KB': len(checkpoint) / 1e3,
+        'json save': best_time(lambda: json_dumps(model), repeat),
+        'ckpt save': best_time(model.save_checkpoint, repeat),
+        'json decode': best_time(lambda: json_decode(saved), repeat),
+        'ckpt decode': best_time(lambda: AgentModelInitializer.from_checkpoint(checkpoint),
+                                 repeat),
+        'json load': best_time(lambda: json_load(saved), repeat),
+        'ckpt load': best_time(lambda: AgentModel.load_checkpoint(checkpoint), repeat),
+        'mmap load': best_time(lambda: AgentModel.load_checkpoint(file, mmap_file=True),
+                               repeat),
+    }
+
+
+def main():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--steps', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    configs = sorted(glob.glob(os.path.join(root, 'data_files', 'config_*.json')))
+    header = None
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for path in configs:
+            name = os.path.basename(path)
+            try:
+                results = measure(path, args.steps, args.repeat, tmpdir)
+            except Exception as e:
+                print(f"{name:26} failed: {e}")
+                continue
+            if header is None:
+                header = list(results)
+                print(f"{'config (KB, ms)':26}" + ''.join(f" {k:>11}" for k in header))
+            print(f"{name:26}" + ''.join(f" {results[k]:11.1f}" for k in header))
+
+
+if __name__ == '__main__':
+    main()
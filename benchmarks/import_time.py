@@ -0,0 +1,76 @@
+"""Measure the cold-start time of importing agent_model.
+
+Each import is timed in a fresh interpreter, so nothing is cached in
+sys.modules. Reports the median over all runs, and which heavy optional
+dependencies the import pulled in.
+
+Usage:
+  python benchmarks/import_time.py [--module agent_model] [--repeat 10]
+  python benchmarks/import_time.py --path /path/to/other/checkout
+
+With --path, the same module is also imported from another checkout (e.g. a
+git worktree at an earlier commit) to compare before and after.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+HEAVY_MODULES = ['scipy', 'scipy.stats', 'scipy.optimize', 'sklearn', 'pandas', 'mesa']
+
+SNIPPET = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'elapsed': elapsed,
+                  'loaded': [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def time_import(module, path, repeat):
+    """Import module in `repeat` fresh interpreters and return the results
+
+    Returns:
+      dict with 'median' and 'times' in seconds, and 'loaded', the heavy
+      modules imported along with module
+    """
+    code = SNIPPET.format(module=module, heavy=HEAVY_MODULES)
+    env = dict(os.environ, PYTHONPATH=path)
+    times = []
+    loaded = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, '-c', code], cwd=path, env=env,
+                             capture_output=True, text=True, check=True)
+        result = json.loads(out.stdout.strip().splitlines()[-1])
+        times.append(result['elapsed'])
+        loaded = result['loaded']
+    return {'median': statistics.median(times), 'times': times, 'loaded': loaded}
+
+
+def main():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--module', default='agent_model')
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--path', help='another checkout to compare against')
+    args = parser.parse_args()
+
+    checkouts = [('current', root)]
+    if args.path:
+        checkouts.insert(0, ('compare', os.path.abspath(args.path)))
+    for label, path in checkouts:
+        # Warm the filesystem and bytecode caches, which aren't what we measure
+        time_import(args.module, path, 1)
+        result = time_import(args.module, path, args.repeat)
+        print(f"{label:8} {path}")
+        print(f"  import {args.module}: {result['median'] * 1000:.0f} ms"
+              f" (median of {args.repeat}, min {min(result['times']) * 1000:.0f} ms)")
+        print(f"  loaded: {', '.join(result['loaded']) or 'none'}")
+
+
+if __name__ == '__main__':
+    main()
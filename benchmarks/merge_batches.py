@@ -0,0 +1,95 @@
+"""Measure merging batches of step records, as in views.retrieve_steps.
+
+A 100-step batch is recorded from a simoc_abm game, and its plant is
+copied to make a game with `--plants` plant agents. The batch is encoded
+once and merged `--days` * 24 / 100 times (e.g. 22 batches for 90 days),
+with the previous recursive reduce and with BatchMerger. CPU time and peak
+memory (tracemalloc) are measured in separate runs, because tracing slows
+everything down.
+
+Usage:
+  python benchmarks/merge_batches.py [--plants 200] [--days 90]
+"""
+
+import argparse
+import copy
+import functools
+import math
+import time
+import tracemalloc
+
+from simoc_abm.agent_model import AgentModel
+from simoc_abm.util import load_data_file
+
+from simoc_server.serialize.record_batch import encode_batch, decode_batch, BatchMerger
+
+BATCH_SIZE = 100
+
+
+def make_batch(n_plants):
+    """Return an encoded 100-step batch with n_plants plant agents"""
+    model = AgentModel.from_config(**load_data_file('config_1hg_sam.json'),
+                                   record_initial_state=False)
+    for _ in range(BATCH_SIZE):
+        model.step()
+    records = model.get_records(static=True, clear_cache=True)
+    plant = records['agents'].pop('rice')
+    for i in range(n_plants):
+        records['agents'][f'plant_{i:03d}'] = copy.deepcopy(plant)
+    records['n_steps'] = BATCH_SIZE
+    return encode_batch(records)
+
+
+def reduce_merge(batches):
+    """The previous merge: reduce over batches, re-copying lists each time"""
+    batches = [decode_batch(batch) for batch in batches]
+    def merge_batches(b1, b2):
+        if isinstance(b1, (str, int, float)):
+            return b2 or b1
+        elif isinstance(b1, list):
+            return b1 + b2
+        elif isinstance(b1, dict):
+            return {k: merge_batches(b1[k], b2[k]) for k in b1.keys()}
+    return functools.reduce(merge_batches, batches)
+
+
+def streaming_merge(batches):
+    """The merge in views.retrieve_steps"""
+    merger = BatchMerger()
+    for batch in batches:
+        merger.add(decode_batch(batch, as_arrays=True))
+    return merger.merged()
+
+
+def measure(merge, batches):
+    """Return (CPU seconds, peak traced bytes) of merging batches"""
+    start = time.process_time()
+    merge(batches)
+    cpu = time.process_time() - start
+    tracemalloc.start()
+    merge(batches)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return cpu, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--plants', type=int, default=200)
+    parser.add_argument('--days', type=int, default=90)
+    args = parser.parse_args()
+
+    batch = make_batch(args.plants)
+    n_batches = math.ceil(args.days * 24 / BATCH_SIZE)
+    print(f"{args.plants} plants, {args.days} days: {n_batches} batches"
+          f" of {len(batch) / 1e6:.2f} MB")
+    for max_batches in sorted({10, n_batches}):
+        batches = [batch] * max_batches
+        for name, merge in [('reduce', reduce_merge), ('streaming', streaming_merge)]:
+            cpu, peak = measure(merge, batches)
+            print(f"  {max_batches:3} batches  {name:10} CPU {cpu:7.2f} s"
+                  f"  peak {peak / 1e6:7.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""Measure the size of step record batches in each encoding.
+
+Each config in data_files/ is run for `--steps` steps, and its records are
+collected every `--batch` steps, as the worker does. Each batch is encoded
+as JSON and as a binary batch with and without run-length encoding, each
+with and without zlib, and checked to decode exactly.
+
+Usage:
+  python benchmarks/record_compression.py [--steps 1000] [--batch 100]
+  python benchmarks/record_compression.py --engine simoc_abm
+
+With --engine simoc_abm, the records are those sent by the worker
+(``simoc_abm.AgentModel.get_records``), for the configs bundled with
+simoc_abm.
+"""
+
+import argparse
+import copy
+import glob
+import json
+import os
+
+from simoc_server.serialize.record_batch import encode_batch, decode_batch
+
+ENCODINGS = {
+    'binary': dict(compress=False, run_length=False),
+    'binary+rle': dict(compress=False, run_length=True),
+    'binary+zlib': dict(compress=True, run_length=False),
+    'binary+rle+zlib': dict(compress=True, run_length=True),
+}
+
+
+def agent_model_batches(path, n_steps, batch_size):
+    """Yield batches of records of a config from data_files/"""
+    from agent_model import AgentModel
+    with open(path) as f:
+        config = json.load(f)
+    model = AgentModel.from_config(copy.deepcopy(config), data_collection=True)
+    while model.step_num < n_steps and not model.is_terminated:
+        model.step_to(n_steps=min(n_steps, model.step_num + batch_size))
+        yield model.get_data(debug=True, clear_cache=True)
+
+
+def simoc_abm_batches(name, n_steps, batch_size):
+    """Yield batches of records of a config bundled with simoc_abm"""
+    from simoc_abm.agent_model import AgentModel
+    from simoc_abm.util import load_data_file
+    model = AgentModel.from_config(**load_data_file(name), record_initial_state=False)
+    while model.step_num < n_steps and not model.is_terminated:
+        for _ in range(min(batch_size, n_steps - model.step_num)):
+            model.step()
+        yield model.get_records(static=True, clear_cache=True)
+
+
+def measure(batches):
+    """Return the total size of batches in bytes, by encoding"""
+    sizes = dict.fromkeys(['json', *ENCODINGS], 0)
+    for records in batches:
+        expected = json.dumps(records)
+        sizes['json'] += len(expected.encode('utf-8'))
+        for name, kwargs in ENCODINGS.items():
+            batch = encode_batch(records, **kwargs)
+            # Compared as JSON, so that e.g. 100 and 100.0 differ
+            assert json.dumps(decode_batch(batch)) == expected, name
+            sizes[name] += len(batch)
+    return sizes
+
+
+def main():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--steps', type=int, default=1000)
+    parser.add_argument('--batch', type=int, default=100)
+    parser.add_argument('--engine', choices=['agent_model', 'simoc_abm'],
+                        default='agent_model')
+    args = parser.parse_args()
+
+    configs = sorted(glob.glob(os.path.join(root, 'data_files', 'config_*.json')))
+    print(f"{'config':26} {'json KB':>9}" + ''.join(f" {name:>16}" for name in ENCODINGS))
+    for path in configs:
+        name = os.path.basename(path)
+        try:
+            if args.engine == 'agent_model':
+                sizes = measure(agent_model_batches(path, args.steps, args.batch))
+            else:
+                sizes = measure(simoc_abm_batches(name, args.steps, args.batch))
+        except Exception as e:
+            print(f"{name:26} failed: {e}")
+            continue
+        print(f"{name:26} {sizes['json'] / 1e3:9.0f}"
+              + ''.join(f" {sizes[k] / 1e3:8.0f} {sizes['json'] / sizes[k]:5.1f}x"
+                        for k in ENCODINGS))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+"""Benchmark the agent_model engine on the bundled configs.
+
+For each config in ``CONFIGS``, times ``AgentModelInitializer.from_new``,
+``AgentModel.__init__``, ``step_to`` for 1, 100 and all steps (until the
+config terminates), ``get_data`` and ``save``/``load`` after 100 steps,
+with pytest-benchmark. Models are stepped with data collection, as in a
+game. The peak memory allocated by each operation (tracemalloc, in a
+separate untimed call) is saved in each benchmark's ``extra_info`` as
+``peak_mb``. Tracing a full run would take several times as long as the
+run, so full runs save the growth of the process's RSS, ``rss_growth_mb``,
+instead (on Linux).
+
+Usage:
+  python -m pytest benchmarks/test_engine.py --benchmark-autosave
+  python -m pytest benchmarks/test_engine.py -k "not full" --benchmark-autosave
+
+Saved runs (in .benchmarks/) are named by commit, so a change can be
+gated on not regressing against an earlier run, e.g.:
+
+  python -m pytest benchmarks/test_engine.py --benchmark-compare=0001 \\
+      --benchmark-compare-fail=median:10%
+  python benchmarks/test_engine.py .benchmarks/*/0001_*.json \\
+      .benchmarks/*/0002_*.json --max-increase 10
+
+The second form compares both the median time and the memory of two saved
+runs, and exits with an error if either grew by more than --max-increase
+percent.
+"""
+
+import argparse
+import copy
+import json
+import os
+import sys
+import tracemalloc
+
+import pytest
+
+from agent_model import AgentModel, AgentModelInitializer
+from agent_model.exceptions import AgentInitializationError
+
+CONFIGS = ['config_1h', 'config_4h', 'config_1hg_sam', 'config_b2_mission1a',
+           'config_b2_mission1b', 'config_b2_mission2', 'config_disaster']
+DATA_FILES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                          'data_files')
+ROUNDS = 10
+# Changes in memory smaller than this aren't counted as regressions
+MIN_MEMORY_CHANGE_MB = 0.1
+
+
+def peak_memory(func, *args, **kwargs):
+    """Return the peak memory allocated while calling func, in MB"""
+    tracemalloc.start()
+    try:
+        func(*args, **kwargs)
+        return tracemalloc.get_traced_memory()[1] / 1e6
+    finally:
+        tracemalloc.stop()
+
+
+def rss():
+    """Return the resident set size of this process in MB, or None if unknown"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1e6
+    except (OSError, ValueError):
+        return None
+
+
+def run(benchmark, func, setup, rounds=ROUNDS, trace_memory=True):
+    """Time func(*setup()) with a fresh setup each round, and record its memory"""
+    if trace_memory:
+        benchmark.extra_info['peak_mb'] = peak_memory(func, *setup())
+    return benchmark.pedantic(func, setup=lambda: (setup(), {}), rounds=rounds)
+
+
+@pytest.fixture(scope='module', params=CONFIGS)
+def config(request):
+    pytest.importorskip('pytest_benchmark')
+    with open(os.path.join(DATA_FILES, f'{request.param}.json')) as f:
+        config = json.load(f)
+    config['seed'] = 12345
+    return config
+
+
+@pytest.fixture(scope='module')
+def model(config):
+    """A new model; benchmarks step forks of it"""
+    try:
+        return AgentModel.from_config(copy.deepcopy(config), data_collection=True)
+    except AgentInitializationError as e:
+        pytest.skip(f"Config doesn't initialize: {e}")
+
+
+@pytest.fixture(scope='module')
+def stepped_model(model):
+    stepped_model = model.fork()
+    stepped_model.step_to(n_steps=100)
+    return stepped_model
+
+
+def test_from_new(benchmark, config, model):
+    run(benchmark, AgentModelInitializer.from_new, lambda: (copy.deepcopy(config),))
+
+
+def test_init(benchmark, config, model):
+    def setup():
+        initializer, _ = AgentModelInitializer.from_new(copy.deepcopy(config))
+        return initializer, True
+    run(benchmark, AgentModel, setup)
+
+
+@pytest.mark.parametrize('n_steps', [1, 100])
+def test_step_to(benchmark, model, n_steps):
+    run(benchmark, lambda fork: fork.step_to(n_steps=n_steps), lambda: (model.fork(),))
+
+
+def test_step_to_full(benchmark, model):
+    def step_to_full(fork):
+        start_rss = rss()
+        fork.step_to(termination=True)
+        benchmark.extra_info['n_steps'] = fork.step_num
+        if start_rss is not None:
+            benchmark.extra_info['rss_growth_mb'] = rss() - start_rss
+    run(benchmark, step_to_full, lambda: (model.fork(),), rounds=1, trace_memory=False)
+
+
+def test_get_data(benchmark, stepped_model):
+    run(benchmark, lambda: stepped_model.get_data(debug=True), tuple)
+
+
+def test_save(benchmark, stepped_model):
+    run(benchmark, stepped_model.save, tuple)
+
+
+def test_load(benchmark, stepped_model):
+    run(benchmark, AgentModel.load, lambda: (stepped_model.save(),))
+
+
+def test_save_checkpoint(benchmark, stepped_model):
+    run(benchmark, stepped_model.save_checkpoint, tuple)
+
+
+def test_load_checkpoint(benchmark, stepped_model):
+    checkpoint = stepped_model.save_checkpoint()
+    run(benchmark, AgentModel.load_checkpoint, lambda: (checkpoint,))
+
+
+def _memory(bench):
+    extra_info = bench['extra_info']
+    return extra_info.get('peak_mb', extra_info.get('rss_growth_mb'))
+
+
+def compare(old_path, new_path, max_increase):
+    """Print the change in median time and peak memory of each benchmark
+
+    Returns:
+      list, names of benchmarks which regressed by more than max_increase %
+    """
+    def _load(path):
+        with open(path) as f:
+            return {b['fullname']: b for b in json.load(f)['benchmarks']}
+    old, new = _load(old_path), _load(new_path)
+    regressed = []
+    print(f"{'benchmark':70} {'median':>9} {'change':>7} {'memory MB':>9} {'change':>7}")
+    for name, bench in new.items():
+        if name not in old:
+            continue
+        median = bench['stats']['median']
+        peak = _memory(bench)
+        old_median = old[name]['stats']['median']
+        old_peak = _memory(old[name])
+        time_change = 100 * (median / old_median - 1)
+        peak_change = 100 * (peak / old_peak - 1) if peak and old_peak else 0
+        print(f"{name.split('::', 1)[-1]:70} {median * 1e3:7.1f}ms {time_change:+6.1f}%"
+              f" {peak or 0:9.2f} {peak_change:+6.1f}%")
+        if peak and old_peak and peak - old_peak < MIN_MEMORY_CHANGE_MB:
+            peak_change = min(peak_change, 0)
+        if time_change > max_increase or peak_change > max_increase:
+            regressed.append(name)
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare two saved benchmark runs')
+    parser.add_argument('old', help='saved pytest-benchmark JSON of the baseline')
+    parser.add_argument('new', help='saved pytest-benchmark JSON to check')
+    parser.add_argument('--max-increase', type=float, default=10,
+                        help='percent increase in time or memory allowed (default: 10)')
+    args = parser.parse_args()
+    regressed = compare(args.old, args.new, args.max_increase)
+    if regressed:
+        sys.exit(f'{len(regressed)} benchmarks regressed by more than {args.max_increase}%')
+
+
+if __name__ == '__main__':
+    main()
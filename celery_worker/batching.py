@@ -0,0 +1,65 @@
+"""Decide when the new_game task adds a batch of step records to Redis.
+
+A fixed number of steps per batch suits no config: fast configs produce
+many small batches, each with a fixed overhead (collecting, encoding and
+sending the records), while slow configs make the frontend wait for all
+the steps of a batch. Batches are instead ended by whichever comes first:
+
+- ``max_seconds`` since the batch started, or ``first_seconds`` for the
+  first batch, so the frontend gets its first steps quickly
+- ``max_bytes``, estimated from the encoded size per step of earlier batches
+- ``max_steps``
+"""
+
+import time
+
+
+class BatchSizer():
+    """Track the current batch and decide when to end it
+
+    ====================== ============== ===============
+          Attribute        Type               Description
+    ====================== ============== ===============
+    ``max_steps``          int            Most steps in a batch
+    ``max_seconds``        float          Longest time to run steps for a batch
+    ``first_seconds``      float          Longest time to run steps for the first batch
+    ``max_bytes``          int            Target size of an encoded batch
+    ``n_batches``          int            Number of batches ended
+    ``n_steps``            int            Number of steps in the current batch
+    ``bytes_per_step``     float          Encoded size per step of the last batch, or None
+    ====================== ============== ===============
+    """
+
+    def __init__(self, max_steps=1000, max_seconds=1.0, first_seconds=0.1,
+                 max_bytes=500_000):
+        self.max_steps = max_steps
+        self.max_seconds = max_seconds
+        self.first_seconds = first_seconds
+        self.max_bytes = max_bytes
+        self.n_batches = 0
+        self.n_steps = 0
+        self.bytes_per_step = None
+        self._start_time = None
+        self._step_limit = max_steps
+
+    def start_batch(self):
+        self.n_steps = 0
+        self._start_time = time.perf_counter()
+        self._step_limit = self.max_steps
+        if self.bytes_per_step:
+            self._step_limit = max(1, min(self.max_steps,
+                                          int(self.max_bytes / self.bytes_per_step)))
+
+    def step_done(self):
+        """Count a step and return whether the batch should end"""
+        self.n_steps += 1
+        if self.n_steps >= self._step_limit:
+            return True
+        max_seconds = self.first_seconds if self.n_batches == 0 else self.max_seconds
+        return time.perf_counter() - self._start_time >= max_seconds
+
+    def end_batch(self, n_bytes):
+        """Record the encoded size of the batch just ended"""
+        if self.n_steps:
+            self.bytes_per_step = n_bytes / self.n_steps
+        self.n_batches += 1
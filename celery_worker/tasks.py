@@ -1,3 +1,4 @@
+import os
 import sys
 import json
 import time
@@ -17,6 +18,9 @@ sys.path.append("../")
 from simoc_abm.agent_model import AgentModel
 from simoc_server.database.db_model import User
 from simoc_server.exceptions import NotFound
+from simoc_server.serialize.record_batch import encode_batch
+from simoc_server.game_records import RecordStream, notify_records
+from celery_worker.batching import BatchSizer
 from simoc_server import redis_conn, db
 
 app = Celery('tasks')
@@ -48,8 +52,14 @@ def get_user(username, num_retries=30, interval=1):
             logger.info(f'User found ({num_retries=} left): {user[0]}')
             return user[0]
 
-BUFFER_SIZE = 100  # Number of steps to execute between adding records to Redis
+MAX_BATCH_STEPS = 1000  # Most steps to execute between adding records to Redis
+MAX_BATCH_SECONDS = 1.0  # Add records to Redis at least this often while stepping
+FIRST_BATCH_SECONDS = 0.1  # ...and sooner for the first batch
+MAX_BATCH_BYTES = 500_000  # Target size of an encoded batch
 RECORD_EXPIRE = 1800  # Number of seconds to keep records in Redis
+RECORD_MAX_BATCHES = 100  # Most batches of a game to keep in Redis; older ones are trimmed
+PROFILE_GAMES = bool(os.environ.get('PROFILE_GAMES'))  # Log step timing by phase
+RECORD_FORMAT = os.environ.get('RECORD_FORMAT', 'binary')  # 'binary' or 'json'
 
 @app.task
 def new_game(username, game_config, num_steps, expire=3600):
@@ -60,6 +70,12 @@ def new_game(username, game_config, num_steps, expire=3600):
     model = AgentModel.from_config(**game_config, record_initial_state=False)
     model.game_id = game_id
     model.user_id = user.id
+    if PROFILE_GAMES:
+        if hasattr(model, 'enable_profiler'):
+            model.enable_profiler()
+        else:
+            logger.warning(f'PROFILE_GAMES is set, but {type(model).__module__}.AgentModel'
+                           f' has no profiler; game {game_id:X} will not be profiled')
     # Save complete game config to Redis
     complete_game_config = model.save()
     redis_conn.set(f'game_config:{game_id}', json.dumps(complete_game_config), ex=expire)
@@ -67,24 +83,36 @@ def new_game(username, game_config, num_steps, expire=3600):
     logger.info(f'Setting user:{user.id} task:{game_id:X} on Redis')
     redis_conn.set(f'task_mapping:{game_id}', new_game.request.id, ex=expire)
     redis_conn.set(f'user_mapping:{user.id}', game_id, ex=expire)
-    key = f'records:{game_id}'
+    stream = RecordStream(redis_conn, game_id)
     try:
         # Run the model and add records to Redis
-        batch_num = 0
-        while model.step_num <= num_steps and not model.is_terminated:
+        sizer = BatchSizer(MAX_BATCH_STEPS, MAX_BATCH_SECONDS, FIRST_BATCH_SECONDS,
+                           MAX_BATCH_BYTES)
+        while model.step_num < num_steps and not model.is_terminated:
             start_time = time.time()
-            n_steps = min(BUFFER_SIZE, num_steps - model.step_num)
-            for _ in range(n_steps):
+            start_step = model.step_num + 1
+            sizer.start_batch()
+            while True:
                 model.step()
+                if (sizer.step_done() or model.step_num >= num_steps
+                        or model.is_terminated):
+                    break
+            n_steps = sizer.n_steps
             records = model.get_records(static=True, clear_cache=True)
-            # Include the number of steps so views.py knows when it's finished
-            records['n_steps'] = n_steps
-            redis_conn.rpush(key, json.dumps(records))
-            batch_num += 1
+            if RECORD_FORMAT == 'json':
+                batch = json.dumps(records)
+            else:
+                batch = encode_batch(records)
+            stream.append(batch, start_step, model.step_num, expire=expire,
+                          max_batches=RECORD_MAX_BATCHES)
+            sizer.end_batch(len(batch))
+            notify_records(redis_conn, game_id, model.step_num)
             elapsed_time = time.time() - start_time
-            logger.info(f'Added batch {batch_num} ({n_steps} records) to Redis for {user.id}:{game_id} in {elapsed_time:.3f} seconds')
+            logger.info(f'Added batch {sizer.n_batches} ({n_steps} records) to Redis for {user.id}:{game_id} in {elapsed_time:.3f} seconds')
         logger.info(f'Game {game_id:X} finished successfully after {model.step_num} steps')
+        if getattr(model, 'profiler', None) is not None:
+            logger.info(f'Step profile for game {game_id:X}:\n{model.profiler.format_summary()}')
 
     finally:
-        redis_conn.expire(key, RECORD_EXPIRE)
+        redis_conn.expire(stream.key, RECORD_EXPIRE)
         logger.info(f'Completed simulation for {user}')
@@ -0,0 +1,184 @@
+r"""Step records of a game, shared by the worker running it and the web server.
+
+The Celery ``new_game`` task adds batches of step records to a Redis Stream,
+``step_records:<game_id>``, and ``views.get_steps_background`` forwards them
+to the frontend. Each entry of the stream is one batch, with the ID
+``<last step>-0``, so readers can resume from any step number regardless of
+how many steps each batch has. Each reader keeps its own offset (the next
+step it needs), so several can read the same game independently, and
+batches are returned as they were encoded.
+
+Each game's stream is trimmed by the worker as it adds batches, to its
+latest ``max_batches``, and expires when the game's records do. A reader
+which falls further behind resumes from the oldest batch kept.
+
+Rather than polling Redis on a fixed interval, the server blocks on a
+pub/sub subscription and is woken as soon as something happens:
+
+============================ ===============
+          Channel               Published
+============================ ===============
+``records_ready:<game_id>``  By the worker, after it adds a batch of records
+``stop_task:<sid>``          By the server, to stop forwarding steps to a socket
+============================ ===============
+
+``stop_task:<sid>`` is also set as a key, so a stop requested before the
+listener subscribed is not missed.
+"""
+
+import time
+
+from simoc_server.serialize.record_batch import decode_batch, BatchMerger
+
+
+def records_key(game_id):
+    return f'step_records:{game_id}'
+
+
+def records_channel(game_id):
+    return f'records_ready:{game_id}'
+
+
+def stop_channel(sid):
+    return f'stop_task:{sid}'
+
+
+def notify_records(redis_conn, game_id, end_step):
+    """Wake up listeners of a game after adding steps up to end_step"""
+    redis_conn.publish(records_channel(game_id), end_step)
+
+
+def stop_steps(redis_conn, sid, ex=None):
+    """Stop forwarding steps to a socket"""
+    redis_conn.set(stop_channel(sid), 1, ex=ex)
+    redis_conn.publish(stop_channel(sid), 1)
+
+
+def is_stopped(redis_conn, sid):
+    stop_task = redis_conn.get(stop_channel(sid))
+    return bool(stop_task.decode("utf-8")) if stop_task else False
+
+
+class RecordStream():
+    """The batches of step records of a game
+
+    ====================== ============== ===============
+          Attribute        Type               Description
+    ====================== ============== ===============
+    ``redis_conn``         redis.Redis    Connection
+    ``key``                str            ``step_records:<game_id>``
+    ====================== ============== ===============
+    """
+
+    def __init__(self, redis_conn, game_id):
+        self.redis_conn = redis_conn
+        self.key = records_key(game_id)
+
+    def append(self, batch, start_step, end_step, expire=None, max_batches=None):
+        """Add a batch of the steps from start_step to end_step, inclusive
+
+        Args:
+          batch: bytes, e.g. from encode_batch
+          start_step: int, step number of the first step in the batch
+          end_step: int, step number of the last step; must be greater than
+                    that of the previous batch
+          expire: int, seconds until the records of the game are removed,
+                  counted from this batch
+          max_batches: int, most batches to keep; older ones are removed
+        """
+        pipe = self.redis_conn.pipeline()
+        pipe.xadd(self.key, dict(start=start_step, end=end_step, batch=batch),
+                  id=f'{end_step}-0', maxlen=max_batches, approximate=False)
+        if expire:
+            pipe.expire(self.key, expire)
+        pipe.execute()
+
+    def read(self, min_step=1, count=None):
+        """Return batches which include steps from min_step on
+
+        Args:
+          min_step: int, the first step needed
+          count: int, maximum number of batches to return
+
+        Returns:
+          list, ``[(<start step>, <end step>, <batch>)]`` in step order. The
+          first batch may start before min_step.
+        """
+        entries = self.redis_conn.xrange(self.key, min=f'{max(1, min_step)}-0', count=count)
+        return [(int(fields[b'start']), int(fields[b'end']), fields[b'batch'])
+                for _, fields in entries]
+
+    def get_steps(self, min_step=1, max_batches=10):
+        """Return the records of available steps from min_step on, merged
+
+        Returns:
+          dict, the merged records, with ``n_steps`` and ``next_step``, the
+          step to read from next time
+        """
+        batches = self.read(min_step, count=max_batches)
+        if not batches:
+            return dict(n_steps=0, next_step=min_step)
+        merger = BatchMerger()
+        for start_step, end_step, batch in batches:
+            merger.add(decode_batch(batch, as_arrays=True), skip=max(0, min_step - start_step))
+        first_step = max(min_step, batches[0][0])
+        end_step = batches[-1][1]
+        return {**merger.merged(), 'n_steps': end_step - first_step + 1,
+                'next_step': end_step + 1}
+
+    def delete(self):
+        self.redis_conn.delete(self.key)
+
+
+class RecordListener():
+    """Block until a game adds records or a socket is stopped
+
+    Subscribe before reading the available records, so that records added
+    in between still wake up the next ``wait``.
+
+    ====================== ============== ===============
+          Attribute        Type               Description
+    ====================== ============== ===============
+    ``pubsub``             redis.PubSub   Subscription to both channels
+    ``records_channel``    str            ``records_ready:<game_id>``
+    ``stop_channel``       str            ``stop_task:<sid>``
+    ====================== ============== ===============
+    """
+
+    def __init__(self, redis_conn, game_id, sid):
+        self.records_channel = records_channel(game_id)
+        self.stop_channel = stop_channel(sid)
+        self.pubsub = redis_conn.pubsub(ignore_subscribe_messages=True)
+        self.pubsub.subscribe(self.records_channel, self.stop_channel)
+
+    def wait(self, timeout):
+        """Return 'records', 'stop', or None if nothing happened within timeout
+
+        Notifications which arrived together are handled at once, so
+        several batches added since the last call only wake it up once.
+        """
+        deadline = time.monotonic() + timeout
+        event = None
+        while event is None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            event = self._read(remaining)
+        while event != 'stop':
+            pending = self._read(0)
+            if pending is None:
+                break
+            event = pending
+        return event
+
+    def _read(self, timeout):
+        message = self.pubsub.get_message(timeout=timeout)
+        if message is None:
+            return None
+        channel = message['channel']
+        if isinstance(channel, bytes):
+            channel = channel.decode('utf-8')
+        return 'stop' if channel == self.stop_channel else 'records'
+
+    def close(self):
+        self.pubsub.close()
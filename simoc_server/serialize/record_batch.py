@@ -0,0 +1,302 @@
+r"""Binary format for batches of step records sent from workers to the server.
+
+The Celery ``new_game`` task adds batches of records to Redis as it runs,
+and ``views.retrieve_steps`` reads them back. Records
+are nested dicts; each numeric list (e.g. a flow or storage series) whose
+values all have the same type (bool, int or float) is packed into a column
+of the payload, and everything else (the structure, strings, static values
+and lists of mixed types) is kept in a JSON header, so decoded records are
+the same as a JSON round trip:
+
+====================== ===============
+        Bytes             Description
+====================== ===============
+4                      ``MAGIC``
+1                      Format version
+1                      Flags: ``FLAG_ZLIB`` if the payload is compressed
+4                      Header length, little-endian uint32
+header length          Header, utf-8 JSON
+remainder              Payload: packed columns, optionally zlib-compressed
+====================== ===============
+
+The header is ``{'skeleton': <records with columns replaced by None>,
+'columns': [{'path': [<key>, ...], 'dtype': '<f8', 'offset': int,
+'length': int, 'encoding': str, 'runs': int}]}``, where offsets are in
+bytes from the start of the (decompressed) payload. Many series are
+constant or piecewise constant for long stretches (zero flows, capacities,
+deprive counters), so each column is stored with the smallest of:
+
+====================== ===============
+       Encoding           Payload
+====================== ===============
+``raw``                ``length`` values
+``rle``                ``runs`` values, then ``runs`` run lengths as uint32
+``delta``              ``rle`` of the differences between values (integers only)
+====================== ===============
+
+Runs are found by comparing bits, so every encoding is exact. Version 1
+batches have no ``encoding``; all their columns are ``raw``.
+
+Batches which don't start with ``MAGIC`` are decoded as JSON, so batches
+written by older workers can still be read. ``BatchMerger`` joins decoded
+batches into the records of all their steps.
+"""
+
+import json
+import zlib
+import struct
+
+import numpy as np
+
+MAGIC = b'SIMB'
+FORMAT_VERSION = 2
+FLAG_ZLIB = 1
+_PREFIX = struct.Struct('<4sBBI')
+
+
+def encode_batch(records, compress=True, float32=False, run_length=True):
+    """Return records as a binary batch
+
+    Args:
+      records: dict, e.g. from ``AgentModel.get_records``
+      compress: bool, compress the payload with zlib
+      float32: bool, store floats with single precision. Halves the size of
+               float columns, but values are no longer exact.
+      run_length: bool, store columns with ``rle`` or ``delta`` encoding
+                  where that is smaller
+
+    Returns:
+      bytes
+    """
+    columns = []
+    arrays = []
+
+    def _pack(value, path):
+        if isinstance(value, dict):
+            # Keys are strings in the JSON skeleton, so they are in paths too
+            return {k: _pack(v, path + [str(k)]) for k, v in value.items()}
+        if isinstance(value, np.ndarray):
+            array = value
+            value = value.tolist()
+        elif isinstance(value, list) and value:
+            # NumPy would convert e.g. [1, 2.5] to floats
+            types = set(map(type, value))
+            if len(types) != 1 or types.pop() not in (bool, int, float):
+                return value
+            array = np.asarray(value)
+        else:
+            return value
+        if array.ndim != 1 or array.dtype.kind not in 'biuf' or not len(array):
+            return value
+        if array.dtype.kind == 'f':
+            array = array.astype('<f4' if float32 else '<f8', copy=False)
+        elif array.dtype.kind in 'iu':
+            array = array.astype('<i8', copy=False)
+        columns.append(dict(path=path, dtype=array.dtype.str, length=len(array),
+                            encoding='raw'))
+        arrays.append(array)
+        return None
+
+    skeleton = _pack(records, [])
+    if run_length:
+        chunks = _encode_columns(columns, arrays)
+    else:
+        chunks = [array.tobytes() for array in arrays]
+    offset = 0
+    for column, data in zip(columns, chunks):
+        column['offset'] = offset
+        offset += len(data)
+    header = json.dumps(dict(skeleton=skeleton, columns=columns)).encode('utf-8')
+    payload = b''.join(chunks)
+    flags = 0
+    if compress:
+        payload = zlib.compress(payload, 1)
+        flags |= FLAG_ZLIB
+    return _PREFIX.pack(MAGIC, FORMAT_VERSION, flags, len(header)) + header + payload
+
+
+def decode_batch(batch, as_arrays=False):
+    """Return the records of a binary or JSON batch
+
+    Args:
+      batch: bytes or str, from encode_batch or json.dumps
+      as_arrays: bool, return columns as read-only NumPy arrays. ``raw``
+                 columns are views of the batch if it isn't compressed.
+                 By default they are converted to lists.
+
+    Returns:
+      dict
+    """
+    if isinstance(batch, str):
+        return json.loads(batch)
+    if not batch.startswith(MAGIC):
+        return json.loads(batch.decode('utf-8'))
+    _, version, flags, header_length = _PREFIX.unpack_from(batch)
+    if version > FORMAT_VERSION:
+        raise ValueError(f'Unsupported record batch version: {version}')
+    start = _PREFIX.size
+    header = json.loads(batch[start:start + header_length].decode('utf-8'))
+    payload = memoryview(batch)[start + header_length:]
+    if flags & FLAG_ZLIB:
+        payload = zlib.decompress(payload)
+    records = header['skeleton']
+    for column in header['columns']:
+        value = _decode_column(payload, column)
+        if not as_arrays:
+            value = value.tolist()
+        *keys, last = column['path']
+        parent = records
+        for key in keys:
+            parent = parent[key]
+        parent[last] = value
+    return records
+
+
+def _encode_columns(columns, arrays):
+    """Return the data of each column in its smallest encoding
+
+    Columns with the same dtype and length are encoded together, as the
+    columns of a 2-D array, and ``encoding`` and ``runs`` are added to the
+    ones which aren't stored ``raw``.
+    """
+    chunks = [None] * len(arrays)
+    groups = {}
+    for i, array in enumerate(arrays):
+        groups.setdefault((array.dtype.str, len(array)), []).append(i)
+    for (dtype, length), indices in groups.items():
+        table = np.stack([arrays[i] for i in indices], axis=1)
+        itemsize = table.dtype.itemsize
+        candidates = [('rle', table)]
+        if table.dtype.kind == 'i':
+            candidates.append(('delta', np.diff(table, axis=0, prepend=0)))
+        best_size = np.full(len(indices), length * itemsize)
+        best = np.full(len(indices), -1)
+        runs = []
+        for c, (_, values) in enumerate(candidates):
+            # Runs are found by comparing bits, so -0.0 and NaNs are kept
+            bits = values.view(f'<u{itemsize}')
+            changes = bits[1:] != bits[:-1]
+            n_runs = changes.sum(axis=0) + 1
+            size = n_runs * (itemsize + 4)
+            better = size < best_size
+            best_size[better] = size[better]
+            best[better] = c
+            runs.append((changes, n_runs))
+        for j in np.flatnonzero(best == -1).tolist():
+            chunks[indices[j]] = arrays[indices[j]].tobytes()
+        for c, (encoding, values) in enumerate(candidates):
+            selected = np.flatnonzero(best == c)
+            if not len(selected):
+                continue
+            changes, n_runs = runs[c]
+            # Start of each run, as an index of the selected columns laid end to end
+            is_start = np.ones((len(selected), length), dtype=bool)
+            is_start[:, 1:] = changes[:, selected].T
+            starts = np.flatnonzero(is_start)
+            run_values = values[:, selected].T.ravel()[starts]
+            run_lengths = np.diff(starts, append=is_start.size).astype('<u4')
+            ends = np.cumsum(n_runs[selected]).tolist()
+            start = 0
+            for j, end in zip(selected.tolist(), ends):
+                column = columns[indices[j]]
+                column.update(encoding=encoding, runs=end - start)
+                chunks[indices[j]] = (run_values[start:end].tobytes()
+                                      + run_lengths[start:end].tobytes())
+                start = end
+    return chunks
+
+
+def _decode_column(payload, column):
+    """Return the values of a column as a read-only array"""
+    dtype, offset = np.dtype(column['dtype']), column['offset']
+    encoding = column.get('encoding', 'raw')
+    if encoding == 'raw':
+        return np.frombuffer(payload, dtype=dtype, count=column['length'], offset=offset)
+    runs = column['runs']
+    values = np.frombuffer(payload, dtype=dtype, count=runs, offset=offset)
+    lengths = np.frombuffer(payload, dtype='<u4', count=runs,
+                            offset=offset + runs * dtype.itemsize)
+    array = np.repeat(values, lengths)
+    if encoding == 'delta':
+        array = np.cumsum(array, dtype=dtype)
+    elif encoding != 'rle':
+        raise ValueError(f'Unknown column encoding: {encoding}')
+    array.setflags(write=False)
+    return array
+
+
+class BatchMerger():
+    """Merge decoded batches of records, one batch at a time
+
+    The first batch is walked once to find its leaves. Each later batch only
+    adds a chunk to each leaf, and can be discarded after ``add``, so chunks
+    are joined once in ``merged`` rather than re-copied for every batch.
+    Series (lists and arrays with a value per step) are concatenated; for
+    other values, including everything under a ``static`` key, the last
+    non-empty value is kept.
+
+    ====================== ============== ===============
+          Attribute        Type               Description
+    ====================== ============== ===============
+    ``records``            dict           The first batch, which becomes the merged records
+    ``leaves``             list           ``[(<path>, <is series>, [<chunk of each batch>])]``
+    ``n_batches``          int            Number of batches added
+    ====================== ============== ===============
+    """
+
+    def __init__(self):
+        self.records = None
+        self.leaves = []
+        self.n_batches = 0
+
+    def add(self, records, skip=0):
+        """Add the next batch, e.g. from decode_batch
+
+        Args:
+          records: dict, a decoded batch
+          skip: int, number of steps to drop from the start of its series
+        """
+        if self.records is None:
+            self.records = records
+            def _find_leaves(value, path):
+                if isinstance(value, dict):
+                    for k, v in value.items():
+                        _find_leaves(v, path + (k,))
+                else:
+                    self.leaves.append((path, 'static' not in path, []))
+            _find_leaves(records, ())
+        for path, series, chunks in self.leaves:
+            value = records
+            for key in path:
+                value = value[key]
+            if series and skip and isinstance(value, (list, np.ndarray)):
+                value = value[skip:]
+            chunks.append(value)
+        self.n_batches += 1
+
+    def merged(self):
+        """Return the records of all added batches, with lists for series"""
+        if self.records is None:
+            return {}
+        for path, series, chunks in self.leaves:
+            *keys, last = path
+            parent = self.records
+            for key in keys:
+                parent = parent[key]
+            parent[last] = _join(chunks, series)
+            chunks[:] = [parent[last]]
+        return self.records
+
+
+def _join(chunks, series):
+    """Return the merged value of a leaf from its chunks"""
+    if series and isinstance(chunks[0], (list, np.ndarray)):
+        chunks = [c for c in chunks if len(c)]
+        if chunks and all(isinstance(c, np.ndarray) for c in chunks):
+            return np.concatenate(chunks).tolist()
+        return [v for c in chunks for v in (c.tolist() if isinstance(c, np.ndarray) else c)]
+    values = [c.tolist() if isinstance(c, np.ndarray) else c for c in chunks]
+    for value in reversed(values):
+        if value:
+            return value
+    return values[0]
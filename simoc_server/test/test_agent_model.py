@@ -8,6 +8,7 @@ import pytest
 
 from simoc_server.front_end_routes import convert_configuration
 from agent_model import AgentModel
+from agent_model.exceptions import AgentModelInitializationError
 
 class AgentModelInstance():
     """An individual instance of an Agent Model
@@ -112,3 +113,140 @@ def test_model_four_humans_garden(four_humans_garden, agent_class_dict, agent_de
     # records = model.all_records()
     # with open('four_humans_garden_records.json', 'w') as f:
     #     json.dump(records, f)
+
+
+def test_model_strict_units():
+    with open('data_files/config_1hrad.json') as f:
+        config = json.load(f)
+    config['seed'] = 12345
+    # Strict units always use snapshot storage ratios
+    config['snapshot_ratios'] = True
+    model = AgentModel.from_config(copy.deepcopy(config))
+    strict_model = AgentModel.from_config(copy.deepcopy(config), strict_units=True)
+    model.step_to(n_steps=30)
+    strict_model.step_to(n_steps=30)
+    assert model.get_data(debug=True) == strict_model.get_data(debug=True)
+    assert model.storage_ratios == strict_model.storage_ratios
+
+
+def test_model_profile():
+    with open('data_files/config_1hg_sam.json') as f:
+        config = json.load(f)
+    config['seed'] = 12345
+    model = AgentModel.from_config(copy.deepcopy(config))
+    profiled_model = AgentModel.from_config(copy.deepcopy(config), profile=True)
+    assert model.get_profile() is None
+    model.step_to(n_steps=10)
+    profiled_model.step_to(n_steps=10)
+    # Profiling doesn't change results
+    assert model.get_data(debug=True) == profiled_model.get_data(debug=True)
+
+    profile = profiled_model.get_profile()
+    assert profile['n_steps'] == 10
+    phases = profile['phases']
+    for phase in ['step', 'termination', 'storage_ratios', 'data_collection',
+                  'class:inhabitants', 'agent:human_agent',
+                  'custom:atmosphere_equalizer']:
+        assert phase in phases
+    assert next(iter(phases)) == 'step'
+    assert phases['step']['total'] == profile['total']
+    assert phases['agent:human_agent']['total'] <= phases['class:inhabitants']['total']
+    assert phases['step']['p50'] <= phases['step']['max']
+
+
+def test_model_fork():
+    with open('data_files/config_1hg_sam.json') as f:
+        config = json.load(f)
+    config['seed'] = 12345
+    config['global_entropy'] = 1
+    model = AgentModel.from_config(copy.deepcopy(config))
+    model.step_to(n_steps=10)
+    fork = model.fork()
+    # Forks step independently, and the same as the model
+    model.step_to(n_steps=10)
+    assert fork.step_num == 10
+    fork.step_to(n_steps=10)
+    assert model.get_data(debug=True) == fork.get_data(debug=True)
+    human, fork_human = (m.get_agents_by_type('human_agent')[0] for m in [model, fork])
+    assert human is not fork_human
+    assert human.step_values is fork_human.step_values
+
+    light_fork = model.fork(data_collection=False)
+    assert not light_fork.data_collection
+    light_fork.step_to(n_steps=5)
+    assert light_fork.step_num == 25
+    assert model.step_num == 20
+
+    profiled_model = AgentModel.from_config(copy.deepcopy(config), profile=True)
+    with pytest.raises(AgentModelInitializationError):
+        profiled_model.fork()
+
+
+def test_model_checkpoint(tmp_path):
+    with open('data_files/config_1hg_sam.json') as f:
+        config = json.load(f)
+    config['seed'] = 12345
+    config['global_entropy'] = 1
+    model = AgentModel.from_config(copy.deepcopy(config))
+    model.step_to(n_steps=10)
+    saved = AgentModel.load(model.save(), data_collection=True)
+    path = tmp_path / 'model.simc'
+    checkpoint = model.save_checkpoint(path)
+    assert path.read_bytes() == checkpoint
+    # Checkpoints continue exactly as saves do
+    for loaded in [AgentModel.load_checkpoint(checkpoint, data_collection=True),
+                   AgentModel.load_checkpoint(path, data_collection=True, mmap_file=True)]:
+        assert loaded.step_num == 10
+        assert loaded.start_time == model.start_time
+        saved_copy = copy.deepcopy(saved)
+        saved_copy.step_to(n_steps=10)
+        loaded.step_to(n_steps=10)
+        assert saved_copy.get_data(debug=True) == loaded.get_data(debug=True)
+
+
+def test_model_agent_indexes():
+    with open('data_files/config_1hg_sam.json') as f:
+        config = json.load(f)
+    config['seed'] = 12345
+    model = AgentModel.from_config(copy.deepcopy(config))
+    agents = model.scheduler.agents
+    # Indexed lookups return the same agents, in the same order, as scans
+    for agent_type in {a.agent_type for a in agents}:
+        assert model.get_agents_by_type(agent_type) == [a for a in agents
+                                                        if a.agent_type == agent_type]
+    assert model.get_agents_by_class('plants') == [a for a in agents
+                                                   if a.agent_class == 'plants']
+    assert model.get_agents_by_role('storage') == [a for a in agents if a.has_storage]
+    assert model.get_agents_by_role('flows') == [a for a in agents if a.has_flows]
+    assert model.get_agents_by_type('unknown') == []
+    storage = model.get_agents_by_role('storage')[0]
+    assert model.agent_by_id(storage.id) is storage
+    rice = model.get_agents_by_type('rice')[0]
+    assert rice.light_agent is model.get_agents_by_type(rice.connections['in']['par'][0])[0]
+
+    model.remove(rice)
+    assert model.get_agents_by_type('rice') == []
+    assert rice not in model.get_agents_by_class('plants')
+    assert rice not in model.get_agents_by_role('flows')
+
+
+def test_model_co2_response_cache():
+    with open('data_files/config_b2_mission2.json') as f:
+        config = json.load(f)
+    config['seed'] = 12345
+    model = AgentModel.from_config(copy.deepcopy(config))
+    model.step_to(n_steps=2)
+    # One response per atmosphere and carbon fixation type, shared by plants
+    assert set(model.step_cache) == {('co2_response', 'greenhouse_b2', 'c3'),
+                                     ('co2_response', 'greenhouse_b2', 'c4')}
+    for plant in model.get_agents_by_class('plants'):
+        key = ('co2_response', 'greenhouse_b2', plant.attrs['char_carbon_fixation'])
+        assert (plant.cu_factor, plant.te_factor) == model.step_cache[key]
+    assert model.step_cache[('co2_response', 'greenhouse_b2', 'c4')][0] == 1
+    # The cache isn't a storage, and isn't saved
+    assert 'co2' not in model.storage_ratios
+    assert 'co2' not in model.save()['model_data']['storage_ratios']
+    # A new step calculates new responses
+    cached = model.step_cache[('co2_response', 'greenhouse_b2', 'c3')]
+    model.step()
+    assert model.step_cache[('co2_response', 'greenhouse_b2', 'c3')] is not cached
@@ -0,0 +1,38 @@
+from celery_worker import batching
+from celery_worker.batching import BatchSizer
+
+
+def _run_batch(sizer, n_bytes_per_step=None, max_steps=10_000):
+    sizer.start_batch()
+    for _ in range(max_steps):
+        if sizer.step_done():
+            break
+    n_steps = sizer.n_steps
+    if n_bytes_per_step is not None:
+        sizer.end_batch(n_steps * n_bytes_per_step)
+    return n_steps
+
+def test_batch_sizer_steps_and_bytes():
+    sizer = BatchSizer(max_steps=100, max_seconds=60, first_seconds=60, max_bytes=10_000)
+    # Nothing known about the size of steps yet
+    assert _run_batch(sizer, n_bytes_per_step=500) == 100
+    assert sizer.bytes_per_step == 500
+    # Limited by the estimated size
+    assert _run_batch(sizer, n_bytes_per_step=500) == 20
+    assert _run_batch(sizer, n_bytes_per_step=50) == 20
+    assert _run_batch(sizer, n_bytes_per_step=50) == 100
+    # At least one step per batch
+    assert _run_batch(sizer, n_bytes_per_step=1e6) == 100
+    assert _run_batch(sizer) == 1
+    assert sizer.n_batches == 5
+
+def test_batch_sizer_time(monkeypatch):
+    now = [0.0]
+    def perf_counter():
+        now[0] += 1 / 64  # Each step takes ~16 ms
+        return now[0]
+    monkeypatch.setattr(batching.time, 'perf_counter', perf_counter)
+    sizer = BatchSizer(max_steps=1000, max_seconds=1.0, first_seconds=0.125, max_bytes=1e9)
+    # The first batch is ended early
+    assert _run_batch(sizer, n_bytes_per_step=1) == 8
+    assert _run_batch(sizer, n_bytes_per_step=1) == 64
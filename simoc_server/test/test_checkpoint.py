@@ -0,0 +1,53 @@
+import datetime
+
+import numpy as np
+import pytest
+
+from agent_model.checkpoint import dump_checkpoint, load_checkpoint
+
+
+def _data():
+    return dict(
+        model_data=dict(start_time=datetime.datetime(1991, 1, 1, 6),
+                        random_state=('MT19937', np.arange(624, dtype=np.uint64), 624, 0, 0.0),
+                        steps=np.int64(10), storage_ratios={}),
+        agent_data={'rice': dict(instance=dict(
+            step_values={'co2': np.linspace(0, 1, 11), 'empty': np.zeros(0),
+                         'big_endian': np.arange(3, dtype='>f4')},
+            members=dict(alive=[True, False])))},
+        init_type='from_model')
+
+
+def test_checkpoint_round_trip():
+    checkpoint = dump_checkpoint(_data())
+    data = load_checkpoint(checkpoint)
+    model_data = data['model_data']
+    assert model_data['start_time'] == datetime.datetime(1991, 1, 1, 6)
+    assert model_data['steps'] == 10
+    # Tuples are stored as lists, as in JSON
+    assert model_data['random_state'][0] == 'MT19937'
+    assert model_data['random_state'][1].dtype == np.uint64
+    assert np.array_equal(model_data['random_state'][1], np.arange(624))
+    step_values = data['agent_data']['rice']['instance']['step_values']
+    assert np.array_equal(step_values['co2'], np.linspace(0, 1, 11))
+    assert step_values['empty'].shape == (0,)
+    assert np.array_equal(step_values['big_endian'], [0, 1, 2])
+    assert not step_values['co2'].flags.writeable
+    assert data['agent_data']['rice']['instance']['members'] == dict(alive=[True, False])
+    assert data['init_type'] == 'from_model'
+
+
+def test_checkpoint_file(tmp_path):
+    path = tmp_path / 'model.simc'
+    path.write_bytes(dump_checkpoint(_data()))
+    for mmap_file in [False, True]:
+        data = load_checkpoint(path, mmap_file=mmap_file)
+        step_values = data['agent_data']['rice']['instance']['step_values']
+        assert np.array_equal(step_values['co2'], np.linspace(0, 1, 11))
+
+
+def test_checkpoint_errors():
+    with pytest.raises(TypeError):
+        dump_checkpoint(dict(value=object()))
+    with pytest.raises(ValueError):
+        load_checkpoint(b'{"model_data": {}}' + bytes(16))
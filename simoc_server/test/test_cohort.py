@@ -0,0 +1,137 @@
+import copy
+import json
+
+import numpy as np
+import pytest
+
+from agent_model import AgentModel
+from agent_model.agents import GeneralCohort, PlantCohort
+from agent_model.initializer import AgentModelInitializer
+
+@pytest.fixture()
+def four_humans_garden_config():
+    with open('data_files/config_4hg.json') as f:
+        config = json.load(f)
+    config['seed'] = 12345
+    return config
+
+def test_cohort_no_variation(four_humans_garden_config):
+    # Without variation, and while every exchange is met, a cohort behaves
+    # like a single agent of that amount
+    config = four_humans_garden_config
+    single = AgentModel.from_config(copy.deepcopy(config))
+    config['single_agent'] = 0
+    cohorts = AgentModel.from_config(copy.deepcopy(config))
+    assert len(cohorts.scheduler.agents) == len(single.scheduler.agents)
+    humans = cohorts.get_agents_by_type('human_agent')[0]
+    assert isinstance(humans, GeneralCohort)
+    assert humans.member_alive.tolist() == [True] * 4
+    assert isinstance(cohorts.get_agents_by_type('wheat')[0], PlantCohort)
+    single.step_to(n_steps=50)
+    cohorts.step_to(n_steps=50)
+    assert single.get_data(debug=True) == cohorts.get_data(debug=True)
+
+def test_cohort_variation(four_humans_garden_config):
+    config = four_humans_garden_config
+    config['single_agent'] = 0
+    config['global_entropy'] = 1
+    model = AgentModel.from_config(config)
+    humans = model.get_agents_by_type('human_agent')[0]
+    assert len(humans.initial_variable) == 4
+    assert humans.member_attr_factors['in_o2'].shape == (4,)
+    assert humans.step_variable == 1
+    model.step()
+    # Each member has its own step variable, applied to the target value
+    assert len(set(humans.member_step_variable.tolist())) == 4
+    flow = next(f for f in humans.flow_plan if f['attr'] == 'in_o2')
+    weights = humans.member_step_variable * humans.member_attr_factors['in_o2']
+    assert humans._scale_target(flow, 1.0) == pytest.approx(weights.sum())
+
+def test_cohort_deprive(four_humans_garden_config):
+    config = four_humans_garden_config
+    config['single_agent'] = 0
+    model = AgentModel.from_config(config)
+    model.step()
+    humans = model.get_agents_by_type('human_agent')[0]
+    flow = next(f for f in humans.flow_plan if f['attr'] == 'in_potable')
+    step_mag = 0.1
+    deprive_value = flow['deprive_value']
+    # Enough for two members: the others lose one step of deprive
+    actual = humans._deprive(flow, 0.25, step_mag)
+    assert actual == pytest.approx(0.2)
+    deprive = humans.member_deprive['in_potable']
+    assert sorted(deprive.tolist()) == [deprive_value - flow['delta_per_step']] * 2 + [deprive_value] * 2
+    assert humans.deprive['in_potable'] == pytest.approx(deprive.sum())
+    # Deprived members die when they run out, and are no longer exchanged for
+    deprive[:] = 0
+    humans._deprive(flow, 0.25, step_mag)
+    assert humans.amount == 2
+    assert np.count_nonzero(humans.member_alive) == 2
+    assert humans.deprive['in_potable'] == 2 * deprive_value
+    assert humans._scale_target(flow, step_mag) == pytest.approx(0.2)
+
+def test_cohort_deprive_order(four_humans_garden_config):
+    config = four_humans_garden_config
+    config['single_agent'] = 0
+    model = AgentModel.from_config(config)
+    humans = model.get_agents_by_type('human_agent')[0]
+    flow = next(f for f in humans.flow_plan if f['attr'] == 'in_potable')
+    deprive_value = flow['deprive_value']
+    delta = flow['delta_per_step']
+    deprive = humans.member_deprive['in_potable']
+    deprive[:] = [deprive_value, delta, delta / 2, 0]
+    # Members are satisfied in the order of a permutation drawn from the model
+    order = copy.deepcopy(model.random_state).permutation(4)
+    actual = humans._deprive(flow, 0.25, 0.1)
+    assert actual == pytest.approx(0.2)
+    satisfied, deprived = order[:2], order[2:]
+    expected = np.array([deprive_value, delta, delta / 2, 0])
+    # Satisfied members' deprive is reset to full, not added to
+    expected[satisfied] = deprive_value
+    dying = deprived[expected[deprived] < delta]
+    expected[deprived[expected[deprived] >= delta]] -= delta
+    assert deprive[humans.member_alive].tolist() == expected[humans.member_alive].tolist()
+    assert np.flatnonzero(~humans.member_alive).tolist() == sorted(dying.tolist())
+    assert humans.amount == 4 - len(dying)
+
+def test_cohort_deficit(four_humans_garden_config):
+    # With potable water for 2.5 humans each step, a single agent spends its
+    # pooled deprive and loses two humans, while a cohort satisfies different
+    # members each step, resetting their deprive, so none die.
+    amounts = {}
+    for single_agent in [1, 0]:
+        config = copy.deepcopy(four_humans_garden_config)
+        config['single_agent'] = single_agent
+        model = AgentModel.from_config(config)
+        humans = model.get_agents_by_type('human_agent')[0]
+        water = model.get_agents_by_type('water_storage')[0]
+        potable = humans.step_values['in_potable'][0]
+        amounts[single_agent] = []
+        for _ in range(200):
+            model.storage_table.set_balance(water.storage_row, water.storage_slots['potable'],
+                                            2.5 * potable)
+            model.step()
+            amounts[single_agent].append(humans.amount)
+    assert amounts[1] == [4] * 144 + [2] * 56
+    assert amounts[0] == [4] * 200
+    flow = next(f for f in humans.flow_plan if f['attr'] == 'in_potable')
+    deprive = humans.member_deprive['in_potable']
+    assert np.count_nonzero(deprive == flow['deprive_value']) >= 2
+    assert humans.deprive['in_potable'] == deprive.sum()
+
+def test_cohort_save_load(four_humans_garden_config):
+    config = four_humans_garden_config
+    config['single_agent'] = 0
+    config['global_entropy'] = 1
+    model = AgentModel.from_config(config)
+    model.step_to(n_steps=5)
+    humans = model.get_agents_by_type('human_agent')[0]
+    humans.kill(1, 'test')
+    saved = AgentModelInitializer.from_model(model)
+    loaded = AgentModel(saved)
+    loaded_humans = loaded.get_agents_by_type('human_agent')[0]
+    assert loaded_humans.amount == 3
+    assert loaded_humans.member_alive.tolist() == [True, True, True, False]
+    for attr, factors in humans.member_attr_factors.items():
+        assert loaded_humans.member_attr_factors[attr].tolist() == factors.tolist()
+    loaded.step_to(n_steps=5)
@@ -0,0 +1,87 @@
+import copy
+import json
+
+import numpy as np
+
+from agent_model import AgentModel
+
+
+def _model(config_name='config_1hg_sam', **kwargs):
+    with open(f'data_files/{config_name}.json') as f:
+        config = json.load(f)
+    config['seed'] = 12345
+    config.update(kwargs)
+    return AgentModel.from_config(copy.deepcopy(config), data_collection=True)
+
+def test_data_collector_columns():
+    model = _model()
+    # More steps than the initial capacity of the table
+    n_steps = model.get_agents_by_type('human_agent')[0].data_collector.INITIAL_CAPACITY + 10
+    model.step_to(n_steps=n_steps)
+    human = model.get_agents_by_type('human_agent')[0]
+    collector = human.data_collector
+    assert collector.n_steps == n_steps
+    data = collector.get_data()
+    assert data['name'] == 'human_agent'
+    assert len(data['age']) == n_steps
+    assert data['age'][-1] == human.age
+    assert all(isinstance(v, int) for v in data['amount'])
+    o2_flow = data['flows']['in']['o2']['crew_habitat_sam']
+    assert len(o2_flow) == n_steps
+    assert all(isinstance(v, float) for v in o2_flow)
+
+    # Ranges are sliced like lists
+    sliced = collector.get_data(step_range=(10, 20))
+    assert sliced['flows']['in']['o2']['crew_habitat_sam'] == o2_flow[10:20]
+
+    # Arrays are views of the table
+    arrays = collector.get_data(as_arrays=True)
+    o2_array = arrays['flows']['in']['o2']['crew_habitat_sam']
+    assert isinstance(o2_array, np.ndarray)
+    assert np.shares_memory(o2_array, collector.table)
+    assert o2_array.tolist() == o2_flow
+
+    # Plant growth fields keep their types
+    rice = model.get_agents_by_type('rice')[0].data_collector.get_data()
+    assert all(isinstance(v, bool) for v in rice['growth']['grown'])
+
+def test_data_collector_fractional_amount():
+    model = _model()
+    model.step_to(n_steps=3)
+    human = model.get_agents_by_type('human_agent')[0]
+    human.amount = 0.5
+    model.step_to(n_steps=2)
+    # Integer amounts which become fractional aren't truncated
+    amounts = human.data_collector.get_data()['amount']
+    assert amounts == [1, 1, 1, 0.5, 0.5]
+    human.data_collector.get_data(clear_cache=True)
+    human.amount = 1
+    model.step()
+    amounts = human.data_collector.get_data()['amount']
+    assert amounts == [1] and isinstance(amounts[0], int)
+
+def test_data_collector_clear_cache():
+    model = _model()
+    model.step_to(n_steps=20)
+    collector = model.get_agents_by_type('human_agent')[0].data_collector
+    arrays = collector.get_data(as_arrays=True, clear_cache=True)
+    ages = arrays['age'].tolist()
+    assert collector.n_steps == 0
+    assert collector.get_data()['age'] == []
+    model.step_to(n_steps=5)
+    # Cleared arrays are copies, so later steps don't overwrite them
+    assert arrays['age'].tolist() == ages
+    assert len(collector.get_data()['age']) == 5
+
+def test_data_collector_events():
+    model = _model(global_entropy=1)
+    solar = model.get_agents_by_type('solar_pv_array_mars')[0]
+    solar.attr_details['event_duststorm']['probability_per_step'] = 0.05
+    model.step_to(n_steps=100)
+    data = solar.data_collector.get_data()
+    multipliers = data['event_multipliers']['duststorm']
+    assert len(multipliers) == 100
+    assert '-' in multipliers
+    assert any(m != '-' for m in multipliers)
+    for instances, multiplier in zip(data['events']['duststorm'], multipliers):
+        assert (multiplier == '-') == (instances == [])
@@ -0,0 +1,81 @@
+import json
+
+import numpy as np
+import pytest
+
+from agent_model.ensemble import (run_member, run_ensemble, check_determinism, Ensemble,
+                                  StreamingPercentiles)
+
+
+@pytest.fixture(scope='module')
+def config():
+    with open('data_files/config_1h.json') as f:
+        config = json.load(f)
+    # Terminate before the last step, to check steps no member reached
+    config['termination'] = [{'condition': 'time', 'value': 20, 'unit': 'hour'}]
+    return config
+
+def test_run_member(config):
+    member = run_member(config, seed=1, n_steps=24, global_entropy=1)
+    assert member['termination_reason'] == 'time'
+    assert member['n_steps'] == 20
+    values = member['values']
+    assert values.shape == (24, len(member['names']))
+    assert not np.isnan(values[:20]).any()
+    assert np.isnan(values[20:]).all()
+    assert 'amount.human_agent' in member['names']
+    other = run_member(config, seed=2, n_steps=24, global_entropy=1)
+    assert not np.array_equal(values, other['values'], equal_nan=True)
+    # The caller's global generator isn't changed
+    np.random.seed(0)
+    expected = np.random.rand()
+    np.random.seed(0)
+    run_member(config, seed=1, n_steps=2, global_entropy=1)
+    assert np.random.rand() == expected
+
+def test_ensemble(config):
+    seeds = range(3)
+    parallel = run_ensemble(config, seeds, n_steps=24, global_entropy=1, max_workers=2)
+    serial = run_ensemble(config, seeds, n_steps=24, global_entropy=1, max_workers=0)
+    summary = parallel.summary()
+    assert json.dumps(summary) == json.dumps(serial.summary())
+    assert summary['n_members'] == 3
+    assert summary['running'] == [3] * 20 + [0] * 4
+    assert summary['termination'] == {'time': 3}
+    assert summary['alive']['human_agent'] == [3] * 20 + [0] * 4
+    human = summary['metrics']['amount.human_agent']
+    assert set(human) == {'mean', 'p5', 'p50', 'p95'}
+    assert human['mean'][0] == human['p50'][0] == 1
+    assert human['mean'][-1] is None
+    # Without percentiles, they aren't estimated
+    ensemble = Ensemble(parallel.names, 24, percentiles=())
+    ensemble.add(run_member(config, seed=0, n_steps=24))
+    assert ensemble.quantiles is None
+    assert set(ensemble.summary()['metrics']['amount.human_agent']) == {'mean'}
+    with pytest.raises(ValueError):
+        ensemble.add(dict(run_member(config, seed=0, n_steps=24), names=['other']))
+
+def test_streaming_percentiles():
+    rng = np.random.default_rng(0)
+    data = rng.normal(size=(2000, 10, 2))
+    data[::3, 0, 0] = np.nan
+    data[:, 1, 0] = np.nan
+    percentiles = (0, 5, 50, 95, 100)
+    quantiles = StreamingPercentiles((10, 2), percentiles)
+    for values in data[:4]:
+        quantiles.add(values)
+    # Exact until a cell has five values
+    exact = np.nanpercentile(data[:4], percentiles, axis=0)
+    assert np.allclose(quantiles.estimate(), exact, equal_nan=True)
+    size = quantiles.heights.nbytes + quantiles.positions.nbytes
+    for values in data[4:]:
+        quantiles.add(values)
+    assert quantiles.heights.nbytes + quantiles.positions.nbytes == size
+    estimate = quantiles.estimate()
+    assert np.isnan(estimate[:, 1, 0]).all()
+    exact = np.nanpercentile(data, percentiles, axis=0)
+    assert np.array_equal(estimate[[0, -1]], exact[[0, -1]], equal_nan=True)
+    assert np.allclose(estimate, exact, atol=0.1, equal_nan=True)
+
+def test_check_determinism(config):
+    assert check_determinism(config, seed=5, n_steps=10, global_entropy=1)
@@ -0,0 +1,97 @@
+import time
+import threading
+
+import pytest
+
+fakeredis = pytest.importorskip('fakeredis')
+
+from simoc_server.game_records import (RecordStream, RecordListener, notify_records,
+                                       stop_steps, is_stopped)
+from simoc_server.serialize.record_batch import encode_batch, decode_batch
+
+
+@pytest.fixture()
+def redis_conn():
+    return fakeredis.FakeRedis()
+
+def _batch(start_step, end_step):
+    steps = list(range(start_step, end_step + 1))
+    return {
+        'step_num': steps,
+        'agents': {'human': {'active': [1] * len(steps),
+                             'storage': {'o2': [float(s) for s in steps]},
+                             'static': {'flows': {'in': {'o2': {'connections': ['habitat']}}}}}},
+        'n_steps': len(steps),
+    }
+
+@pytest.fixture()
+def stream(redis_conn):
+    stream = RecordStream(redis_conn, game_id=1)
+    # Batches of different sizes, and a partial last batch
+    for start_step, end_step in [(1, 100), (101, 150), (151, 250), (251, 273)]:
+        batch = encode_batch(_batch(start_step, end_step))
+        stream.append(batch, start_step, end_step, expire=60)
+    return stream
+
+def test_record_stream_read(redis_conn, stream):
+    assert 0 < redis_conn.ttl(stream.key) <= 60
+    assert [b[:2] for b in stream.read()] == [(1, 100), (101, 150), (151, 250), (251, 273)]
+    # Batches which include the step, and are returned as they were added
+    batches = stream.read(150, count=2)
+    assert [b[:2] for b in batches] == [(101, 150), (151, 250)]
+    assert decode_batch(batches[0][2]) == _batch(101, 150)
+    assert stream.read(274) == []
+    # Readers don't affect each other
+    assert len(stream.read(1)) == 4
+    stream.delete()
+    assert stream.read() == []
+
+def test_record_stream_max_batches(stream):
+    stream.append(encode_batch(_batch(274, 300)), 274, 300, max_batches=3)
+    assert [b[:2] for b in stream.read()] == [(151, 250), (251, 273), (274, 300)]
+    # Readers which fell behind resume from the oldest batch kept
+    output = stream.get_steps(120)
+    assert output['step_num'] == list(range(151, 301))
+    assert output['next_step'] == 301
+
+def test_record_stream_get_steps(stream):
+    # Resume from an exact step, and continue from next_step
+    output = stream.get_steps(120, max_batches=2)
+    assert output['n_steps'] == 131
+    assert output['next_step'] == 251
+    assert output['step_num'] == list(range(120, 251))
+    assert output['agents']['human']['storage']['o2'] == [float(s) for s in range(120, 251)]
+    assert output['agents']['human']['active'] == [1] * 131
+    static = output['agents']['human']['static']
+    assert static['flows']['in']['o2']['connections'] == ['habitat']
+    output = stream.get_steps(output['next_step'])
+    assert output['step_num'] == list(range(251, 274))
+    assert output['n_steps'] == 23
+    assert stream.get_steps(274) == dict(n_steps=0, next_step=274)
+
+def test_record_listener_records(redis_conn):
+    listener = RecordListener(redis_conn, game_id=1, sid='abc')
+    # Notifications from other games are ignored
+    notify_records(redis_conn, 2, end_step=100)
+    assert listener.wait(0.1) is None
+    # Woken as soon as the worker adds a batch
+    threading.Timer(0.1, notify_records, (redis_conn, 1, 100)).start()
+    start = time.monotonic()
+    assert listener.wait(5) == 'records'
+    assert time.monotonic() - start < 1
+    # Several batches added since the last wait only wake it up once
+    for end_step in [200, 300, 400]:
+        notify_records(redis_conn, 1, end_step)
+    assert listener.wait(1) == 'records'
+    assert listener.wait(0.1) is None
+    listener.close()
+
+def test_record_listener_stop(redis_conn):
+    listener = RecordListener(redis_conn, game_id=1, sid='abc')
+    assert not is_stopped(redis_conn, 'abc')
+    notify_records(redis_conn, 1, 100)
+    stop_steps(redis_conn, 'abc', ex=60)
+    assert listener.wait(1) == 'stop'
+    assert is_stopped(redis_conn, 'abc')
+    assert not is_stopped(redis_conn, 'xyz')
+    listener.close()
@@ -0,0 +1,69 @@
+import json
+
+import numpy as np
+import pytest
+
+from agent_model import AgentModel
+from agent_model.agents.growth_cache import GrowthCache, growth_cache
+
+def test_growth_cache_get_set():
+    cache = GrowthCache()
+    key = cache.make_key('step_values', agent_value=1.0, n_steps=3)
+    assert key == cache.make_key('step_values', n_steps=3, agent_value=1.0)
+    assert key != cache.make_key('step_values', agent_value=1.0, n_steps=4)
+    assert cache.get(key) is None
+    value = cache.set(key, [1, 2, 3])
+    assert cache.get(key) is value
+    assert (cache.hits, cache.misses) == (1, 1)
+    with pytest.raises(ValueError):
+        value[0] = 0
+
+def test_growth_cache_directory(tmp_path):
+    cache = GrowthCache(tmp_path)
+    key = cache.make_key('lifetime_growth_max_value', attr_value=1.0)
+    cache.set(key, 2.5)
+    assert (tmp_path / f'{key}.npy').exists()
+    # A new process loads saved entries, memory-mapped
+    other_cache = GrowthCache(tmp_path)
+    value = other_cache.get(key)
+    assert isinstance(value, np.memmap)
+    assert float(value) == 2.5
+
+def test_growth_cache_model():
+    with open('data_files/config_1hrad.json') as f:
+        config = json.load(f)
+    config['seed'] = 12345
+    growth_cache.clear()
+    cold_model = AgentModel.from_config(json.loads(json.dumps(config)))
+    assert growth_cache.misses > 0
+    misses = growth_cache.misses
+    warm_model = AgentModel.from_config(json.loads(json.dumps(config)))
+    assert growth_cache.misses == misses
+    radish = warm_model.get_agents_by_type('radish')[0]
+    for attr, values in cold_model.get_agents_by_type('radish')[0].step_values.items():
+        assert radish.step_values[attr] is values
+    cold_model.step_to(n_steps=10)
+    warm_model.step_to(n_steps=10)
+    assert cold_model.get_data(debug=True) == warm_model.get_data(debug=True)
+
+def test_growth_cache_lru():
+    cache = GrowthCache(max_entries=2)
+    keys = [cache.make_key('step_values', agent_value=float(i)) for i in range(3)]
+    cache.set(keys[0], [0])
+    cache.set(keys[1], [1])
+    cache.get(keys[0])
+    cache.set(keys[2], [2])
+    assert list(cache.entries) == [keys[0], keys[2]]
+
+def test_growth_cache_varied_agents():
+    with open('data_files/config_1hg_sam.json') as f:
+        config = json.load(f)
+    config['global_entropy'] = 1
+    growth_cache.clear()
+    config['seed'] = 1
+    AgentModel.from_config(json.loads(json.dumps(config)))
+    n_entries = len(growth_cache.entries)
+    config['seed'] = 2
+    model = AgentModel.from_config(json.loads(json.dumps(config)))
+    assert any(agent.attrs_varied for agent in model.scheduler.agents)
+    assert len(growth_cache.entries) == n_entries
@@ -62,3 +62,47 @@ def test_get_sigmoid_curve():
 
     assert len(result) == lifetime
     assert sum(result) == approx(value * lifetime)
+
+def test_min_max_scale():
+    y = np.array([0., 1., 3., 4.])
+    assert min_max_scale(y, 2, 10).tolist() == [2., 4., 8., 10.]
+    # Constant values are scaled to min_value
+    assert min_max_scale(np.ones(3), 2, 10).tolist() == [2., 2., 2.]
+
+def test_get_daily_growth_values():
+    day_values = np.array([[1.0] * 24, [2.0] * 24, np.linspace(1, 3, 24)])
+    kwargs = dict(growth_type='sigmoid', center=12, noise=False)
+    result = get_daily_growth_values(day_values, daily_min_value=0.5, **kwargs)
+    assert result.shape == day_values.shape
+    for day, values in zip(day_values, result):
+        agent_value = day.mean()
+        expected = get_growth_values(agent_value, num_values=24,
+                                     min_value=agent_value * 0.5, **kwargs)
+        assert values.tolist() == expected.tolist()
+
+def test_no_scipy_on_import():
+    # scipy is slow to import, and only needed by the optimize_* functions
+    import subprocess, sys
+    code = "import sys, agent_model; print('scipy' in sys.modules)"
+    out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True)
+    assert out.stdout.strip() == 'False'
+
+def test_solve_bell_curve_mean():
+    # based on rice.out_biomass
+    value = 0.001259583
+    lifetime = 2040
+    kwargs = dict(mean_value=value, num_values=lifetime, center=lifetime//2,
+                  min_value=0, invert=False, noise=False)
+    result = solve_bell_curve_mean(**kwargs)
+    assert result['max_value'] == approx(0.005027526800753942, rel=1e-5)
+    y = get_bell_curve(num_values=lifetime, min_value=0, max_value=result['max_value'])
+    assert np.mean(y) == approx(value, rel=1e-12)
+
+def test_solve_sigmoid_curve_mean():
+    # based on rice.in_potb
+    value = 0.0079341666667
+    lifetime = 2040
+    result = solve_sigmoid_curve_mean(mean_value=value, num_values=lifetime,
+                                      center=lifetime//2, min_value=0, noise=False)
+    assert result['steepness'] == approx(1020)
+    assert result['max_value'] == approx(0.01587611172150995, rel=1e-5)
@@ -136,3 +136,12 @@ def test_parse_agent_conn(four_humans_garden, agent_desc, currency_dict, agent_c
                 assert currency in currency_dict
                 for conn in connected_agents:
                     assert conn in connections
+
+def test_calculate_lifetime_growth_max_value(currency_dict, agent_desc, monkeypatch):
+    # Every plant flow with a lifetime growth curve, solved and optimized
+    monkeypatch.setattr('agent_model.parse_data_files.VERIFY_GROWTH_SOLVER', True)
+    config = {'agents': {agent: {} for agent in agent_desc['plants']}}
+    for location in ['mars', 'earth']:
+        config['location'] = location
+        agents_data, agents_errors = parse_agent_desc(config, currency_dict, agent_desc, 'mars')
+        assert len(agents_errors) == 0
@@ -0,0 +1,137 @@
+import json
+
+import numpy as np
+import pytest
+
+from simoc_server.serialize.record_batch import (encode_batch, decode_batch, BatchMerger,
+                                                 MAGIC, FORMAT_VERSION, _PREFIX,
+                                                 _decode_column)
+
+
+def _records(n_steps=10):
+    return {
+        'step_num': list(range(1, n_steps + 1)),
+        'time': [f'{i}:00:00' for i in range(n_steps)],
+        'agents': {
+            'human_agent': {
+                'active': [4] * n_steps,
+                'flows': {'in': {'o2': {'crew_habitat': [0.1 * i for i in range(n_steps)]}}},
+                'grown': [i % 2 == 0 for i in range(n_steps)],
+                'cause_of_death': None,
+                'attributes': {},
+                'empty': [],
+            },
+        },
+        'static': {'human_agent': {'amount': 4, 'description': 'crew'}},
+    }
+
+def test_record_batch_round_trip():
+    records = _records()
+    batch = encode_batch(records)
+    assert batch.startswith(MAGIC)
+    decoded = decode_batch(batch)
+    # Same values and types as a JSON round trip
+    assert json.dumps(decoded) == json.dumps(records)
+    human = decoded['agents']['human_agent']
+    assert all(isinstance(v, int) for v in human['active'])
+    assert all(isinstance(v, bool) for v in human['grown'])
+    assert decoded['time'] == records['time']
+    assert decode_batch(encode_batch(records, compress=False)) == decoded
+    # Lists of mixed types are kept as they are, and keys become strings
+    mixed = {'series': [1, 2.5] * 25, 'flags': [True, 0] * 25,
+             'agents': {1: list(range(50))}}
+    decoded = decode_batch(encode_batch(mixed))
+    assert json.dumps(decoded) == json.dumps(mixed)
+    assert [type(v) for v in decoded['series'][:2]] == [int, float]
+    assert [type(v) for v in decoded['flags'][:2]] == [bool, int]
+
+def test_record_batch_as_arrays():
+    records = _records()
+    batch = encode_batch(records, compress=False)
+    decoded = decode_batch(batch, as_arrays=True)
+    flow = decoded['agents']['human_agent']['flows']['in']['o2']['crew_habitat']
+    assert isinstance(flow, np.ndarray)
+    assert flow.dtype == np.float64
+    assert not flow.flags.writeable
+    assert flow.tolist() == records['agents']['human_agent']['flows']['in']['o2']['crew_habitat']
+
+def test_record_batch_float32():
+    records = _records()
+    decoded = decode_batch(encode_batch(records, float32=True))
+    flow = decoded['agents']['human_agent']['flows']['in']['o2']['crew_habitat']
+    expected = records['agents']['human_agent']['flows']['in']['o2']['crew_habitat']
+    assert np.allclose(flow, expected, rtol=1e-6)
+    assert decoded['step_num'] == records['step_num']
+
+def _column_encodings(batch):
+    header_length = _PREFIX.unpack_from(batch)[3]
+    header = json.loads(batch[_PREFIX.size:_PREFIX.size + header_length])
+    return {'.'.join(c['path']): c['encoding'] for c in header['columns']}
+
+def test_record_batch_run_length():
+    n_steps = 200
+    records = {
+        'step_num': list(range(1, n_steps + 1)),
+        'constant': [2.5] * n_steps,
+        'piecewise': [0.0] * 50 + [-0.0] * 50 + [float('nan')] * 50 + [1e-300] * 50,
+        'deprive': [72] * 100 + list(range(71, -29, -1)),
+        'noise': np.random.default_rng(0).random(n_steps).tolist(),
+        'grown': [False] * 150 + [True] * 50,
+        'array': np.ones(n_steps),
+    }
+    batch = encode_batch(records, compress=False)
+    assert _column_encodings(batch) == {
+        'step_num': 'delta', 'constant': 'rle', 'piecewise': 'rle', 'deprive': 'delta',
+        'noise': 'raw', 'grown': 'rle', 'array': 'rle'}
+    assert len(batch) < len(encode_batch(records, compress=False, run_length=False)) / 2
+    decoded = decode_batch(batch)
+    # Exact, including -0.0 and NaN
+    expected = {**records, 'array': records['array'].tolist()}
+    assert json.dumps(decoded) == json.dumps(expected)
+    assert all(isinstance(v, int) for v in decoded['deprive'])
+    assert all(isinstance(v, bool) for v in decoded['grown'])
+    arrays = decode_batch(batch, as_arrays=True)
+    assert not arrays['constant'].flags.writeable
+    assert arrays['step_num'].dtype == np.int64
+
+def test_record_batch_raw_column():
+    # Version 1 columns have no encoding
+    payload = np.arange(5, dtype='<f8').tobytes()
+    column = dict(path=['a'], dtype='<f8', offset=8, length=4)
+    assert _decode_column(payload, column).tolist() == [1.0, 2.0, 3.0, 4.0]
+
+def test_record_batch_json_fallback():
+    records = _records()
+    assert decode_batch(json.dumps(records)) == decode_batch(encode_batch(records))
+    assert decode_batch(json.dumps(records).encode('utf-8')) == json.loads(json.dumps(records))
+
+def test_record_batch_version():
+    batch = bytearray(encode_batch(_records()))
+    _PREFIX.pack_into(batch, 0, MAGIC, FORMAT_VERSION + 1, 0, 0)
+    with pytest.raises(ValueError):
+        decode_batch(bytes(batch))
+
+def test_batch_merger():
+    batches = [_records(3), _records(4), _records(5)]
+    batches[1]['agents']['human_agent']['cause_of_death'] = 'Starved'
+    merger = BatchMerger()
+    for i, batch in enumerate(batches):
+        # Binary batches decode to arrays, JSON batches to lists
+        if i == 2:
+            merger.add(decode_batch(json.dumps(batch)))
+        else:
+            merger.add(decode_batch(encode_batch(batch), as_arrays=True))
+    merged = merger.merged()
+    assert merger.n_batches == 3
+    human = merged['agents']['human_agent']
+    assert merged['step_num'] == [1, 2, 3, 1, 2, 3, 4, 1, 2, 3, 4, 5]
+    assert merged['time'] == sum((b['time'] for b in batches), [])
+    assert human['active'] == [4] * 12
+    assert all(isinstance(v, int) for v in human['active'])
+    assert all(isinstance(v, bool) for v in human['grown'])
+    assert len(human['flows']['in']['o2']['crew_habitat']) == 12
+    assert human['empty'] == []
+    # Other values are taken from the last batch which has one
+    assert human['cause_of_death'] == 'Starved'
+    assert merged['static'] == batches[0]['static']
+    assert BatchMerger().merged() == {}
@@ -0,0 +1,30 @@
+import json
+
+import pytest
+
+from agent_model.run import run_config, main
+
+
+def test_run_config(tmp_path):
+    result = run_config('data_files/config_1h.json', seed=1, max_steps=20,
+                        output_dir=str(tmp_path))
+    assert result['seed'] == 1
+    assert result['steps'] == 20
+    assert result['agent_steps_per_sec'] == pytest.approx(
+        result['steps_per_sec'] * result['agents'])
+    assert result['peak_rss_mb'] > 0
+    with open(result['output']) as f:
+        data = json.load(f)
+    assert data['step_num'] == 20
+
+
+def test_run_main(tmp_path, capsys):
+    report = tmp_path / 'report.json'
+    main(['data_files/config_1h.json', '--seeds', '1,2', '--steps', '10',
+          '--workers', '0', '--report', str(report)])
+    assert '2 runs, 20 steps' in capsys.readouterr().out
+    with open(report) as f:
+        report = json.load(f)
+    assert [r['seed'] for r in report['results']] == [1, 2]
+    assert report['results'][0]['output'] is None
+    assert report['totals']['steps'] == 20
@@ -0,0 +1,107 @@
+import json
+
+import numpy as np
+import pytest
+
+from agent_model import AgentModel
+from agent_model.storage_table import StorageTable
+
+@pytest.fixture()
+def storage_table():
+    table = StorageTable()
+    table.add_storage('water_storage', [
+        dict(currency='potable', currency_class='water', balance=30,
+             capacity=100, unit_factor=1),
+        dict(currency='urine', currency_class='water', balance=10,
+             capacity=100, unit_factor=1),
+    ])
+    table.add_storage('power_storage', [
+        dict(currency='kwh', currency_class='energy', balance=0,
+             capacity=1000, unit_factor=1),
+    ])
+    return table
+
+def test_storage_table_add_storage(storage_table):
+    assert storage_table.balances.shape == (2, 2)
+    assert storage_table.slots == [{'potable': 0, 'urine': 1}, {'kwh': 0}]
+    assert storage_table.class_masks['water'].tolist() == [[True, True], [False, False]]
+    assert storage_table.class_masks['energy'].tolist() == [[False, False], [True, False]]
+    names, slots = storage_table.view_index(0, 'water', ['urine', 'potable', 'treated'])
+    assert names == ['urine', 'potable']
+    assert slots.tolist() == [1, 0]
+
+def test_storage_table_update_ratios(storage_table):
+    storage_ratios = {}
+    storage_table.update_ratios(storage_ratios)
+    assert storage_ratios == {
+        'water_storage': {'potable_ratio': 0.75, 'urine_ratio': 0.25},
+        'power_storage': {'kwh_ratio': 0},
+    }
+    row_ratios = {}
+    for row in range(2):
+        storage_table.update_row_ratios(row_ratios, row)
+    assert row_ratios == storage_ratios
+
+def test_storage_table_live_ratios(storage_table):
+    storage_ratios = {}
+    storage_table.link_ratios(storage_ratios)
+    assert storage_ratios == {
+        'water_storage': {'potable_ratio': 0.75, 'urine_ratio': 0.25},
+        'power_storage': {'kwh_ratio': 0},
+    }
+    # Ratios follow balances as soon as they are set
+    storage_table.set_balance(0, 1, 30)
+    assert storage_ratios['water_storage']['urine_ratio'] == 0.5
+    storage_table.set_balances(0, np.array([0, 1]), np.array([10, 0]))
+    assert storage_table.totals.tolist() == [10, 0]
+    assert dict(storage_ratios['water_storage']) == {'potable_ratio': 1, 'urine_ratio': 0}
+    storage_table.set_balance(1, 0, 50)
+    assert storage_ratios['power_storage']['kwh_ratio'] == 1
+
+def test_storage_table_live_ratios_drift(storage_table):
+    storage_ratios = {}
+    storage_table.link_ratios(storage_ratios)
+    # Emptying a storage by small steps can leave its running total at 0
+    # while a balance is still (barely) positive
+    storage_table.set_balances(0, np.array([0, 1]), np.array([0.1, 0.2]))
+    storage_table.set_balances(0, np.array([0, 1]), np.array([0, 1e-17]))
+    storage_table.totals[0] = 0.0
+    assert storage_ratios['water_storage']['urine_ratio'] == 1
+    assert storage_ratios['water_storage']['potable_ratio'] == 0
+
+def test_storage_table_model():
+    with open('data_files/config_1hrad.json') as f:
+        config = json.load(f)
+    model = AgentModel.from_config(config)
+    model.step_to(n_steps=10)
+    # Balances are read and written through the table
+    water_storage = model.get_agents_by_type('water_storage')[0]
+    row, slot = water_storage.storage_row, water_storage.storage_slots['potable']
+    assert water_storage['potable'] == model.storage_table.balances[row, slot]
+    assert water_storage.potable == water_storage['potable']
+    flow = water_storage.increment('water', -10)
+    assert sum(flow.values()) == pytest.approx(10)
+    # Updating all rows at once gives the same ratios as updating each row
+    row_ratios = {}
+    for row in range(len(model.storage_table.storage_ids)):
+        model.storage_table.update_row_ratios(row_ratios, row)
+    all_ratios = {}
+    model.storage_table.update_ratios(all_ratios)
+    assert all_ratios == row_ratios
+    # Live ratios match ratios calculated from scratch
+    for storage_id, ratios in all_ratios.items():
+        assert model.storage_ratios[storage_id] == pytest.approx(ratios)
+
+def test_storage_table_snapshot_ratios():
+    with open('data_files/config_1hrad.json') as f:
+        config = json.load(f)
+    config['snapshot_ratios'] = True
+    model = AgentModel.from_config(config)
+    assert not model.live_ratios
+    assert all(type(r) == dict for r in model.storage_ratios.values())
+    model.step_to(n_steps=2)
+    water_storage = model.get_agents_by_type('water_storage')[0]
+    before = dict(model.storage_ratios['water_storage'])
+    water_storage.increment('water', -10)
+    # Snapshot ratios only change when the storage steps
+    assert model.storage_ratios['water_storage'] == before
@@ -0,0 +1,72 @@
+import copy
+import json
+import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from agent_model import AgentModel
+from agent_model.termination import TerminationChecker, TerminationCondition, TimeTermination
+
+
+def _model(minutes_per_step=60, time=0, steps=0):
+    return SimpleNamespace(time=datetime.timedelta(minutes=time), day_length_hours=24.6597,
+                           timedelta_per_step=datetime.timedelta(minutes=minutes_per_step),
+                           scheduler=SimpleNamespace(steps=steps))
+
+
+def _first_step(model, value, unit_seconds):
+    """The first step at which the condition is met, checking every step"""
+    time = model.time
+    step_num = model.scheduler.steps
+    while True:
+        time += model.timedelta_per_step
+        step_num += 1
+        if time.total_seconds() / unit_seconds > value:
+            return step_num
+
+
+@pytest.mark.parametrize('minutes_per_step', [1, 15, 60, 90])
+@pytest.mark.parametrize('unit', ['min', 'hour', 'day', 'year', None])
+def test_time_termination_step(minutes_per_step, unit):
+    values = [0, 0.001, 0.01] if unit == 'year' else [0, 0.5, 1, 10, 24.6597, 100]
+    for value in values:
+        for time, steps in [(0, 0), (minutes_per_step * 7, 7)]:
+            model = _model(minutes_per_step, time, steps)
+            condition = TimeTermination(model, dict(condition='time', value=value, unit=unit))
+            unit_seconds = dict(min=60, hour=3600, year=3600 * 24.6597 * 365).get(
+                unit, 3600 * 24.6597)
+            assert condition.step_num == _first_step(model, value, unit_seconds)
+
+
+def test_termination_checker():
+    model = _model()
+    checker = TerminationChecker(model, [
+        dict(condition='time', value=10, unit='hour'),
+        dict(condition='unknown', value=1),
+    ])
+    assert len(checker.conditions) == 1
+    assert checker.check(model, 10) is None
+    assert checker.check(model, 11) == 'time'
+
+
+def test_termination_condition_abstract():
+    class NoCheck(TerminationCondition):
+        reason = 'no_check'
+    with pytest.raises(TypeError):
+        NoCheck(_model(), dict(condition='no_check'))
+
+
+def test_model_termination():
+    with open('data_files/config_1h.json') as f:
+        config = json.load(f)
+    config['seed'] = 12345
+    model = AgentModel.from_config(copy.deepcopy(config), data_collection=False)
+    model.step_to(termination=True)
+    # 10 Mars days of 24.66 hours
+    assert model.step_num == 246
+    assert model.is_terminated
+    assert model.termination_reason == 'time'
+    # Steps after termination don't run
+    model.step()
+    assert model.step_num == 246
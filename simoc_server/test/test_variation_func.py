@@ -51,3 +51,10 @@ def test_exponential_negative(random_state):
         samples.append(get_variable(random_state, upper, lower, distribution))
     assert samples[0] == 0.5577015611497086
     assert mean(samples) == 0.7991712744041369
+
+def test_size(random_state):
+    state = random_state.get_state()
+    samples = get_variable(random_state, 0.2, 0.2, 'normal', size=10)
+    random_state.set_state(state)
+    assert samples.tolist() == [get_variable(random_state, 0.2, 0.2, 'normal')
+                                for i in range(10)]
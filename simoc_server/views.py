@@ -18,11 +18,12 @@ from simoc_server.database.db_model import User
 from simoc_server.exceptions import GenericError, InvalidLogin, BadRequest, BadRegistration, \
     ServerError
 from simoc_server.serialize import serialize_response
+from simoc_server.game_records import RecordStream, RecordListener, stop_steps, is_stopped
 from simoc_server.front_end_routes import convert_configuration
 from simoc_abm.util import load_data_file
 
 from celery_worker import tasks
-from celery_worker.tasks import app as celery_app, BUFFER_SIZE
+from celery_worker.tasks import app as celery_app
 
 MAX_NUMBER_OF_AGENTS = 50
 MAX_STEP_NUMBER = 365*24*2  # 2 Earth years
@@ -57,42 +58,41 @@ def get_steps_background(data, user_id, sid, timeout=2, max_retries=10, expire=3
     n_steps = int(data.get("n_steps", 1e6))
 
     # If the user has reconnected to a previous game, pick up where it left off.
-    min_step_num = int(data.get("min_step_num", 0))
-    if min_step_num > 0:
-        batch_num = min_step_num // BUFFER_SIZE
-    else:
-        batch_num = 0
-    app.logger.info(f'User {user_id} connected to game {game_id} at step {min_step_num} (batch {batch_num})')
+    next_step = max(1, int(data.get("min_step_num", 0)))
+    app.logger.info(f'User {user_id} connected to game {game_id} at step {next_step}')
 
     retries_left = max_retries
-    step_count = max(0, batch_num * BUFFER_SIZE)
-    steps_sent = False
+    step_count = next_step - 1
     start_time = time.time()
-    while not steps_sent:
-        socketio.sleep(timeout)
-        stop_task = redis_conn.get(f'stop_task:{sid}')
-        stop_task = bool(stop_task.decode("utf-8")) if stop_task else None
-        is_expired = time.time() - start_time > expire
-        if stop_task or is_expired:
-            app.logger.info("Bg task closed")
-            break
-        output = retrieve_steps(game_id, batch_num)
-        if output['n_steps'] == 0:
-            retries_left -= 1
-            app.logger.info(f'0 steps retrieved, {retries_left} retries left.')
-        else:
-            batch_num += output.pop('n_batches', 0)
-            step_count += output['n_steps']
-            socketio.emit('step_data_handler',
-                            {'data': output, 'step_count': step_count, 'max_steps': n_steps},
-                            room=sid)
-            retries_left = max_retries
-
-        if step_count >= n_steps or retries_left <= 0:
-            msg = f'{step_count}/{n_steps} steps sent by the server'
-            socketio.emit('steps_sent', {'message': msg}, room=sid)
-            steps_sent = True
-            app.logger.info(msg)            
+    # Subscribe before the first read, so batches added in between aren't missed
+    listener = RecordListener(redis_conn, game_id, sid)
+    try:
+        while True:
+            is_expired = time.time() - start_time > expire
+            if is_stopped(redis_conn, sid) or is_expired:
+                app.logger.info("Bg task closed")
+                break
+            output = retrieve_steps(game_id, next_step)
+            if output['n_steps'] > 0:
+                next_step = output.pop('next_step')
+                # Steps trimmed from the stream are skipped
+                step_count = next_step - 1
+                socketio.emit('step_data_handler',
+                                {'data': output, 'step_count': step_count, 'max_steps': n_steps},
+                                room=sid)
+                retries_left = max_retries
+            elif listener.wait(timeout) is None:
+                # Block until the worker adds a batch, rather than polling
+                retries_left -= 1
+                app.logger.info(f'0 steps retrieved, {retries_left} retries left.')
+
+            if step_count >= n_steps or retries_left <= 0:
+                msg = f'{step_count}/{n_steps} steps sent by the server'
+                socketio.emit('steps_sent', {'message': msg}, room=sid)
+                app.logger.info(msg)
+                break
+    finally:
+        listener.close()
 
 
 @socketio.on('connect')
@@ -120,7 +120,7 @@ def get_steps_handler(message):
     if redis_conn.exists(f'user_sid_mapping:{user_id}'):
         old_sid = redis_conn.get(f'user_sid_mapping:{user_id}').decode("utf-8")
         app.logger.info(f'User {user_id} reconnected, cancelling previous task')
-        redis_conn.set(f'stop_task:{old_sid}', 1, ex=60)
+        stop_steps(redis_conn, old_sid, ex=60)
     redis_conn.set(f'user_sid_mapping:{user_id}', sid, ex=3600)
     
     socketio.start_background_task(get_steps_background, data, user_id, sid)
@@ -316,29 +316,9 @@ def get_game_config(game_id):
     game_config = redis_conn.get(f'game_config:{game_id}')
     return json.loads(game_config.decode("utf-8")) if game_config else game_config
 
-def retrieve_steps(game_id, batch_num=0, max_batches=10):
-    """Return all newly available batches merged together."""
-
-    # Get latest batches from redis
-    start = batch_num
-    stop = batch_num + max_batches - 1  # redis indexing is inclusive
-    batches = redis_conn.lrange(f'records:{game_id}', start, stop)
-    if not batches:
-        return dict(n_steps=0, n_batches=0)
-    
-    # Decode, merge and return batches
-    batches = [json.loads(batch.decode("utf-8")) for batch in batches]
-    n_steps = sum([batch['n_steps'] for batch in batches])
-    n_batches = len(batches)
-    def merge_batches(b1, b2):
-        if isinstance(b1, (str, int, float)):
-            return b2 or b1
-        elif isinstance(b1, list):
-            return b1 + b2
-        elif isinstance (b1, dict):
-            return {k: merge_batches(b1[k], b2[k]) for k in b1.keys()}
-    output = functools.reduce(lambda a, b: merge_batches(a, b), batches)
-    return {**output, 'n_steps': n_steps, 'n_batches': n_batches}
+def retrieve_steps(game_id, min_step=1, max_batches=10):
+    """Return all newly available steps from min_step on, merged together."""
+    return RecordStream(redis_conn, game_id).get_steps(min_step, max_batches)
 
 
 def get_user_game_id(user):
@@ -362,7 +342,7 @@ def kill_game_by_id(game_id, sid=None):
 
     # Set a flag to stop the get_steps_background loop
     if sid is not None:
-        redis_conn.set(f'stop_task:{sid}', 1)
+        stop_steps(redis_conn, sid)
     # Revoke a Celery task of running the AgentModel
     task_id = redis_conn.get('task_mapping:{}'.format(game_id))
     task_id = task_id.decode("utf-8") if task_id else task_id
@@ -371,7 +351,7 @@ def kill_game_by_id(game_id, sid=None):
         celery_app.control.revoke(task_id, terminate=True, signal='SIGKILL')
     # Remove the configuration and records from redis
     redis_conn.delete(f'game_config:{game_id}')
-    redis_conn.delete(f'records:{game_id}')
+    RecordStream(redis_conn, game_id).delete()
 
 
 def user_cleanup(user):